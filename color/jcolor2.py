@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 
-import argparse
+import array
+import bisect
 import math
+import operator
+import os
+import sys
+from collections.abc import Iterable, Sequence
 
 ###############################################################################
 # Color models
 ###############################################################################
 
+# jcolor2_batch.py has NumPy versions of these conversions for arrays of colors.
+
 def srgb_from_linear(c: float) -> float:
     if c < 0.0031308:
         return 12.92 * c
@@ -17,21 +24,82 @@ def linear_from_srgb(c: float) -> float:
         return c / 12.92
     return ((c + 0.055) / 1.055) ** 2.4
 
+# Most colors are given as 8-bit components, e.g. by rgb() and
+# RGBColor.from_8b(), so conversions look up components that are exactly i /
+# 255.0 in tables rather than computing them. The results are identical.
+_SRGB_8B = [i / 255.0 for i in range(256)]
+_INDEX_8B = {c: i for i, c in enumerate(_SRGB_8B)}
+_LINEAR_8B = [linear_from_srgb(c) for c in _SRGB_8B]
+# The linear values at which srgb_from_linear() rounds to the next 8-bit
+# value.
+_LINEAR_8B_STEPS = [linear_from_srgb((i + 0.5) / 255.0) for i in range(255)]
+
+def srgb_8b_from_linear(c: float) -> int:
+    """Returns the 8-bit sRGB value of a linear component, clamped and rounded
+    as RGBColor.to_8b() would round srgb_from_linear(c)."""
+    return bisect.bisect_left(_LINEAR_8B_STEPS, c)
+
+# Oklab components of 8-bit colors by their sRGB components, cleared when it
+# reaches _OKLAB_8B_MEMO_SIZE entries so that converting e.g. images doesn't
+# grow it without bound.
+_oklab_8b_memo: dict[tuple[float, float, float],
+                     tuple[float, float, float]] = {}
+_OKLAB_8B_MEMO_SIZE = 1 << 16
+
+def _oklab_8b(ri: int, gi: int, bi: int) -> tuple[float, float, float]:
+    # Computes and memoizes the Oklab components of an 8-bit color.
+    rl = _LINEAR_8B[ri]
+    gl = _LINEAR_8B[gi]
+    bl = _LINEAR_8B[bi]
+    l = 0.4122214708 * rl + 0.5363325363 * gl + 0.0514459929 * bl
+    m = 0.2119034982 * rl + 0.6806995451 * gl + 0.1073969566 * bl
+    s = 0.0883024619 * rl + 0.2817188376 * gl + 0.6299787005 * bl
+    l_ = l ** (1.0 / 3.0)
+    m_ = m ** (1.0 / 3.0)
+    s_ = s ** (1.0 / 3.0)
+    lab = (0.2104542553 * l_ + 0.7936177850 * m_ - 0.0040720468 * s_,
+           1.9779984951 * l_ - 2.4285922050 * m_ + 0.4505937099 * s_,
+           0.0259040371 * l_ + 0.7827717662 * m_ - 0.8086757660 * s_)
+    if len(_oklab_8b_memo) >= _OKLAB_8B_MEMO_SIZE:
+        _oklab_8b_memo.clear()
+    _oklab_8b_memo[(_SRGB_8B[ri], _SRGB_8B[gi], _SRGB_8B[bi])] = lab
+    return lab
+
+def oklab_from_8b(r256: int, g256: int, b256: int) -> OklabColor:
+    """Returns RGBColor.from_8b(r256, g256, b256).to_oklab()."""
+    lab = _oklab_8b_memo.get((_SRGB_8B[r256], _SRGB_8B[g256], _SRGB_8B[b256]))
+    if lab is None:
+        lab = _oklab_8b(r256, g256, b256)
+    return OklabColor(*lab)
+
 class RGBColor(object):
     """Represents a color in the sRGB color space."""
+    __slots__ = ("r", "g", "b")
+
     def __init__(self, r: float, g: float, b: float):
         self.r = r
         self.g = g
         self.b = b
 
+    def __repr__(self) -> str:
+        return f"RGBColor({self.r!r}, {self.g!r}, {self.b!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, RGBColor):
+            return NotImplemented
+        return (self.r, self.g, self.b) == (other.r, other.g, other.b)
+
+    def __hash__(self) -> int:
+        return hash((self.r, self.g, self.b))
+
     @classmethod
     def from_8b(cls, r256: int, g256: int, b256: int) -> RGBColor:
         return cls(r256 / 255.0, g256 / 255.0, b256 / 255.0)
 
     def to_8b(self) -> tuple[int, int, int]:
-        cl = self.clamped()
-        b8 = lambda c: int(round(c * 255.0))
-        return (b8(cl.r), b8(cl.g), b8(cl.b))
+        return (int(round(max(0.0, min(1.0, self.r)) * 255.0)),
+                int(round(max(0.0, min(1.0, self.g)) * 255.0)),
+                int(round(max(0.0, min(1.0, self.b)) * 255.0)))
 
     @classmethod
     def from_str(cls, s: str) -> RGBColor:
@@ -40,11 +108,21 @@ class RGBColor(object):
 
     def __str__(self) -> str:
         # Skip the 0x and pad to 2 characters
-        return "#" + "".join(("00" + hex(c)[2:])[-2:]
-                             for c in self.clamped().to_8b())
+        return "#" + "".join(("00" + hex(c)[2:])[-2:] for c in self.to_8b())
 
     def to_oklab(self) -> OklabColor:
-        rl, gl, bl = (linear_from_srgb(c) for c in (self.r, self.g, self.b))
+        r, g, b = self.r, self.g, self.b
+        lab = _oklab_8b_memo.get((r, g, b))
+        if lab is not None:
+            return OklabColor(*lab)
+        ri = _INDEX_8B.get(r)
+        gi = _INDEX_8B.get(g)
+        bi = _INDEX_8B.get(b)
+        if ri is not None and gi is not None and bi is not None:
+            return OklabColor(*_oklab_8b(ri, gi, bi))
+        rl = linear_from_srgb(r)
+        gl = linear_from_srgb(g)
+        bl = linear_from_srgb(b)
         l = 0.4122214708 * rl + 0.5363325363 * gl + 0.0514459929 * bl
         m = 0.2119034982 * rl + 0.6806995451 * gl + 0.1073969566 * bl
         s = 0.0883024619 * rl + 0.2817188376 * gl + 0.6299787005 * bl
@@ -71,13 +149,19 @@ def rgb(val: int) -> RGBColor:
     """Returns an sRGB color given its 24-bit RGB value."""
     return RGBColor.from_8b((val >> 16) & 0xff, (val >> 8) & 0xff, val & 0xff)
 
+def luminance(c: RGBColor) -> float:
+    """Returns the WCAG 2 relative luminance of an sRGB color."""
+    # https://www.w3.org/WAI/GL/wiki/Relative_luminance
+    def linear(x: float) -> float:
+        i = _INDEX_8B.get(x)
+        return _LINEAR_8B[i] if i is not None else linear_from_srgb(x)
+    return 0.2126 * linear(c.r) + 0.7152 * linear(c.g) + 0.0722 * linear(c.b)
+
 def contrast(fg: RGBColor, bg: RGBColor) -> float:
-    """Returns the WCAG 2 contrast ratio between two sRGB colors."""
+    """Returns the WCAG 2 contrast ratio between two sRGB colors. To compare
+    many colors, see jcolor2_audit.ContrastMatrix, which computes each color's
+    luminance only once."""
     # https://www.w3.org/WAI/GL/wiki/Contrast_ratio
-    # https://www.w3.org/WAI/GL/wiki/Relative_luminance
-    def luminance(c: RGBColor) -> float:
-        rl, gl, bl = (linear_from_srgb(x) for x in (c.r, c.g, c.b))
-        return 0.2126 * rl + 0.7152 * gl + 0.0722 * bl
     ratio = (luminance(fg) + 0.05) / (luminance(bg) + 0.05)
     if ratio < 1:
         ratio = 1 / ratio
@@ -86,11 +170,24 @@ def contrast(fg: RGBColor, bg: RGBColor) -> float:
 class OklabColor(object):
     """Represents a color in the Oklab color space. See
     https://bottosson.github.io/posts/oklab/."""
+    __slots__ = ("L", "a", "b")
+
     def __init__(self, L: float, a: float, b: float):
         self.L = L
         self.a = a
         self.b = b
 
+    def __repr__(self) -> str:
+        return f"OklabColor({self.L!r}, {self.a!r}, {self.b!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, OklabColor):
+            return NotImplemented
+        return (self.L, self.a, self.b) == (other.L, other.a, other.b)
+
+    def __hash__(self) -> int:
+        return hash((self.L, self.a, self.b))
+
     def to_rgb(self) -> RGBColor:
         l_ = self.L + 0.3963377774 * self.a + 0.2158037573 * self.b
         m_ = self.L - 0.1055613458 * self.a - 0.0638541728 * self.b
@@ -104,6 +201,24 @@ class OklabColor(object):
         return RGBColor(srgb_from_linear(rl), srgb_from_linear(gl),
                          srgb_from_linear(bl))
 
+    def to_8b(self) -> tuple[int, int, int]:
+        """Returns self.to_rgb().to_8b(), without computing the sRGB transfer
+        function."""
+        l_ = self.L + 0.3963377774 * self.a + 0.2158037573 * self.b
+        m_ = self.L - 0.1055613458 * self.a - 0.0638541728 * self.b
+        s_ = self.L - 0.0894841775 * self.a - 1.2914855480 * self.b
+        l = l_ * l_ * l_
+        m = m_ * m_ * m_
+        s = s_ * s_ * s_
+        return (
+                srgb_8b_from_linear(
+                        +4.0767416621 * l - 3.3077115913 * m + 0.2309699292 * s),
+                srgb_8b_from_linear(
+                        -1.2684380046 * l + 2.6097574011 * m - 0.3413193965 * s),
+                srgb_8b_from_linear(
+                        -0.0041960863 * l - 0.7034186147 * m + 1.7076147010 * s),
+        )
+
 def perc_distance(c1: OklabColor, c2: OklabColor) -> float:
     """Returns the perceptual distance between two Oklab colors."""
     dL = c1.L - c2.L
@@ -113,11 +228,24 @@ def perc_distance(c1: OklabColor, c2: OklabColor) -> float:
 
 class OklchColor(object):
     """Represents a color in the Oklch color space."""
+    __slots__ = ("L", "C", "h")
+
     def __init__(self, L: float, C: float, h: float):
         self.L = L
         self.C = C
         self.h = h
 
+    def __repr__(self) -> str:
+        return f"OklchColor({self.L!r}, {self.C!r}, {self.h!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, OklchColor):
+            return NotImplemented
+        return (self.L, self.C, self.h) == (other.L, other.C, other.h)
+
+    def __hash__(self) -> int:
+        return hash((self.L, self.C, self.h))
+
     def to_rgb(self) -> RGBColor:
         return self.to_oklab().to_rgb()
 
@@ -127,285 +255,663 @@ class OklchColor(object):
         b = self.C * math.sin(h_rad)
         return OklabColor(self.L, a, b)
 
+def _component(i: int) -> property:
+    # Returns a property for component i of a color view.
+    def get(self) -> float:
+        return self._buf[self._offset + i]
+    def set(self, value: float) -> None:
+        self._buf[self._offset + i] = value
+    return property(get, set)
+
+class RGBColorView(RGBColor):
+    """A view of a color in a ColorArray of RGBColors. Reading or assigning
+    its components reads or writes the array."""
+    __slots__ = ("_buf", "_offset")
+    r = _component(0)
+    g = _component(1)
+    b = _component(2)
+    # Views alias mutable storage, so they can't be hashed.
+    __hash__ = None
+
+    def __init__(self, buf: array.array, offset: int):
+        self._buf = buf
+        self._offset = offset
+
+class OklabColorView(OklabColor):
+    """A view of a color in a ColorArray of OklabColors."""
+    __slots__ = ("_buf", "_offset")
+    L = _component(0)
+    a = _component(1)
+    b = _component(2)
+    __hash__ = None
+
+    def __init__(self, buf: array.array, offset: int):
+        self._buf = buf
+        self._offset = offset
+
+class OklchColorView(OklchColor):
+    """A view of a color in a ColorArray of OklchColors."""
+    __slots__ = ("_buf", "_offset")
+    L = _component(0)
+    C = _component(1)
+    h = _component(2)
+    __hash__ = None
+
+    def __init__(self, buf: array.array, offset: int):
+        self._buf = buf
+        self._offset = offset
+
+_color_views = {
+        RGBColor: RGBColorView,
+        OklabColor: OklabColorView,
+        OklchColor: OklchColorView,
+}
+
+class ColorArray(object):
+    """A sequence of colors in one color model, stored as one contiguous buffer
+    of float64 components rather than one object per color.
+
+    Indexing returns a view of a single color, which has all of the methods of
+    the model's class but reads and writes the array. ColorArrays support the
+    buffer protocol, exporting an (N, 3) float64 buffer, so e.g.
+    numpy.asarray() wraps one without copying."""
+    __slots__ = ("model", "_buf")
+
+    def __init__(self, model: type, components: Iterable[float] = ()):
+        """Creates an array of colors of type model (RGBColor, OklabColor or
+        OklchColor) from a flat sequence of their components."""
+        if model not in _color_views:
+            raise TypeError(f"unsupported color model {model!r}")
+        self.model = model
+        self._buf = array.array("d", components)
+        if len(self._buf) % 3 != 0:
+            raise ValueError("number of components is not a multiple of 3")
+
+    @classmethod
+    def from_colors(cls, colors: Iterable, model: type | None = None
+                    ) -> ColorArray:
+        """Creates an array from colors. model defaults to the type of the
+        first color, and must be given if colors may be empty."""
+        if model is None:
+            colors = list(colors)
+            if not colors:
+                raise ValueError("can't infer the model of no colors")
+            model = next(m for m in _color_views if isinstance(colors[0], m))
+        get = operator.attrgetter(*model.__slots__)
+        return cls(model, [x for c in colors for x in get(c)])
+
+    def _fields(self) -> tuple[str, str, str]:
+        return self.model.__slots__
+
+    def __len__(self) -> int:
+        return len(self._buf) // 3
+
+    def __getitem__(self, i: int | slice):
+        if isinstance(i, slice):
+            # Slices are copies, like those of lists.
+            start, stop, step = i.indices(len(self))
+            arr = ColorArray(self.model)
+            if step == 1:
+                arr._buf = self._buf[3 * start:3 * stop]
+            else:
+                for c in range(start, stop, step):
+                    arr._buf.extend(self._buf[3 * c:3 * c + 3])
+            return arr
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("color index out of range")
+        return _color_views[self.model](self._buf, 3 * i)
+
+    def __setitem__(self, i: int, c) -> None:
+        view = self[i]
+        for f in self._fields():
+            setattr(view, f, getattr(c, f))
+
+    def __iter__(self):
+        view_type = _color_views[self.model]
+        buf = self._buf
+        for offset in range(0, len(buf), 3):
+            yield view_type(buf, offset)
+
+    def __add__(self, other: Iterable) -> ColorArray:
+        arr = ColorArray(self.model, self._buf)
+        arr.extend(other)
+        return arr
+
+    def __radd__(self, other: Iterable) -> ColorArray:
+        arr = ColorArray.from_colors(other, self.model)
+        arr.extend(self)
+        return arr
+
+    def append(self, c) -> None:
+        self._buf.extend(getattr(c, f) for f in self._fields())
+
+    def extend(self, colors: Iterable) -> None:
+        if isinstance(colors, ColorArray) and colors.model is self.model:
+            self._buf.extend(colors._buf)
+            return
+        for c in colors:
+            self.append(c)
+
+    def copy(self, i: int):
+        """Returns color i as a new object that doesn't alias the array."""
+        return self.model(*self._buf[3 * i:3 * i + 3])
+
+    def __buffer__(self, flags: int) -> memoryview:
+        return memoryview(self._buf).cast("B").cast("d", (len(self), 3))
+
+    def __release_buffer__(self, view: memoryview) -> None:
+        view.release()
+
+# sRGB gamut boundary. See https://bottosson.github.io/posts/gamutclipping/.
+#
+# Along a ray of constant L and h, each linear sRGB channel is a cubic in C, so
+# the boundary can be found with Halley's method instead of a search. At each
+# hue, the gamut's cross-section is roughly a triangle between black, white and
+# a "cusp" of maximum chroma, which gives good initial estimates. It isn't
+# exactly a triangle, or even convex: near blue, the red channel briefly dips
+# below 0 at low lightness. So max_chroma() still brackets the first crossing
+# of each channel between its turning points before refining it.
+
+# Rows of the linear sRGB from LMS matrix in OklabColor.to_rgb().
+_rgb_from_lms = (
+        (+4.0767416621, -3.3077115913, +0.2309699292),
+        (-1.2684380046, +2.6097574011, -0.3413193965),
+        (-0.0041960863, -0.7034186147, +1.7076147010),
+)
+
+def _lms_per_chroma(h: float) -> tuple[float, float, float]:
+    # Rates of change of l_, m_ and s_ in OklabColor.to_rgb() with respect to C
+    # at hue h.
+    h_rad = h * math.pi / 180.0
+    a = math.cos(h_rad)
+    b = math.sin(h_rad)
+    return (+0.3963377774 * a + 0.2158037573 * b,
+            -0.1055613458 * a - 0.0638541728 * b,
+            -0.0894841775 * a - 1.2914855480 * b)
+
+def _gamut_channel(w: tuple[float, float, float], L: float, C: float,
+                   k: tuple[float, float, float]) -> tuple[float, float, float]:
+    # Returns the linear sRGB channel with LMS weights w of the color at
+    # lightness L and chroma C along k, and its first two derivatives in C.
+    l_ = L + C * k[0]
+    m_ = L + C * k[1]
+    s_ = L + C * k[2]
+    wl = w[0] * k[0]
+    wm = w[1] * k[1]
+    ws = w[2] * k[2]
+    return (w[0] * l_ * l_ * l_ + w[1] * m_ * m_ * m_ + w[2] * s_ * s_ * s_,
+            3.0 * (wl * l_ * l_ + wm * m_ * m_ + ws * s_ * s_),
+            6.0 * (wl * k[0] * l_ + wm * k[1] * m_ + ws * k[2] * s_))
+
+def _gamut_solve(w: tuple[float, float, float], target: float, L: float,
+                 C: float, k: tuple[float, float, float]) -> float:
+    # Refines an estimate C of where the channel with LMS weights w reaches
+    # target, using Halley's method. Returns NaN if the channel doesn't reach
+    # target near C.
+    for _ in range(8):
+        f, f1, f2 = _gamut_channel(w, L, C, k)
+        f -= target
+        dC = f * f1 / (f1 * f1 - 0.5 * f * f2)
+        C -= dC
+        if abs(dC) < 1e-15:
+            break
+    if abs(_gamut_channel(w, L, C, k)[0] - target) > 1e-12:
+        return math.nan
+    return C
+
+def _cusp_saturation(h: float, S: float | None = None
+                     ) -> tuple[float, tuple[float, float, float]]:
+    # Returns the maximum saturation S = C / L at hue h, where the channel that
+    # first reaches 0 does so along the line C = S * L from black, and that
+    # channel's LMS weights and the direction k of increasing chroma. Refines
+    # the estimate S, by default Ottosson's polynomial fits, or returns NaN if
+    # it's too far off.
+    k = _lms_per_chroma(h)
+    h_rad = h * math.pi / 180.0
+    a = math.cos(h_rad)
+    b = math.sin(h_rad)
+    if -1.88170328 * a - 0.80936493 * b > 1:
+        w = _rgb_from_lms[0]
+        S_fit = (1.19086277 + 1.76576728 * a + 0.59662641 * b +
+                 0.75515197 * a * a + 0.56771245 * a * b)
+    elif 1.81444104 * a - 1.19445276 * b > 1:
+        w = _rgb_from_lms[1]
+        S_fit = (0.73956515 - 0.45954404 * a + 0.08285427 * b +
+                 0.12541070 * a * a + 0.14503204 * a * b)
+    else:
+        w = _rgb_from_lms[2]
+        S_fit = (1.35733652 - 0.00915799 * a - 1.15130210 * b -
+                 0.50559606 * a * a + 0.00692167 * a * b)
+    return _gamut_solve(w, 0.0, 1.0, S_fit if S is None else S, k), k
+
+def _cusp_from_saturation(S: float, k: tuple[float, float, float]
+                          ) -> tuple[float, float]:
+    # Scale (1, S) down until the largest channel is 1. Channels scale with
+    # L ** 3 along the line.
+    rgb_max = max(_gamut_channel(w_c, 1.0, S, k)[0] for w_c in _rgb_from_lms)
+    L_cusp = (1.0 / rgb_max) ** (1.0 / 3.0)
+    return L_cusp, L_cusp * S
+
+# The maximum saturation and the cusp (L, C) at every _CUSP_STEP degrees of
+# hue, from 0 to 360 inclusive, built on first use by gamut_cusp(). Cusps
+# between them are refined from interpolated saturations, so that the table's
+# size is fixed however many hues are asked about.
+_CUSP_STEP = 1.0
+_cusp_table: list[tuple[float, float, float]] | None = None
+
+def _make_cusp_table() -> list[tuple[float, float, float]]:
+    table = []
+    for i in range(round(360.0 / _CUSP_STEP) + 1):
+        S, k = _cusp_saturation(i * _CUSP_STEP)
+        table.append((S, *_cusp_from_saturation(S, k)))
+    return table
+
+def gamut_cusp(h: float) -> tuple[float, float]:
+    """Returns the lightness and chroma of the most chromatic in-gamut color
+    with hue h."""
+    global _cusp_table
+    if _cusp_table is None:
+        _cusp_table = _make_cusp_table()
+    x = (h % 360.0) / _CUSP_STEP
+    i = min(int(x), len(_cusp_table) - 2)
+    t = x - i
+    if t == 0.0:
+        return _cusp_table[i][1:]
+    S0 = _cusp_table[i][0]
+    S, k = _cusp_saturation(h, S0 + t * (_cusp_table[i + 1][0] - S0))
+    if math.isnan(S):
+        # Near a change of channel, the interpolation can be far off.
+        S, k = _cusp_saturation(h)
+    return _cusp_from_saturation(S, k)
+
+def _gamut_crossing(w: tuple[float, float, float], L: float, C_est: float,
+                    C_max: float, k: tuple[float, float, float]) -> float:
+    # Returns the smallest C in [0, C_max] where the channel with LMS weights w
+    # leaves [0, 1], or C_max if there is none, refining the crossing from
+    # C_est.
+    # Split [0, C_max] at the channel's turning points, the roots of its
+    # derivative A * C**2 + B * C + D, into monotonic pieces.
+    A = 3.0 * (w[0] * k[0] ** 3 + w[1] * k[1] ** 3 + w[2] * k[2] ** 3)
+    B = 6.0 * L * (w[0] * k[0] ** 2 + w[1] * k[1] ** 2 + w[2] * k[2] ** 2)
+    D = 3.0 * L * L * (w[0] * k[0] + w[1] * k[1] + w[2] * k[2])
+    if A != 0.0 and B * B - 4.0 * A * D >= 0.0:
+        sq = math.sqrt(B * B - 4.0 * A * D)
+        turns = sorted(((-B - sq) / (2.0 * A), (-B + sq) / (2.0 * A)))
+    elif A == 0.0 and B != 0.0:
+        turns = [-D / B]
+    else:
+        turns = []
+    ends = [C for C in turns if 0.0 < C < C_max] + [C_max]
+    for hi in ends:
+        f_hi = _gamut_channel(w, L, hi, k)[0]
+        if 0.0 <= f_hi <= 1.0:
+            continue
+        target = 0.0 if f_hi < 0.0 else 1.0
+        lo = 0.0
+        for C in turns:
+            if lo < C < hi:
+                lo = C
+        # The channel is monotonic on [lo, hi] and crosses target there. Use
+        # Halley's method, falling back to bisection if it leaves [lo, hi].
+        C = C_est if lo < C_est < hi else 0.5 * (lo + hi)
+        for _ in range(64):
+            f, f1, f2 = _gamut_channel(w, L, C, k)
+            f -= target
+            if (f < 0.0) == (f_hi - target < 0.0):
+                hi = C
+            else:
+                lo = C
+            denom = f1 * f1 - 0.5 * f * f2
+            C_next = C - f * f1 / denom if denom != 0.0 else 0.5 * (lo + hi)
+            if not lo <= C_next <= hi:
+                C_next = 0.5 * (lo + hi)
+            # Rounding error in the channel value limits accuracy to ~1e-16.
+            if abs(C_next - C) <= 1e-14 or hi - lo <= 1e-14:
+                return C_next
+            C = C_next
+        return C
+    return C_max
+
+def max_chroma(L: float, h: float) -> float:
+    """Returns the maximum chroma C such that every color with lightness L, hue
+    h and chroma at most C is in gamut."""
+    if not 0.0 < L < 1.0:
+        return 0.0
+    L_cusp, C_cusp = gamut_cusp(h)
+    if L <= L_cusp:
+        C_est = C_cusp * L / L_cusp
+    else:
+        C_est = C_cusp * (1.0 - L) / (1.0 - L_cusp)
+    k = _lms_per_chroma(h)
+    # No sRGB color has a chroma above 0.33.
+    C_max = 0.5
+    for w in _rgb_from_lms:
+        C_max = _gamut_crossing(w, L, C_est, C_max, k)
+    return C_max
+
 ###############################################################################
 # Color systems
 ###############################################################################
 
-# List of terminal colors, indexed by color code.
-term256_rgb = [
-        rgb(0x000000),  # 0
-        rgb(0x800000),  # 1
-        rgb(0x008000),  # 2
-        rgb(0x808000),  # 3
-        rgb(0x000080),  # 4
-        rgb(0x800080),  # 5
-        rgb(0x008080),  # 6
-        rgb(0xc0c0c0),  # 7
-        rgb(0x808080),  # 8
-        rgb(0xff0000),  # 9
-        rgb(0x00ff00),  # 10
-        rgb(0xffff00),  # 11
-        rgb(0x0000ff),  # 12
-        rgb(0xff00ff),  # 13
-        rgb(0x00ffff),  # 14
-        rgb(0xffffff),  # 15
-        rgb(0x000000),  # 16: Grey0
-        rgb(0x00005f),  # 17: NavyBlue
-        rgb(0x000087),  # 18: DarkBlue
-        rgb(0x0000af),  # 19: Blue3
-        rgb(0x0000d7),  # 20: Blue3
-        rgb(0x0000ff),  # 21: Blue1
-        rgb(0x005f00),  # 22: DarkGreen
-        rgb(0x005f5f),  # 23: DeepSkyBlue4
-        rgb(0x005f87),  # 24: DeepSkyBlue4
-        rgb(0x005faf),  # 25: DeepSkyBlue4
-        rgb(0x005fd7),  # 26: DodgerBlue3
-        rgb(0x005fff),  # 27: DodgerBlue2
-        rgb(0x008700),  # 28: Green4
-        rgb(0x00875f),  # 29: SpringGreen4
-        rgb(0x008787),  # 30: Turquoise4
-        rgb(0x0087af),  # 31: DeepSkyBlue3
-        rgb(0x0087d7),  # 32: DeepSkyBlue3
-        rgb(0x0087ff),  # 33: DodgerBlue1
-        rgb(0x00af00),  # 34: Green3
-        rgb(0x00af5f),  # 35: SpringGreen3
-        rgb(0x00af87),  # 36: DarkCyan
-        rgb(0x00afaf),  # 37: LightSeaGreen
-        rgb(0x00afd7),  # 38: DeepSkyBlue2
-        rgb(0x00afff),  # 39: DeepSkyBlue1
-        rgb(0x00d700),  # 40: Green3
-        rgb(0x00d75f),  # 41: SpringGreen3
-        rgb(0x00d787),  # 42: SpringGreen2
-        rgb(0x00d7af),  # 43: Cyan3
-        rgb(0x00d7d7),  # 44: DarkTurquoise
-        rgb(0x00d7ff),  # 45: Turquoise2
-        rgb(0x00ff00),  # 46: Green1
-        rgb(0x00ff5f),  # 47: SpringGreen2
-        rgb(0x00ff87),  # 48: SpringGreen1
-        rgb(0x00ffaf),  # 49: MediumSpringGreen
-        rgb(0x00ffd7),  # 50: Cyan2
-        rgb(0x00ffff),  # 51: Cyan1
-        rgb(0x5f0000),  # 52: DarkRed
-        rgb(0x5f005f),  # 53: DeepPink4
-        rgb(0x5f0087),  # 54: Purple4
-        rgb(0x5f00af),  # 55: Purple4
-        rgb(0x5f00d7),  # 56: Purple3
-        rgb(0x5f00ff),  # 57: BlueViolet
-        rgb(0x5f5f00),  # 58: Orange4
-        rgb(0x5f5f5f),  # 59: Grey37
-        rgb(0x5f5f87),  # 60: MediumPurple4
-        rgb(0x5f5faf),  # 61: SlateBlue3
-        rgb(0x5f5fd7),  # 62: SlateBlue3
-        rgb(0x5f5fff),  # 63: RoyalBlue1
-        rgb(0x5f8700),  # 64: Chartreuse4
-        rgb(0x5f875f),  # 65: DarkSeaGreen4
-        rgb(0x5f8787),  # 66: PaleTurquoise4
-        rgb(0x5f87af),  # 67: SteelBlue
-        rgb(0x5f87d7),  # 68: SteelBlue3
-        rgb(0x5f87ff),  # 69: CornflowerBlue
-        rgb(0x5faf00),  # 70: Chartreuse3
-        rgb(0x5faf5f),  # 71: DarkSeaGreen4
-        rgb(0x5faf87),  # 72: CadetBlue
-        rgb(0x5fafaf),  # 73: CadetBlue
-        rgb(0x5fafd7),  # 74: SkyBlue3
-        rgb(0x5fafff),  # 75: SteelBlue1
-        rgb(0x5fd700),  # 76: Chartreuse3
-        rgb(0x5fd75f),  # 77: PaleGreen3
-        rgb(0x5fd787),  # 78: SeaGreen3
-        rgb(0x5fd7af),  # 79: Aquamarine3
-        rgb(0x5fd7d7),  # 80: MediumTurquoise
-        rgb(0x5fd7ff),  # 81: SteelBlue1
-        rgb(0x5fff00),  # 82: Chartreuse2
-        rgb(0x5fff5f),  # 83: SeaGreen2
-        rgb(0x5fff87),  # 84: SeaGreen1
-        rgb(0x5fffaf),  # 85: SeaGreen1
-        rgb(0x5fffd7),  # 86: Aquamarine1
-        rgb(0x5fffff),  # 87: DarkSlateGray2
-        rgb(0x870000),  # 88: DarkRed
-        rgb(0x87005f),  # 89: DeepPink4
-        rgb(0x870087),  # 90: DarkMagenta
-        rgb(0x8700af),  # 91: DarkMagenta
-        rgb(0x8700d7),  # 92: DarkViolet
-        rgb(0x8700ff),  # 93: Purple
-        rgb(0x875f00),  # 94: Orange4
-        rgb(0x875f5f),  # 95: LightPink4
-        rgb(0x875f87),  # 96: Plum4
-        rgb(0x875faf),  # 97: MediumPurple3
-        rgb(0x875fd7),  # 98: MediumPurple3
-        rgb(0x875fff),  # 99: SlateBlue1
-        rgb(0x878700),  # 100: Yellow4
-        rgb(0x87875f),  # 101: Wheat4
-        rgb(0x878787),  # 102: Grey53
-        rgb(0x8787af),  # 103: LightSlateGrey
-        rgb(0x8787d7),  # 104: MediumPurple
-        rgb(0x8787ff),  # 105: LightSlateBlue
-        rgb(0x87af00),  # 106: Yellow4
-        rgb(0x87af5f),  # 107: DarkOliveGreen3
-        rgb(0x87af87),  # 108: DarkSeaGreen
-        rgb(0x87afaf),  # 109: LightSkyBlue3
-        rgb(0x87afd7),  # 110: LightSkyBlue3
-        rgb(0x87afff),  # 111: SkyBlue2
-        rgb(0x87d700),  # 112: Chartreuse2
-        rgb(0x87d75f),  # 113: DarkOliveGreen3
-        rgb(0x87d787),  # 114: PaleGreen3
-        rgb(0x87d7af),  # 115: DarkSeaGreen3
-        rgb(0x87d7d7),  # 116: DarkSlateGray3
-        rgb(0x87d7ff),  # 117: SkyBlue1
-        rgb(0x87ff00),  # 118: Chartreuse1
-        rgb(0x87ff5f),  # 119: LightGreen
-        rgb(0x87ff87),  # 120: LightGreen
-        rgb(0x87ffaf),  # 121: PaleGreen1
-        rgb(0x87ffd7),  # 122: Aquamarine1
-        rgb(0x87ffff),  # 123: DarkSlateGray1
-        rgb(0xaf0000),  # 124: Red3
-        rgb(0xaf005f),  # 125: DeepPink4
-        rgb(0xaf0087),  # 126: MediumVioletRed
-        rgb(0xaf00af),  # 127: Magenta3
-        rgb(0xaf00d7),  # 128: DarkViolet
-        rgb(0xaf00ff),  # 129: Purple
-        rgb(0xaf5f00),  # 130: DarkOrange3
-        rgb(0xaf5f5f),  # 131: IndianRed
-        rgb(0xaf5f87),  # 132: HotPink3
-        rgb(0xaf5faf),  # 133: MediumOrchid3
-        rgb(0xaf5fd7),  # 134: MediumOrchid
-        rgb(0xaf5fff),  # 135: MediumPurple2
-        rgb(0xaf8700),  # 136: DarkGoldenrod
-        rgb(0xaf875f),  # 137: LightSalmon3
-        rgb(0xaf8787),  # 138: RosyBrown
-        rgb(0xaf87af),  # 139: Grey63
-        rgb(0xaf87d7),  # 140: MediumPurple2
-        rgb(0xaf87ff),  # 141: MediumPurple1
-        rgb(0xafaf00),  # 142: Gold3
-        rgb(0xafaf5f),  # 143: DarkKhaki
-        rgb(0xafaf87),  # 144: NavajoWhite3
-        rgb(0xafafaf),  # 145: Grey69
-        rgb(0xafafd7),  # 146: LightSteelBlue3
-        rgb(0xafafff),  # 147: LightSteelBlue
-        rgb(0xafd700),  # 148: Yellow3
-        rgb(0xafd75f),  # 149: DarkOliveGreen3
-        rgb(0xafd787),  # 150: DarkSeaGreen3
-        rgb(0xafd7af),  # 151: DarkSeaGreen2
-        rgb(0xafd7d7),  # 152: LightCyan3
-        rgb(0xafd7ff),  # 153: LightSkyBlue1
-        rgb(0xafff00),  # 154: GreenYellow
-        rgb(0xafff5f),  # 155: DarkOliveGreen2
-        rgb(0xafff87),  # 156: PaleGreen1
-        rgb(0xafffaf),  # 157: DarkSeaGreen2
-        rgb(0xafffd7),  # 158: DarkSeaGreen1
-        rgb(0xafffff),  # 159: PaleTurquoise1
-        rgb(0xd70000),  # 160: Red3
-        rgb(0xd7005f),  # 161: DeepPink3
-        rgb(0xd70087),  # 162: DeepPink3
-        rgb(0xd700af),  # 163: Magenta3
-        rgb(0xd700d7),  # 164: Magenta3
-        rgb(0xd700ff),  # 165: Magenta2
-        rgb(0xd75f00),  # 166: DarkOrange3
-        rgb(0xd75f5f),  # 167: IndianRed
-        rgb(0xd75f87),  # 168: HotPink3
-        rgb(0xd75faf),  # 169: HotPink2
-        rgb(0xd75fd7),  # 170: Orchid
-        rgb(0xd75fff),  # 171: MediumOrchid1
-        rgb(0xd78700),  # 172: Orange3
-        rgb(0xd7875f),  # 173: LightSalmon3
-        rgb(0xd78787),  # 174: LightPink3
-        rgb(0xd787af),  # 175: Pink3
-        rgb(0xd787d7),  # 176: Plum3
-        rgb(0xd787ff),  # 177: Violet
-        rgb(0xd7af00),  # 178: Gold3
-        rgb(0xd7af5f),  # 179: LightGoldenrod3
-        rgb(0xd7af87),  # 180: Tan
-        rgb(0xd7afaf),  # 181: MistyRose3
-        rgb(0xd7afd7),  # 182: Thistle3
-        rgb(0xd7afff),  # 183: Plum2
-        rgb(0xd7d700),  # 184: Yellow3
-        rgb(0xd7d75f),  # 185: Khaki3
-        rgb(0xd7d787),  # 186: LightGoldenrod2
-        rgb(0xd7d7af),  # 187: LightYellow3
-        rgb(0xd7d7d7),  # 188: Grey84
-        rgb(0xd7d7ff),  # 189: LightSteelBlue1
-        rgb(0xd7ff00),  # 190: Yellow2
-        rgb(0xd7ff5f),  # 191: DarkOliveGreen1
-        rgb(0xd7ff87),  # 192: DarkOliveGreen1
-        rgb(0xd7ffaf),  # 193: DarkSeaGreen1
-        rgb(0xd7ffd7),  # 194: Honeydew2
-        rgb(0xd7ffff),  # 195: LightCyan1
-        rgb(0xff0000),  # 196: Red1
-        rgb(0xff005f),  # 197: DeepPink2
-        rgb(0xff0087),  # 198: DeepPink1
-        rgb(0xff00af),  # 199: DeepPink1
-        rgb(0xff00d7),  # 200: Magenta2
-        rgb(0xff00ff),  # 201: Magenta1
-        rgb(0xff5f00),  # 202: OrangeRed1
-        rgb(0xff5f5f),  # 203: IndianRed1
-        rgb(0xff5f87),  # 204: IndianRed1
-        rgb(0xff5faf),  # 205: HotPink
-        rgb(0xff5fd7),  # 206: HotPink
-        rgb(0xff5fff),  # 207: MediumOrchid1
-        rgb(0xff8700),  # 208: DarkOrange
-        rgb(0xff875f),  # 209: Salmon1
-        rgb(0xff8787),  # 210: LightCoral
-        rgb(0xff87af),  # 211: PaleVioletRed1
-        rgb(0xff87d7),  # 212: Orchid2
-        rgb(0xff87ff),  # 213: Orchid1
-        rgb(0xffaf00),  # 214: Orange1
-        rgb(0xffaf5f),  # 215: SandyBrown
-        rgb(0xffaf87),  # 216: LightSalmon1
-        rgb(0xffafaf),  # 217: LightPink1
-        rgb(0xffafd7),  # 218: Pink1
-        rgb(0xffafff),  # 219: Plum1
-        rgb(0xffd700),  # 220: Gold1
-        rgb(0xffd75f),  # 221: LightGoldenrod2
-        rgb(0xffd787),  # 222: LightGoldenrod2
-        rgb(0xffd7af),  # 223: NavajoWhite1
-        rgb(0xffd7d7),  # 224: MistyRose1
-        rgb(0xffd7ff),  # 225: Thistle1
-        rgb(0xffff00),  # 226: Yellow1
-        rgb(0xffff5f),  # 227: LightGoldenrod1
-        rgb(0xffff87),  # 228: Khaki1
-        rgb(0xffffaf),  # 229: Wheat1
-        rgb(0xffffd7),  # 230: Cornsilk1
-        rgb(0xffffff),  # 231: Grey100
-        rgb(0x080808),  # 232: Grey3
-        rgb(0x121212),  # 233: Grey7
-        rgb(0x1c1c1c),  # 234: Grey11
-        rgb(0x262626),  # 235: Grey15
-        rgb(0x303030),  # 236: Grey19
-        rgb(0x3a3a3a),  # 237: Grey23
-        rgb(0x444444),  # 238: Grey27
-        rgb(0x4e4e4e),  # 239: Grey30
-        rgb(0x585858),  # 240: Grey35
-        rgb(0x626262),  # 241: Grey39
-        rgb(0x6c6c6c),  # 242: Grey42
-        rgb(0x767676),  # 243: Grey46
-        rgb(0x808080),  # 244: Grey50
-        rgb(0x8a8a8a),  # 245: Grey54
-        rgb(0x949494),  # 246: Grey58
-        rgb(0x9e9e9e),  # 247: Grey62
-        rgb(0xa8a8a8),  # 248: Grey66
-        rgb(0xb2b2b2),  # 249: Grey70
-        rgb(0xbcbcbc),  # 250: Grey74
-        rgb(0xc6c6c6),  # 251: Grey78
-        rgb(0xd0d0d0),  # 252: Grey82
-        rgb(0xdadada),  # 253: Grey85
-        rgb(0xe4e4e4),  # 254: Grey89
-        rgb(0xeeeeee),  # 255: Grey93
-]
-
-term256_perc = [rgb.to_oklab() for rgb in term256_rgb]
-
-def term256_code(c: RGBColor) -> int:
-    """Returns the terminal color code perceptually closest to the given
-    color."""
-    c_perc = c.to_oklab()
+def _make_term256_rgb() -> ColorArray:
+    # List of terminal colors, indexed by color code.
+    return ColorArray.from_colors([
+            rgb(0x000000),  # 0
+            rgb(0x800000),  # 1
+            rgb(0x008000),  # 2
+            rgb(0x808000),  # 3
+            rgb(0x000080),  # 4
+            rgb(0x800080),  # 5
+            rgb(0x008080),  # 6
+            rgb(0xc0c0c0),  # 7
+            rgb(0x808080),  # 8
+            rgb(0xff0000),  # 9
+            rgb(0x00ff00),  # 10
+            rgb(0xffff00),  # 11
+            rgb(0x0000ff),  # 12
+            rgb(0xff00ff),  # 13
+            rgb(0x00ffff),  # 14
+            rgb(0xffffff),  # 15
+            rgb(0x000000),  # 16: Grey0
+            rgb(0x00005f),  # 17: NavyBlue
+            rgb(0x000087),  # 18: DarkBlue
+            rgb(0x0000af),  # 19: Blue3
+            rgb(0x0000d7),  # 20: Blue3
+            rgb(0x0000ff),  # 21: Blue1
+            rgb(0x005f00),  # 22: DarkGreen
+            rgb(0x005f5f),  # 23: DeepSkyBlue4
+            rgb(0x005f87),  # 24: DeepSkyBlue4
+            rgb(0x005faf),  # 25: DeepSkyBlue4
+            rgb(0x005fd7),  # 26: DodgerBlue3
+            rgb(0x005fff),  # 27: DodgerBlue2
+            rgb(0x008700),  # 28: Green4
+            rgb(0x00875f),  # 29: SpringGreen4
+            rgb(0x008787),  # 30: Turquoise4
+            rgb(0x0087af),  # 31: DeepSkyBlue3
+            rgb(0x0087d7),  # 32: DeepSkyBlue3
+            rgb(0x0087ff),  # 33: DodgerBlue1
+            rgb(0x00af00),  # 34: Green3
+            rgb(0x00af5f),  # 35: SpringGreen3
+            rgb(0x00af87),  # 36: DarkCyan
+            rgb(0x00afaf),  # 37: LightSeaGreen
+            rgb(0x00afd7),  # 38: DeepSkyBlue2
+            rgb(0x00afff),  # 39: DeepSkyBlue1
+            rgb(0x00d700),  # 40: Green3
+            rgb(0x00d75f),  # 41: SpringGreen3
+            rgb(0x00d787),  # 42: SpringGreen2
+            rgb(0x00d7af),  # 43: Cyan3
+            rgb(0x00d7d7),  # 44: DarkTurquoise
+            rgb(0x00d7ff),  # 45: Turquoise2
+            rgb(0x00ff00),  # 46: Green1
+            rgb(0x00ff5f),  # 47: SpringGreen2
+            rgb(0x00ff87),  # 48: SpringGreen1
+            rgb(0x00ffaf),  # 49: MediumSpringGreen
+            rgb(0x00ffd7),  # 50: Cyan2
+            rgb(0x00ffff),  # 51: Cyan1
+            rgb(0x5f0000),  # 52: DarkRed
+            rgb(0x5f005f),  # 53: DeepPink4
+            rgb(0x5f0087),  # 54: Purple4
+            rgb(0x5f00af),  # 55: Purple4
+            rgb(0x5f00d7),  # 56: Purple3
+            rgb(0x5f00ff),  # 57: BlueViolet
+            rgb(0x5f5f00),  # 58: Orange4
+            rgb(0x5f5f5f),  # 59: Grey37
+            rgb(0x5f5f87),  # 60: MediumPurple4
+            rgb(0x5f5faf),  # 61: SlateBlue3
+            rgb(0x5f5fd7),  # 62: SlateBlue3
+            rgb(0x5f5fff),  # 63: RoyalBlue1
+            rgb(0x5f8700),  # 64: Chartreuse4
+            rgb(0x5f875f),  # 65: DarkSeaGreen4
+            rgb(0x5f8787),  # 66: PaleTurquoise4
+            rgb(0x5f87af),  # 67: SteelBlue
+            rgb(0x5f87d7),  # 68: SteelBlue3
+            rgb(0x5f87ff),  # 69: CornflowerBlue
+            rgb(0x5faf00),  # 70: Chartreuse3
+            rgb(0x5faf5f),  # 71: DarkSeaGreen4
+            rgb(0x5faf87),  # 72: CadetBlue
+            rgb(0x5fafaf),  # 73: CadetBlue
+            rgb(0x5fafd7),  # 74: SkyBlue3
+            rgb(0x5fafff),  # 75: SteelBlue1
+            rgb(0x5fd700),  # 76: Chartreuse3
+            rgb(0x5fd75f),  # 77: PaleGreen3
+            rgb(0x5fd787),  # 78: SeaGreen3
+            rgb(0x5fd7af),  # 79: Aquamarine3
+            rgb(0x5fd7d7),  # 80: MediumTurquoise
+            rgb(0x5fd7ff),  # 81: SteelBlue1
+            rgb(0x5fff00),  # 82: Chartreuse2
+            rgb(0x5fff5f),  # 83: SeaGreen2
+            rgb(0x5fff87),  # 84: SeaGreen1
+            rgb(0x5fffaf),  # 85: SeaGreen1
+            rgb(0x5fffd7),  # 86: Aquamarine1
+            rgb(0x5fffff),  # 87: DarkSlateGray2
+            rgb(0x870000),  # 88: DarkRed
+            rgb(0x87005f),  # 89: DeepPink4
+            rgb(0x870087),  # 90: DarkMagenta
+            rgb(0x8700af),  # 91: DarkMagenta
+            rgb(0x8700d7),  # 92: DarkViolet
+            rgb(0x8700ff),  # 93: Purple
+            rgb(0x875f00),  # 94: Orange4
+            rgb(0x875f5f),  # 95: LightPink4
+            rgb(0x875f87),  # 96: Plum4
+            rgb(0x875faf),  # 97: MediumPurple3
+            rgb(0x875fd7),  # 98: MediumPurple3
+            rgb(0x875fff),  # 99: SlateBlue1
+            rgb(0x878700),  # 100: Yellow4
+            rgb(0x87875f),  # 101: Wheat4
+            rgb(0x878787),  # 102: Grey53
+            rgb(0x8787af),  # 103: LightSlateGrey
+            rgb(0x8787d7),  # 104: MediumPurple
+            rgb(0x8787ff),  # 105: LightSlateBlue
+            rgb(0x87af00),  # 106: Yellow4
+            rgb(0x87af5f),  # 107: DarkOliveGreen3
+            rgb(0x87af87),  # 108: DarkSeaGreen
+            rgb(0x87afaf),  # 109: LightSkyBlue3
+            rgb(0x87afd7),  # 110: LightSkyBlue3
+            rgb(0x87afff),  # 111: SkyBlue2
+            rgb(0x87d700),  # 112: Chartreuse2
+            rgb(0x87d75f),  # 113: DarkOliveGreen3
+            rgb(0x87d787),  # 114: PaleGreen3
+            rgb(0x87d7af),  # 115: DarkSeaGreen3
+            rgb(0x87d7d7),  # 116: DarkSlateGray3
+            rgb(0x87d7ff),  # 117: SkyBlue1
+            rgb(0x87ff00),  # 118: Chartreuse1
+            rgb(0x87ff5f),  # 119: LightGreen
+            rgb(0x87ff87),  # 120: LightGreen
+            rgb(0x87ffaf),  # 121: PaleGreen1
+            rgb(0x87ffd7),  # 122: Aquamarine1
+            rgb(0x87ffff),  # 123: DarkSlateGray1
+            rgb(0xaf0000),  # 124: Red3
+            rgb(0xaf005f),  # 125: DeepPink4
+            rgb(0xaf0087),  # 126: MediumVioletRed
+            rgb(0xaf00af),  # 127: Magenta3
+            rgb(0xaf00d7),  # 128: DarkViolet
+            rgb(0xaf00ff),  # 129: Purple
+            rgb(0xaf5f00),  # 130: DarkOrange3
+            rgb(0xaf5f5f),  # 131: IndianRed
+            rgb(0xaf5f87),  # 132: HotPink3
+            rgb(0xaf5faf),  # 133: MediumOrchid3
+            rgb(0xaf5fd7),  # 134: MediumOrchid
+            rgb(0xaf5fff),  # 135: MediumPurple2
+            rgb(0xaf8700),  # 136: DarkGoldenrod
+            rgb(0xaf875f),  # 137: LightSalmon3
+            rgb(0xaf8787),  # 138: RosyBrown
+            rgb(0xaf87af),  # 139: Grey63
+            rgb(0xaf87d7),  # 140: MediumPurple2
+            rgb(0xaf87ff),  # 141: MediumPurple1
+            rgb(0xafaf00),  # 142: Gold3
+            rgb(0xafaf5f),  # 143: DarkKhaki
+            rgb(0xafaf87),  # 144: NavajoWhite3
+            rgb(0xafafaf),  # 145: Grey69
+            rgb(0xafafd7),  # 146: LightSteelBlue3
+            rgb(0xafafff),  # 147: LightSteelBlue
+            rgb(0xafd700),  # 148: Yellow3
+            rgb(0xafd75f),  # 149: DarkOliveGreen3
+            rgb(0xafd787),  # 150: DarkSeaGreen3
+            rgb(0xafd7af),  # 151: DarkSeaGreen2
+            rgb(0xafd7d7),  # 152: LightCyan3
+            rgb(0xafd7ff),  # 153: LightSkyBlue1
+            rgb(0xafff00),  # 154: GreenYellow
+            rgb(0xafff5f),  # 155: DarkOliveGreen2
+            rgb(0xafff87),  # 156: PaleGreen1
+            rgb(0xafffaf),  # 157: DarkSeaGreen2
+            rgb(0xafffd7),  # 158: DarkSeaGreen1
+            rgb(0xafffff),  # 159: PaleTurquoise1
+            rgb(0xd70000),  # 160: Red3
+            rgb(0xd7005f),  # 161: DeepPink3
+            rgb(0xd70087),  # 162: DeepPink3
+            rgb(0xd700af),  # 163: Magenta3
+            rgb(0xd700d7),  # 164: Magenta3
+            rgb(0xd700ff),  # 165: Magenta2
+            rgb(0xd75f00),  # 166: DarkOrange3
+            rgb(0xd75f5f),  # 167: IndianRed
+            rgb(0xd75f87),  # 168: HotPink3
+            rgb(0xd75faf),  # 169: HotPink2
+            rgb(0xd75fd7),  # 170: Orchid
+            rgb(0xd75fff),  # 171: MediumOrchid1
+            rgb(0xd78700),  # 172: Orange3
+            rgb(0xd7875f),  # 173: LightSalmon3
+            rgb(0xd78787),  # 174: LightPink3
+            rgb(0xd787af),  # 175: Pink3
+            rgb(0xd787d7),  # 176: Plum3
+            rgb(0xd787ff),  # 177: Violet
+            rgb(0xd7af00),  # 178: Gold3
+            rgb(0xd7af5f),  # 179: LightGoldenrod3
+            rgb(0xd7af87),  # 180: Tan
+            rgb(0xd7afaf),  # 181: MistyRose3
+            rgb(0xd7afd7),  # 182: Thistle3
+            rgb(0xd7afff),  # 183: Plum2
+            rgb(0xd7d700),  # 184: Yellow3
+            rgb(0xd7d75f),  # 185: Khaki3
+            rgb(0xd7d787),  # 186: LightGoldenrod2
+            rgb(0xd7d7af),  # 187: LightYellow3
+            rgb(0xd7d7d7),  # 188: Grey84
+            rgb(0xd7d7ff),  # 189: LightSteelBlue1
+            rgb(0xd7ff00),  # 190: Yellow2
+            rgb(0xd7ff5f),  # 191: DarkOliveGreen1
+            rgb(0xd7ff87),  # 192: DarkOliveGreen1
+            rgb(0xd7ffaf),  # 193: DarkSeaGreen1
+            rgb(0xd7ffd7),  # 194: Honeydew2
+            rgb(0xd7ffff),  # 195: LightCyan1
+            rgb(0xff0000),  # 196: Red1
+            rgb(0xff005f),  # 197: DeepPink2
+            rgb(0xff0087),  # 198: DeepPink1
+            rgb(0xff00af),  # 199: DeepPink1
+            rgb(0xff00d7),  # 200: Magenta2
+            rgb(0xff00ff),  # 201: Magenta1
+            rgb(0xff5f00),  # 202: OrangeRed1
+            rgb(0xff5f5f),  # 203: IndianRed1
+            rgb(0xff5f87),  # 204: IndianRed1
+            rgb(0xff5faf),  # 205: HotPink
+            rgb(0xff5fd7),  # 206: HotPink
+            rgb(0xff5fff),  # 207: MediumOrchid1
+            rgb(0xff8700),  # 208: DarkOrange
+            rgb(0xff875f),  # 209: Salmon1
+            rgb(0xff8787),  # 210: LightCoral
+            rgb(0xff87af),  # 211: PaleVioletRed1
+            rgb(0xff87d7),  # 212: Orchid2
+            rgb(0xff87ff),  # 213: Orchid1
+            rgb(0xffaf00),  # 214: Orange1
+            rgb(0xffaf5f),  # 215: SandyBrown
+            rgb(0xffaf87),  # 216: LightSalmon1
+            rgb(0xffafaf),  # 217: LightPink1
+            rgb(0xffafd7),  # 218: Pink1
+            rgb(0xffafff),  # 219: Plum1
+            rgb(0xffd700),  # 220: Gold1
+            rgb(0xffd75f),  # 221: LightGoldenrod2
+            rgb(0xffd787),  # 222: LightGoldenrod2
+            rgb(0xffd7af),  # 223: NavajoWhite1
+            rgb(0xffd7d7),  # 224: MistyRose1
+            rgb(0xffd7ff),  # 225: Thistle1
+            rgb(0xffff00),  # 226: Yellow1
+            rgb(0xffff5f),  # 227: LightGoldenrod1
+            rgb(0xffff87),  # 228: Khaki1
+            rgb(0xffffaf),  # 229: Wheat1
+            rgb(0xffffd7),  # 230: Cornsilk1
+            rgb(0xffffff),  # 231: Grey100
+            rgb(0x080808),  # 232: Grey3
+            rgb(0x121212),  # 233: Grey7
+            rgb(0x1c1c1c),  # 234: Grey11
+            rgb(0x262626),  # 235: Grey15
+            rgb(0x303030),  # 236: Grey19
+            rgb(0x3a3a3a),  # 237: Grey23
+            rgb(0x444444),  # 238: Grey27
+            rgb(0x4e4e4e),  # 239: Grey30
+            rgb(0x585858),  # 240: Grey35
+            rgb(0x626262),  # 241: Grey39
+            rgb(0x6c6c6c),  # 242: Grey42
+            rgb(0x767676),  # 243: Grey46
+            rgb(0x808080),  # 244: Grey50
+            rgb(0x8a8a8a),  # 245: Grey54
+            rgb(0x949494),  # 246: Grey58
+            rgb(0x9e9e9e),  # 247: Grey62
+            rgb(0xa8a8a8),  # 248: Grey66
+            rgb(0xb2b2b2),  # 249: Grey70
+            rgb(0xbcbcbc),  # 250: Grey74
+            rgb(0xc6c6c6),  # 251: Grey78
+            rgb(0xd0d0d0),  # 252: Grey82
+            rgb(0xdadada),  # 253: Grey85
+            rgb(0xe4e4e4),  # 254: Grey89
+            rgb(0xeeeeee),  # 255: Grey93
+    ])
+
+def _make_term256_perc() -> ColorArray:
+    return ColorArray.from_colors(
+            (rgb.to_oklab() for rgb in _get("term256_rgb")), OklabColor)
+
+def _make_term88_rgb() -> ColorArray:
+    # List of colors of xterm's 88-color mode, indexed by color code. Codes
+    # 0-15 are shared with term256_rgb; codes 16-79 are a 4x4x4 color cube and
+    # codes 80-87 are a grey ramp.
+    return _get("term256_rgb")[:16] + [
+            RGBColor.from_8b(r, g, b)
+            for r in (0x00, 0x8b, 0xcd, 0xff)
+            for g in (0x00, 0x8b, 0xcd, 0xff)
+            for b in (0x00, 0x8b, 0xcd, 0xff)
+    ] + [
+            RGBColor.from_8b(v, v, v)
+            for v in (0x2e, 0x5c, 0x73, 0x8b, 0xa2, 0xb9, 0xd0, 0xe7)
+    ]
+
+_term_indexes: dict[tuple[str, str], "jcolor2_nearest.NearestColorIndex"] = {}
+
+def term_index(palette: str | Sequence[RGBColor] = "240",
+               metric: str = "oklab") -> "jcolor2_nearest.NearestColorIndex":
+    """Returns a NearestColorIndex over a terminal palette by the named metric,
+    one of metrics. palette is one of:
+    - "16": codes 0-15.
+    - "88": all codes of xterm's 88-color mode.
+    - "240": codes 16-255 of the 256-color mode.
+    - "256": all codes of the 256-color mode.
+    - A list of colors, whose codes are their indices in the list.
+    Indexes over named palettes are built once and cached."""
+    NearestColorIndex = _get("NearestColorIndex")
+    if not isinstance(palette, str):
+        return NearestColorIndex(palette, metric=metric)
+    index = _term_indexes.get((palette, metric))
+    if index is None:
+        term256_rgb = _get("term256_rgb")
+        if palette == "16":
+            index = NearestColorIndex(term256_rgb[:16], metric=metric)
+        elif palette == "88":
+            index = NearestColorIndex(_get("term88_rgb"), metric=metric)
+        elif palette == "240":
+            index = NearestColorIndex(term256_rgb[16:], range(16, 256),
+                                      metric)
+        elif palette == "256":
+            index = NearestColorIndex(term256_rgb, metric=metric)
+        else:
+            raise ValueError(f"unknown palette {palette!r}")
+        _term_indexes[palette, metric] = index
+    return index
+
+def term256_code(c: RGBColor, metric: str = "oklab") -> int:
+    """Returns the terminal color code closest to the given color by the named
+    metric, by default perceptually closest."""
     # Colors 0-15 are often overridden by the terminal.
-    closest_code = 16
-    closest_dist = perc_distance(c_perc, term256_perc[16])
-    for code in range(17, len(term256_perc)):
-        dist = perc_distance(c_perc, term256_perc[code])
-        if dist < closest_dist:
-            closest_code = code
-            closest_dist = dist
-    return closest_code
+    return term_index("240", metric).nearest(c)
 
 ###############################################################################
 # Color selection
@@ -415,19 +921,11 @@ def grey(L: float) -> RGBColor:
     return OklabColor(L, 0, 0).to_rgb()
 
 def saturate(L: float, h: float) -> RGBColor:
-    C_good = 0.0
-    color_good = OklchColor(L, 0.0, h).to_rgb()
-    dC = 0.125
-    for _ in range(12):
-        while True:
-            C = C_good + dC
-            color = OklchColor(L, C, h).to_rgb()
-            if not color.in_gamut():
-                break
-            C_good = C
-            color_good = color
-        dC /= 2
-    return color_good
+    """Returns the most chromatic in-gamut color with lightness L and hue h."""
+    # Round down to the resolution of the search this replaced, 0.125 / 2**11,
+    # so that generated color schemes are unchanged.
+    C = math.floor(max_chroma(L, h) * 16384.0) / 16384.0
+    return OklchColor(L, C, h).to_rgb()
 
 named_hues = {
         "red": 20,
@@ -487,193 +985,229 @@ def midpoint_darks() -> dict[str, RGBColor]:
 # - Dark colors, e.g. "redorange_dark", are optimized for foreground use on
 #   "black_dark" background and infrequent background use with "black"
 #   foreground.
-palette = {
-        "black_dark": grey(L_black + dL_dark),
-        "black": grey(L_black),
-        "black_light": grey(L_black + dL_light),
-        "white_dark": grey(L_white + dL_dark),
-        "white": grey(L_white),
-        "grey": grey(L_hue),
-} | {
-        h_name: saturate(L_hue, h) for h_name, h in named_hues.items()
-} | midpoint_darks()
+def make_palette() -> dict[str, RGBColor]:
+    return {
+            "black_dark": grey(L_black + dL_dark),
+            "black": grey(L_black),
+            "black_light": grey(L_black + dL_light),
+            "white_dark": grey(L_white + dL_dark),
+            "white": grey(L_white),
+            "grey": grey(L_hue),
+    } | {
+            h_name: saturate(L_hue, h) for h_name, h in named_hues.items()
+    } | midpoint_darks()
 
 # delims is a short list of unnamed colors that remains distinct at relatively
 # small sizes.
-delims = [grey(L_seq)] + [OklchColor(L_seq, C_seq, h).to_rgb()
-                          for h in (20, 260, 140, 320, 200, 80)]
+delim_hues = (20, 260, 140, 320, 200, 80)
+
+def make_delims() -> list[RGBColor]:
+    return [grey(L_seq)] + [OklchColor(L_seq, C_seq, h).to_rgb()
+                            for h in delim_hues]
+
+# Bump when changing how make_palette() or make_delims() use the constants, or
+# how term256_code() maps colors.
+_PALETTE_VERSION = 1
+
+def _palette_consts() -> list:
+    return [_PALETTE_VERSION, list(named_hues.items()), L_black, L_white,
+            L_hue, L_seq, dL_dark, dL_light, C_hue_dark_weak,
+            C_hue_dark_strong, C_seq, list(delim_hues)]
+
+def palette_key() -> str:
+    """Returns a hash of the constants that determine palette and delims."""
+    import hashlib
+    import json
+    return hashlib.sha256(json.dumps(_palette_consts()).encode()).hexdigest()
+
+def _default_cache_dir() -> str:
+    path = os.environ.get("JCOLOR2_CACHE_DIR")
+    if path:
+        return path
+    cache_home = os.environ.get("XDG_CACHE_HOME") or \
+            os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "jcolor2")
+
+# Directory of jcolor2's caches, which are only an optimization and may be
+# deleted at any time; None disables them. Cached palette, delims and
+# palette_codes are used while the constants they were computed from are
+# unchanged.
+cache_dir: str | None = _default_cache_dir()
+
+def _make_palette_codes() -> dict[RGBColor, int]:
+    pal = _get("palette")
+    dl = _get("delims")
+    g = globals()
+    if "palette_codes" in g:
+        # Loaded from the cache along with palette and delims.
+        return g["palette_codes"]
+    return {c: term256_code(c) for c in (*pal.values(), *dl)}
+
+def _load_palette() -> tuple[dict[str, RGBColor], list[RGBColor],
+                             dict[RGBColor, int] | None]:
+    # Returns palette, delims, and palette_codes if they're cached.
+    if cache_dir is None:
+        return make_palette(), make_delims(), None
+    # marshal rather than json, which takes longer to import than the palette
+    # takes to compute.
+    import marshal
+    path = os.path.join(cache_dir, "palette.marshal")
+    consts = _palette_consts()
+    try:
+        with open(path, "rb") as f:
+            cached = marshal.load(f)
+        if cached["consts"] == consts:
+            pal = {name: RGBColor(*c)
+                   for name, c in cached["palette"].items()}
+            dl = [RGBColor(*c) for c in cached["delims"]]
+            colors = (*pal.values(), *dl)
+            if len(cached["codes"]) != len(colors):
+                raise ValueError("wrong number of codes")
+            return pal, dl, dict(zip(colors, cached["codes"]))
+    except (OSError, EOFError, ValueError, KeyError, TypeError):
+        pass
+    pal = make_palette()
+    dl = make_delims()
+    codes = {c: term256_code(c) for c in (*pal.values(), *dl)}
+    cached = {
+            "consts": consts,
+            "palette": {name: (c.r, c.g, c.b) for name, c in pal.items()},
+            "delims": [(c.r, c.g, c.b) for c in dl],
+            "codes": [codes[c] for c in (*pal.values(), *dl)],
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            marshal.dump(cached, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        # The cache is only an optimization.
+        pass
+    return pal, dl, codes
+
+###############################################################################
+# Lazily computed attributes
+###############################################################################
+
+# Module attributes that are only computed when first used, so that importing
+# this module, or running it for something that doesn't need them, is cheap.
+_lazy_attrs = {
+        "term256_rgb": _make_term256_rgb,
+        "term256_perc": _make_term256_perc,
+        "term88_rgb": _make_term88_rgb,
+        "palette": None,
+        "delims": None,
+        # The term256_code() of each color of palette and delims.
+        "palette_codes": _make_palette_codes,
+}
+
+# Names defined by jcolor2_nearest, which is only imported when one of them is
+# first used.
+_nearest_attrs = ("NearestColorIndex", "metrics")
+
+def __getattr__(name: str):
+    g = globals()
+    if name in _nearest_attrs:
+        import jcolor2_nearest
+        g[name] = getattr(jcolor2_nearest, name)
+    elif name in ("palette", "delims"):
+        g["palette"], g["delims"], codes = _load_palette()
+        if codes is not None:
+            g["palette_codes"] = codes
+    elif name in _lazy_attrs:
+        g[name] = _lazy_attrs[name]()
+    else:
+        raise AttributeError(
+                f"module {__name__!r} has no attribute {name!r}") from None
+    return g[name]
+
+def _get(name: str):
+    # Module code sees globals directly rather than through __getattr__().
+    g = globals()
+    return g[name] if name in g else __getattr__(name)
 
 ###############################################################################
-# Color schemes
+# Command line
 ###############################################################################
 
+# Subcommands of the command line, each implemented by the add_arguments() and
+# main() of a module, which is only imported when the subcommand is run.
+subcommands = {
+        "vim": ("jcolor2_render", "print Vim color scheme"),
+        "vim-airline": ("jcolor2_render", "print vim-airline color scheme"),
+        "render": ("jcolor2_render",
+                   "write color schemes for all or some targets that changed"),
+        "lut": ("jcolor2_lut",
+                "build or check a 24-bit to terminal color lookup table"),
+        "quantize": ("jcolor2_quantize",
+                     "quantize an image to terminal colors"),
+        "colormap": ("jcolor2_colormap",
+                     "write a perceptually uniform colormap for plots"),
+        "downsample": ("jcolor2_downsample",
+                       "rewrite truecolor escape sequences on standard input "
+                       "to 256-color ones"),
+        "optimize": ("jcolor2_optimize",
+                     "search for better values of the tuning constants"),
+        "audit": ("jcolor2_audit",
+                  "report color pairs of the Vim color scheme with low "
+                  "contrast"),
+        "serve": ("jcolor2_serve",
+                  "answer color queries on a Unix socket (see "
+                  "jcolor2_client.py)"),
+}
+
 if __name__ == "__main__":
-    argp = argparse.ArgumentParser()
-    argsp = argp.add_subparsers(dest="subcmd")
-    argp_vim = argsp.add_parser("vim", help="print Vim color scheme")
-    argp_vim_airline = argsp.add_parser("vim-airline",
-                                        help="print vim-airline color scheme")
+    # Only the chosen subcommand's arguments are parsed, so that running one
+    # doesn't pay for setting up the others.
+    import argparse
+    argp = argparse.ArgumentParser(
+            formatter_class=argparse.RawDescriptionHelpFormatter,
+            epilog="subcommands:\n" + "".join(
+                    f"  {name:<12}  {summary}\n"
+                    for name, (_, summary) in subcommands.items()))
+    argp.add_argument("--profile", action="store_true",
+                      help="print call counts and timings of the subcommand "
+                           "to standard error")
+    argp.add_argument("--profile-format", choices=("table", "json"),
+                      default="table",
+                      help="format of --profile output; defaults to table")
+    argp.add_argument("subcmd", nargs="?", choices=subcommands,
+                      metavar="SUBCOMMAND")
+    argp.add_argument("args", nargs=argparse.REMAINDER,
+                      help="arguments of the subcommand; see "
+                           "SUBCOMMAND --help")
     args = argp.parse_args()
 
     if not args.subcmd:
         argp.print_help()
         exit(1)
 
-    elif args.subcmd == "vim":
-        print("""" Generated by `jcolor2.py vim`
-
-highlight clear
-if exists('syntax_on')
-  syntax reset
-endif
-
-let colors_name = 'jcolor2'
-
-if !has('gui_running') && !(has('termguicolors') && &termguicolors) && &t_Co != 256
-  finish
-endif
-
-set background=dark""")
-        print()
-        for name, c in palette.items():
-            c_term = term256_code(c)
-            print(f"\" {name}: {c} (cterm={c_term} {term256_rgb[c_term]})")
-        print()
-        def hi(group: str,
-               fg_name: str | None = None,
-               bg_name: str | None = None,
-               attrs: str | None = None,
-               ul_name: str | None = None):
-            if fg_name:
-                fg = palette[fg_name]
-                fg_gui = str(fg)
-                fg_term = str(term256_code(fg))
-            else:
-                fg_gui = "NONE"
-                fg_term = "NONE"
-            if bg_name:
-                bg = palette[bg_name]
-                bg_gui = str(bg)
-                bg_term = str(term256_code(bg))
-            else:
-                bg_gui = "NONE"
-                bg_term = "NONE"
-            if attrs is None:
-                attrs = "NONE"
-            if ul_name:
-                ul = palette[ul_name]
-                guisp = " guisp=" + str(ul)
-                ctermul = " ctermul=" + str(term256_code(ul))
+    # Let modules that import jcolor2 share this instance of it.
+    sys.modules.setdefault("jcolor2", sys.modules[__name__])
+
+    if args.profile:
+        import jcolor2_stats
+        jcolor2_stats.enable()
+
+    import importlib
+    module_name, summary = subcommands[args.subcmd]
+    module = importlib.import_module(module_name)
+    subargp = argparse.ArgumentParser(prog=f"{argp.prog} {args.subcmd}",
+                                      description=summary)
+    module.add_arguments(subargp, args.subcmd)
+    subargs = subargp.parse_args(args.args)
+    subargs.subcmd = args.subcmd
+    if not args.profile:
+        module.main(subargs)
+    else:
+        try:
+            with jcolor2_stats.phase("total"):
+                module.main(subargs)
+        finally:
+            stats = jcolor2_stats.disable()
+            if args.profile_format == "json":
+                import json
+                sys.stderr.write(json.dumps(stats.to_json(), indent=2) + "\n")
             else:
-                guisp = ""
-                ctermul = ""
-            print(f"highlight {group} guifg={fg_gui} guibg={bg_gui}{guisp} gui={attrs} ctermfg={fg_term} ctermbg={bg_term}{ctermul} cterm={attrs}")
-        hi("Normal", "white", "black")
-        print("\n\" From :help E669")
-        hi("Comment", "grey")
-        hi("Constant", "blue")
-        hi("Identifier", "white")
-        hi("Statement", "green")
-        hi("PreProc", "purple")
-        hi("Type", "white")
-        hi("Special", "orange")
-        hi("Underlined", attrs="underline")
-        hi("Bold", attrs="bold")
-        hi("Italic", attrs="italic")
-        hi("BoldItalic", attrs="bold,italic")
-        hi("Ignore", "black")
-        hi("Error", "red")
-        hi("Todo", "white")
-        hi("Added", "green")
-        hi("Changed", "blue")
-        hi("Removed", "red")
-        print()
-        hi("ColorColumn", None, "black_dark")
-        hi("Conceal", attrs="italic")
-        hi("CursorColumn", None, "black_light")
-        hi("CursorLine", None, "black_light")
-        hi("CursorLineNr", None, "black_light")
-        hi("Directory", "blue")
-        hi("LineNr", "grey")
-        hi("MatchParen", attrs="bold")
-        hi("NonText", "grey") # ~ lines after EOF, @ after truncation
-        hi("Folded", attrs="italic")
-        hi("FoldColumn", "white")
-        hi("Pmenu", None, "black_dark")
-        hi("PmenuSel", attrs="inverse")
-        hi("Search", "yellow", attrs="inverse")
-        hi("SignColumn", "white")
-        hi("SpecialKey", "grey") # listchars showing tabs
-        hi("SpellBad", attrs="undercurl", ul_name="red")
-        hi("SpellCap", attrs="undercurl", ul_name="red")
-        hi("SpellLocal", attrs="undercurl", ul_name="blue")
-        hi("SpellRare", attrs="undercurl", ul_name="yellow")
-        hi("StatusLine", "white_dark", "black_dark")
-        hi("VertSplit", "grey", "black_dark")
-        hi("Visual", attrs="inverse")
-        hi("WinSeparator", "grey", "black_dark")
-        print()
-        hi("CtrlPMatch", attrs="inverse")
-        print("\n\" llama.vim")
-        hi("llama_hl_fim_hint", "cyan", "black")
-        hi("llama_hl_inst_src", "white", attrs="italic")
-        hi("llama_hl_inst_virt_proc", "grey", attrs="italic")
-        hi("llama_hl_inst_virt_gen", "cyan", attrs="italic")
-        hi("llama_hl_inst_virt_ready", "cyan")
-        rainbow_colors = ",\n".join(
-                f"\\     ['{term256_code(color)}', '{color}']"
-                for color in delims)
-        print("""
-" rainbow_parentheses
-if !exists('g:rainbow#colors')
-  let g:rainbow#colors = {
-\\   'dark': [
-%s
-\\   ],
-\\   'light': [
-%s
-\\   ] }
-endif""" % (rainbow_colors, rainbow_colors))
-
-    elif args.subcmd == "vim-airline":
-        black = palette["black"]
-        black_dark = palette["black_dark"]
-        grey_dark = palette["grey_dark"]
-        accent_color = OklchColor(L_hue + dL_dark, C_hue_dark_strong,
-                                  named_hues["red"]).to_rgb()
-        ctrlp_color = palette["bluepurple_dark_strong"]
-        print("""" Generated by `jcolor2.py vim-airline`
-
-let g:airline#themes#jcolor2#palette = {}
-
-let g:airline#themes#jcolor2#palette.accents = {
-\\ 'red': ['%s', '', %d, '', ''],
-\\ }""" % (accent_color, term256_code(accent_color)))
-        def line(fg: RGBColor, bg: RGBColor, attrs: str = "", indent: int = 1):
-            return f"\\{" " * (indent * 2 - 1)}['{fg}', '{bg}', {term256_code(fg)}, {term256_code(bg)}, '{attrs}'],"
-        def pal(p_name: str, c_name: str, indent: int = 0):
-            c = palette[c_name]
-            print(f"""
-let g:airline#themes#jcolor2#palette.{p_name} = airline#themes#generate_color_map(
-{line(black_dark, c, indent=indent+1)}
-{line(c, black, indent=indent+1)}
-{line(c, black_dark, indent=indent+1)}
-\\ )""")
-        def mode(p_name: str, h_name: str):
-            pal(p_name, f"{h_name}_dark_weak")
-            pal(f"{p_name}_modified", f"{h_name}_dark_strong")
-        mode("normal", "greencyan")
-        mode("insert", "yellowgreen")
-        mode("replace", "purplepink")
-        mode("visual", "cyanblue")
-        print(f"""
-let s:IA = ['{grey_dark}', '{black_dark}', {term256_code(grey_dark)}, {term256_code(black_dark)}, '']
-let g:airline#themes#jcolor2#palette.inactive = airline#themes#generate_color_map(s:IA, s:IA, s:IA)""")
-        print(f"""
-if get(g:, 'loaded_ctrlp', 0)
-  let g:airline#themes#jcolor2#palette.ctrlp = airline#extensions#ctrlp#generate_color_map(
-{line(ctrlp_color, black_dark, "bold", indent=2)}
-{line(ctrlp_color, black, indent=2)}
-{line(black_dark, ctrlp_color, indent=2)}
-\\   )
-endif""")
+                sys.stderr.write(stats.table())
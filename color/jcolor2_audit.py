@@ -0,0 +1,98 @@
+"""Contrast audit of jcolor2's color scheme.
+
+A ContrastMatrix holds the WCAG 2 contrast ratio between every pair of a set of
+named colors, computing each color's luminance only once. audit() uses one to
+check the foreground and background of each highlight group of the Vim color
+scheme, and each color of delims against each of the black backgrounds it's
+drawn on. Requires NumPy."""
+
+import sys
+from collections import namedtuple
+
+import jcolor2
+import jcolor2_batch
+import jcolor2_render
+
+class ContrastMatrix(object):
+    """The contrast ratios between all pairs of a set of named colors."""
+
+    def __init__(self, colors: dict[str, jcolor2.RGBColor]):
+        self.names = list(colors)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self.luminances = jcolor2_batch.luminance(
+                jcolor2_batch.rgb_array(colors.values()))
+        # ratios[i, j] is the contrast between colors i and j.
+        self.ratios = jcolor2_batch.contrast_from_luminance(
+                self.luminances[:, None], self.luminances[None, :])
+
+    def __getitem__(self, pair: tuple[str, str]) -> float:
+        fg, bg = pair
+        return float(self.ratios[self._index[fg], self._index[bg]])
+
+def delim_name(i: int) -> str:
+    return f"delims[{i}]"
+
+def audit_colors() -> dict[str, jcolor2.RGBColor]:
+    """Returns the colors that audit_pairs() refers to: the palette, and delims
+    named by delim_name()."""
+    return jcolor2.palette | {
+            delim_name(i): c for i, c in enumerate(jcolor2.delims)}
+
+# Backgrounds that delims are drawn on.
+delim_backgrounds = ("black_dark", "black", "black_light")
+
+# A foreground and background color, by name, that are drawn together, and
+# what draws them.
+Pair = namedtuple("Pair", ("what", "fg", "bg"))
+
+def audit_pairs() -> list[Pair]:
+    """Returns the color pairs drawn by the Vim color scheme."""
+    highlights = [hl for hl in jcolor2_render.vim_highlights
+                  if not isinstance(hl, str)]
+    # Groups that leave a color unset inherit it from Normal.
+    normal = next(hl for hl in highlights if hl.group == "Normal")
+    pairs = []
+    for hl in highlights:
+        fg = hl.fg or normal.fg
+        bg = hl.bg or normal.bg
+        if hl.attrs and "inverse" in hl.attrs.split(","):
+            fg, bg = bg, fg
+        # Groups like Ignore hide text on purpose.
+        if fg != bg:
+            pairs.append(Pair(hl.group, fg, bg))
+        if hl.ul:
+            pairs.append(Pair(f"{hl.group} (underline)", hl.ul, bg))
+    for i in range(len(jcolor2.delims)):
+        for bg in delim_backgrounds:
+            pairs.append(Pair("rainbow_parentheses", delim_name(i), bg))
+    return pairs
+
+def audit(threshold: float, matrix: ContrastMatrix | None = None
+          ) -> list[tuple[Pair, float]]:
+    """Returns each pair of audit_pairs() whose contrast is below threshold,
+    with its contrast ratio."""
+    if matrix is None:
+        matrix = ContrastMatrix(audit_colors())
+    results = []
+    for pair in audit_pairs():
+        ratio = matrix[pair.fg, pair.bg]
+        if ratio < threshold:
+            results.append((pair, ratio))
+    return results
+
+def add_arguments(argp: "argparse.ArgumentParser", subcmd: str) -> None:
+    argp.add_argument("-t", "--threshold", type=float, default=4.5,
+                      help="minimum contrast ratio; defaults to 4.5, WCAG's "
+                           "minimum for text")
+
+def main(args: "argparse.Namespace") -> None:
+    colors = audit_colors()
+    low = audit(args.threshold, ContrastMatrix(colors))
+    for pair, ratio in low:
+        print(f"{pair.what}: {pair.fg} ({colors[pair.fg]}) on {pair.bg} "
+              f"({colors[pair.bg]}): {ratio:.2f}:1")
+    if low:
+        print(f"Error: {len(low)} color pair(s) have contrast below "
+              f"{args.threshold:g}:1", file=sys.stderr)
+        exit(1)
+    print(f"All color pairs have contrast of at least {args.threshold:g}:1")
@@ -0,0 +1,388 @@
+"""Vectorized counterparts of the jcolor2 color model conversions.
+
+Every function takes and returns NumPy arrays whose last axis holds the three
+color components, e.g. shape (N, 3), and computes the same results as the
+scalar methods of jcolor2.RGBColor, OklabColor and OklchColor."""
+
+import numpy as np
+
+###############################################################################
+# Transfer functions
+###############################################################################
+
+def srgb_from_linear(c: np.ndarray) -> np.ndarray:
+    c = np.asarray(c, dtype=np.float64)
+    # Clamp the pow() argument so that the discarded branch can't produce NaNs.
+    hi = 1.055 * np.power(np.maximum(c, 0.0031308), 1.0 / 2.4) - 0.055
+    return np.where(c < 0.0031308, 12.92 * c, hi)
+
+def linear_from_srgb(c: np.ndarray) -> np.ndarray:
+    c = np.asarray(c, dtype=np.float64)
+    hi = np.power((np.maximum(c, 0.04045) + 0.055) / 1.055, 2.4)
+    return np.where(c < 0.04045, c / 12.92, hi)
+
+###############################################################################
+# Color models
+###############################################################################
+
+# Matrices applied to row vectors, i.e. x @ M; transposed relative to the
+# usual presentation so that (N, 3) inputs need no reshaping.
+_LMS_FROM_LINEAR = np.array([
+        [0.4122214708, 0.5363325363, 0.0514459929],
+        [0.2119034982, 0.6806995451, 0.1073969566],
+        [0.0883024619, 0.2817188376, 0.6299787005],
+]).T
+_OKLAB_FROM_LMS_ = np.array([
+        [0.2104542553, 0.7936177850, -0.0040720468],
+        [1.9779984951, -2.4285922050, 0.4505937099],
+        [0.0259040371, 0.7827717662, -0.8086757660],
+]).T
+_LMS__FROM_OKLAB = np.array([
+        [1.0, 0.3963377774, 0.2158037573],
+        [1.0, -0.1055613458, -0.0638541728],
+        [1.0, -0.0894841775, -1.2914855480],
+]).T
+_LINEAR_FROM_LMS = np.array([
+        [4.0767416621, -3.3077115913, 0.2309699292],
+        [-1.2684380046, 2.6097574011, -0.3413193965],
+        [-0.0041960863, -0.7034186147, 1.7076147010],
+]).T
+
+def oklab_from_linear(lin: np.ndarray) -> np.ndarray:
+    lms = np.asarray(lin, dtype=np.float64) @ _LMS_FROM_LINEAR
+    return np.cbrt(lms) @ _OKLAB_FROM_LMS_
+
+def linear_from_oklab(lab: np.ndarray) -> np.ndarray:
+    lms_ = np.asarray(lab, dtype=np.float64) @ _LMS__FROM_OKLAB
+    return (lms_ * lms_ * lms_) @ _LINEAR_FROM_LMS
+
+def oklab_from_rgb(rgb: np.ndarray) -> np.ndarray:
+    return oklab_from_linear(linear_from_srgb(rgb))
+
+def rgb_from_oklab(lab: np.ndarray) -> np.ndarray:
+    return srgb_from_linear(linear_from_oklab(lab))
+
+def oklch_from_oklab(lab: np.ndarray) -> np.ndarray:
+    """Returns Oklch colors with hue angles in degrees in [0, 360)."""
+    lab = np.asarray(lab, dtype=np.float64)
+    lch = np.empty_like(lab)
+    lch[..., 0] = lab[..., 0]
+    lch[..., 1] = np.hypot(lab[..., 1], lab[..., 2])
+    lch[..., 2] = np.degrees(np.arctan2(lab[..., 2], lab[..., 1])) % 360.0
+    return lch
+
+def oklab_from_oklch(lch: np.ndarray) -> np.ndarray:
+    lch = np.asarray(lch, dtype=np.float64)
+    h_rad = lch[..., 2] * np.pi / 180.0
+    lab = np.empty_like(lch)
+    lab[..., 0] = lch[..., 0]
+    lab[..., 1] = lch[..., 1] * np.cos(h_rad)
+    lab[..., 2] = lch[..., 1] * np.sin(h_rad)
+    return lab
+
+def oklch_from_rgb(rgb: np.ndarray) -> np.ndarray:
+    return oklch_from_oklab(oklab_from_rgb(rgb))
+
+def rgb_from_oklch(lch: np.ndarray) -> np.ndarray:
+    return rgb_from_oklab(oklab_from_oklch(lch))
+
+def in_gamut(rgb: np.ndarray) -> np.ndarray:
+    """Returns a boolean array that is true for each in-gamut sRGB color."""
+    rgb = np.asarray(rgb)
+    return np.all((rgb >= 0.0) & (rgb <= 1.0), axis=-1)
+
+###############################################################################
+# Contrast
+###############################################################################
+
+def luminance(rgb: np.ndarray) -> np.ndarray:
+    """Returns the WCAG 2 relative luminance of sRGB colors, as
+    jcolor2.luminance()."""
+    lin = linear_from_srgb(rgb)
+    return 0.2126 * lin[..., 0] + 0.7152 * lin[..., 1] + 0.0722 * lin[..., 2]
+
+def contrast_from_luminance(fg_lum: np.ndarray, bg_lum: np.ndarray
+                            ) -> np.ndarray:
+    """Returns the WCAG 2 contrast ratios between colors with the broadcast
+    relative luminances fg_lum and bg_lum, computed as jcolor2.contrast()."""
+    ratio = (np.asarray(fg_lum) + 0.05) / (np.asarray(bg_lum) + 0.05)
+    return np.where(ratio < 1.0, 1.0 / ratio, ratio)
+
+def contrast_matrix(fg: np.ndarray, bg: np.ndarray | None = None
+                    ) -> np.ndarray:
+    """Returns the (N, M) matrix of WCAG 2 contrast ratios between each of the
+    N sRGB colors in fg and each of the M in bg, by default fg itself."""
+    fg_lum = luminance(fg)
+    bg_lum = fg_lum if bg is None else luminance(bg)
+    return contrast_from_luminance(fg_lum[:, None], bg_lum[None, :])
+
+###############################################################################
+# Color difference
+###############################################################################
+
+# See jcolor2_nearest for the metrics that use these.
+
+_XYZ_FROM_LINEAR = np.array([
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+]).T
+# The D65 white point.
+_XYZ_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+def cielab_from_linear(lin: np.ndarray) -> np.ndarray:
+    """Returns the CIELAB (D65) colors of linear sRGB colors."""
+    t = (np.asarray(lin, dtype=np.float64) @ _XYZ_FROM_LINEAR) / _XYZ_WHITE
+    d = 6.0 / 29.0
+    f = np.where(t > d * d * d, np.cbrt(t), t / (3.0 * d * d) + 4.0 / 29.0)
+    lab = np.empty_like(f)
+    lab[..., 0] = 116.0 * f[..., 1] - 16.0
+    lab[..., 1] = 500.0 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200.0 * (f[..., 1] - f[..., 2])
+    return lab
+
+def perc_distance(lab1: np.ndarray, lab2: np.ndarray) -> np.ndarray:
+    """Returns the broadcast perceptual distances between Oklab colors, as
+    jcolor2.perc_distance()."""
+    diff = np.asarray(lab1, dtype=np.float64) - lab2
+    return np.sqrt((diff * diff).sum(axis=-1))
+
+def ciede2000(lab1: np.ndarray, lab2: np.ndarray,
+              chroma1: np.ndarray | None = None,
+              chroma2: np.ndarray | None = None) -> np.ndarray:
+    """Returns the broadcast CIEDE2000 color differences between CIELAB
+    colors. chroma1 and chroma2 may give their precomputed CIELAB chroma."""
+    # Sharma, Wu and Dalal, "The CIEDE2000 color-difference formula:
+    # Implementation notes, supplementary test data, and mathematical
+    # observations", 2005.
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    if chroma1 is None:
+        chroma1 = np.hypot(a1, b1)
+    if chroma2 is None:
+        chroma2 = np.hypot(a2, b2)
+    C7 = ((chroma1 + chroma2) * 0.5) ** 7
+    G = 0.5 * (1.0 - np.sqrt(C7 / (C7 + 25.0 ** 7)))
+    a1p = (1.0 + G) * a1
+    a2p = (1.0 + G) * a2
+    C1p = np.hypot(a1p, b1)
+    C2p = np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360.0
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360.0
+    CCp = C1p * C2p
+    gray = CCp == 0.0
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180.0, dhp - 360.0,
+                   np.where(dhp < -180.0, dhp + 360.0, dhp))
+    dhp = np.where(gray, 0.0, dhp)
+    dLp = L2 - L1
+    dCp = C2p - C1p
+    dHp = 2.0 * np.sqrt(CCp) * np.sin(np.radians(dhp * 0.5))
+    Lbp = (L1 + L2) * 0.5
+    Cbp = (C1p + C2p) * 0.5
+    hsum = h1p + h2p
+    hbp = np.where(np.abs(h1p - h2p) <= 180.0, hsum * 0.5,
+                   np.where(hsum < 360.0, (hsum + 360.0) * 0.5,
+                            (hsum - 360.0) * 0.5))
+    hbp = np.where(gray, hsum, hbp)
+    T = (1.0 - 0.17 * np.cos(np.radians(hbp - 30.0)) +
+         0.24 * np.cos(np.radians(2.0 * hbp)) +
+         0.32 * np.cos(np.radians(3.0 * hbp + 6.0)) -
+         0.20 * np.cos(np.radians(4.0 * hbp - 63.0)))
+    dtheta = 30.0 * np.exp(-((hbp - 275.0) / 25.0) ** 2)
+    Cbp7 = Cbp ** 7
+    RC = 2.0 * np.sqrt(Cbp7 / (Cbp7 + 25.0 ** 7))
+    L50 = (Lbp - 50.0) ** 2
+    SL = 1.0 + 0.015 * L50 / np.sqrt(20.0 + L50)
+    SC = 1.0 + 0.045 * Cbp
+    SH = 1.0 + 0.015 * Cbp * T
+    RT = -np.sin(np.radians(2.0 * dtheta)) * RC
+    dL = dLp / SL
+    dC = dCp / SC
+    dH = dHp / SH
+    return np.sqrt(dL * dL + dC * dC + dH * dH + RT * dC * dH)
+
+def weighted_oklch_distance(lab1: np.ndarray, lab2: np.ndarray,
+                            weights: tuple[float, float, float],
+                            chroma1: np.ndarray | None = None,
+                            chroma2: np.ndarray | None = None) -> np.ndarray:
+    """Returns the broadcast distances between Oklab colors with their
+    lightness, chroma and hue differences scaled by weights. chroma1 and
+    chroma2 may give their precomputed chroma."""
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    if chroma1 is None:
+        chroma1 = np.hypot(lab1[..., 1], lab1[..., 2])
+    if chroma2 is None:
+        chroma2 = np.hypot(lab2[..., 1], lab2[..., 2])
+    wL, wC, wH = weights
+    dL = lab1[..., 0] - lab2[..., 0]
+    da = lab1[..., 1] - lab2[..., 1]
+    db = lab1[..., 2] - lab2[..., 2]
+    dC = chroma1 - chroma2
+    # The hue difference, as a distance: what remains of the difference in
+    # a and b once the chroma difference is accounted for.
+    dH2 = np.maximum(da * da + db * db - dC * dC, 0.0)
+    return np.sqrt(wL * wL * dL * dL + wC * wC * dC * dC + wH * wH * dH2)
+
+###############################################################################
+# Conversion from and to color objects
+###############################################################################
+
+def rgb_array(colors) -> np.ndarray:
+    """Returns an (N, 3) array of the components of a sequence of RGBColors."""
+    return np.array([(c.r, c.g, c.b) for c in colors], dtype=np.float64)
+
+def oklab_array(colors) -> np.ndarray:
+    """Returns an (N, 3) array of the components of a sequence of
+    OklabColors."""
+    return np.array([(c.L, c.a, c.b) for c in colors], dtype=np.float64)
+
+def oklch_array(colors) -> np.ndarray:
+    """Returns an (N, 3) array of the components of a sequence of
+    OklchColors."""
+    return np.array([(c.L, c.C, c.h) for c in colors], dtype=np.float64)
+
+def rgb_from_8b(rgb8: np.ndarray) -> np.ndarray:
+    """Returns sRGB colors given their 8-bit components."""
+    return np.asarray(rgb8, dtype=np.float64) / 255.0
+
+def rgb_to_8b(rgb: np.ndarray) -> np.ndarray:
+    """Returns the clamped 8-bit components of sRGB colors, rounded as in
+    RGBColor.to_8b()."""
+    return np.rint(np.clip(rgb, 0.0, 1.0) * 255.0).astype(np.uint8)
+
+###############################################################################
+# Gamut boundary
+###############################################################################
+
+# See the scalar jcolor2.gamut_cusp() and jcolor2.max_chroma() for the method.
+
+# Rows of the linear sRGB from LMS matrix.
+_RGB_FROM_LMS = np.array([
+        [+4.0767416621, -3.3077115913, +0.2309699292],
+        [-1.2684380046, +2.6097574011, -0.3413193965],
+        [-0.0041960863, -0.7034186147, +1.7076147010],
+])
+
+def _lms_per_chroma(h: np.ndarray) -> np.ndarray:
+    h_rad = h * np.pi / 180.0
+    a = np.cos(h_rad)
+    b = np.sin(h_rad)
+    return np.stack([+0.3963377774 * a + 0.2158037573 * b,
+                     -0.1055613458 * a - 0.0638541728 * b,
+                     -0.0894841775 * a - 1.2914855480 * b], axis=-1)
+
+def _gamut_channel(w: np.ndarray, L: np.ndarray, C: np.ndarray,
+                   k: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    l_ = L + C * k[..., 0]
+    m_ = L + C * k[..., 1]
+    s_ = L + C * k[..., 2]
+    wl = w[..., 0] * k[..., 0]
+    wm = w[..., 1] * k[..., 1]
+    ws = w[..., 2] * k[..., 2]
+    return (w[..., 0] * l_ * l_ * l_ + w[..., 1] * m_ * m_ * m_ +
+                    w[..., 2] * s_ * s_ * s_,
+            3.0 * (wl * l_ * l_ + wm * m_ * m_ + ws * s_ * s_),
+            6.0 * (wl * k[..., 0] * l_ + wm * k[..., 1] * m_ +
+                   ws * k[..., 2] * s_))
+
+def gamut_cusp(h: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the lightness and chroma of the most chromatic in-gamut color
+    with each hue in h."""
+    h = np.asarray(h, dtype=np.float64)
+    k = _lms_per_chroma(h)
+    h_rad = h * np.pi / 180.0
+    a = np.cos(h_rad)
+    b = np.sin(h_rad)
+    is_r = -1.88170328 * a - 0.80936493 * b > 1
+    is_g = ~is_r & (1.81444104 * a - 1.19445276 * b > 1)
+    S = np.where(is_r,
+                 1.19086277 + 1.76576728 * a + 0.59662641 * b +
+                 0.75515197 * a * a + 0.56771245 * a * b,
+                 np.where(is_g,
+                          0.73956515 - 0.45954404 * a + 0.08285427 * b +
+                          0.12541070 * a * a + 0.14503204 * a * b,
+                          1.35733652 - 0.00915799 * a - 1.15130210 * b -
+                          0.50559606 * a * a + 0.00692167 * a * b))
+    w = _RGB_FROM_LMS[np.where(is_r, 0, np.where(is_g, 1, 2))]
+    one = np.ones_like(h)
+    for _ in range(8):
+        f, f1, f2 = _gamut_channel(w, one, S, k)
+        S = S - f * f1 / (f1 * f1 - 0.5 * f * f2)
+    rgb_max = np.max([_gamut_channel(w_c, one, S, k)[0]
+                      for w_c in _RGB_FROM_LMS], axis=0)
+    L_cusp = np.power(1.0 / rgb_max, 1.0 / 3.0)
+    return L_cusp, L_cusp * S
+
+def _gamut_crossing(w: np.ndarray, L: np.ndarray, C_est: np.ndarray,
+                    C_max: np.ndarray, k: np.ndarray) -> np.ndarray:
+    A = 3.0 * (k ** 3 @ w)
+    B = 6.0 * L * (k ** 2 @ w)
+    D = 3.0 * L * L * (k @ w)
+    disc = B * B - 4.0 * A * D
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sq = np.sqrt(np.maximum(disc, 0.0))
+        t0 = np.where(A != 0.0, (-B - sq) / (2.0 * A), -D / B)
+        t1 = np.where(A != 0.0, (-B + sq) / (2.0 * A), np.nan)
+    has_turns = np.where(A != 0.0, disc >= 0.0, B != 0.0)
+    turns = []
+    for t in (np.minimum(t0, t1), np.maximum(t0, t1)):
+        turns.append(np.where(has_turns & (0.0 < t) & (t < C_max), t, np.nan))
+    # Find the first monotonic piece at whose end the channel is outside
+    # [0, 1].
+    found = np.zeros(L.shape, dtype=bool)
+    prev = np.zeros_like(L)
+    lo = np.zeros_like(L)
+    hi = C_max.copy()
+    f_hi = np.zeros_like(L)
+    target = np.zeros_like(L)
+    for end in turns + [C_max]:
+        ok = ~found & ~np.isnan(end)
+        f = _gamut_channel(w, L, np.where(ok, end, 0.0), k)[0]
+        out = ok & ((f < 0.0) | (f > 1.0))
+        lo = np.where(out, prev, lo)
+        hi = np.where(out, end, hi)
+        f_hi = np.where(out, f, f_hi)
+        target = np.where(out & (f > 1.0), 1.0, target)
+        found |= out
+        prev = np.where(ok, end, prev)
+    hi_neg = f_hi - target < 0.0
+    C = np.where((lo < C_est) & (C_est < hi), C_est, 0.5 * (lo + hi))
+    active = found.copy()
+    for _ in range(64):
+        if not active.any():
+            break
+        f, f1, f2 = _gamut_channel(w, L, C, k)
+        f -= target
+        to_hi = (f < 0.0) == hi_neg
+        hi = np.where(active & to_hi, C, hi)
+        lo = np.where(active & ~to_hi, C, lo)
+        denom = f1 * f1 - 0.5 * f * f2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            C_next = C - f * f1 / denom
+        bad = (denom == 0.0) | ~((lo <= C_next) & (C_next <= hi))
+        C_next = np.where(bad, 0.5 * (lo + hi), C_next)
+        done = (np.abs(C_next - C) <= 1e-14) | (hi - lo <= 1e-14)
+        C = np.where(active, C_next, C)
+        active &= ~done
+    return np.where(found, C, C_max)
+
+def max_chroma(L: np.ndarray, h: np.ndarray) -> np.ndarray:
+    """Returns, for each pair of lightness and hue in the broadcast arrays L
+    and h, the maximum chroma C such that every color with that lightness and
+    hue and chroma at most C is in gamut."""
+    L, h = np.broadcast_arrays(np.asarray(L, dtype=np.float64),
+                               np.asarray(h, dtype=np.float64))
+    L_cusp, C_cusp = gamut_cusp(h)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        C_est = np.where(L <= L_cusp, C_cusp * L / L_cusp,
+                         C_cusp * (1.0 - L) / (1.0 - L_cusp))
+    k = _lms_per_chroma(h)
+    # No sRGB color has a chroma above 0.33.
+    C_max = np.full(L.shape, 0.5)
+    for w in _RGB_FROM_LMS:
+        C_max = _gamut_crossing(w, L, C_est, C_max, k)
+    return np.where((0.0 < L) & (L < 1.0), C_max, 0.0)
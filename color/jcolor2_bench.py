@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+"""Benchmarks for jcolor2.
+
+Times the color math and the rendering of each color scheme, prints the
+results, and optionally saves them as a JSON baseline or compares them against
+one, exiting with status 1 if any benchmark is slower than its baseline by more
+than a threshold:
+
+    ./jcolor2_bench.py --save baseline.json
+    (change things)
+    ./jcolor2_bench.py --compare baseline.json --threshold 0.2"""
+
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import timeit
+from collections.abc import Callable
+
+import jcolor2
+
+# Benchmarks by name. Each function sets up a benchmark and returns a function
+# that runs it and the number of operations that one run performs.
+BENCHMARKS: dict[str, Callable[[], tuple[Callable[[], object], int]]] = {}
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+def _random_rgb(n: int) -> list[jcolor2.RGBColor]:
+    rng = random.Random(n)
+    return [jcolor2.RGBColor(rng.random(), rng.random(), rng.random())
+            for _ in range(n)]
+
+def _random_rgb_array(n: int):
+    import numpy as np
+    return np.random.default_rng(n).random((n, 3))
+
+###############################################################################
+# Color models
+###############################################################################
+
+@benchmark("RGBColor.to_oklab")
+def _():
+    colors = _random_rgb(1000)
+    def run():
+        for c in colors:
+            c.to_oklab()
+    return run, len(colors)
+
+@benchmark("OklabColor.to_rgb")
+def _():
+    colors = [c.to_oklab() for c in _random_rgb(1000)]
+    def run():
+        for c in colors:
+            c.to_rgb()
+    return run, len(colors)
+
+@benchmark("RGBColor.to_oklab.8b")
+def _():
+    # 8-bit colors, as most colors are given.
+    rng = random.Random(0)
+    colors = [jcolor2.RGBColor.from_8b(rng.randrange(256), rng.randrange(256),
+                                       rng.randrange(256))
+              for _ in range(1000)]
+    def run():
+        for c in colors:
+            c.to_oklab()
+    return run, len(colors)
+
+@benchmark("OklabColor.to_8b")
+def _():
+    colors = [c.to_oklab() for c in _random_rgb(1000)]
+    def run():
+        for c in colors:
+            c.to_8b()
+    return run, len(colors)
+
+@benchmark("OklchColor.to_oklab")
+def _():
+    rng = random.Random(0)
+    colors = [jcolor2.OklchColor(rng.random(), 0.3 * rng.random(),
+                                 360.0 * rng.random()) for _ in range(1000)]
+    def run():
+        for c in colors:
+            c.to_oklab()
+    return run, len(colors)
+
+@benchmark("batch.oklab_from_rgb")
+def _():
+    import jcolor2_batch
+    rgb = _random_rgb_array(100000)
+    return lambda: jcolor2_batch.oklab_from_rgb(rgb), len(rgb)
+
+@benchmark("batch.rgb_from_oklch")
+def _():
+    import jcolor2_batch
+    lch = jcolor2_batch.oklch_from_rgb(_random_rgb_array(100000))
+    return lambda: jcolor2_batch.rgb_from_oklch(lch), len(lch)
+
+###############################################################################
+# Color systems and selection
+###############################################################################
+
+@benchmark("term256_code")
+def _():
+    colors = _random_rgb(1000)
+    jcolor2.term256_code(colors[0])
+    def run():
+        for c in colors:
+            jcolor2.term256_code(c)
+    return run, len(colors)
+
+@benchmark("term_index.nearest_batch")
+def _():
+    rgb = _random_rgb_array(10000)
+    index = jcolor2.term_index()
+    return lambda: index.nearest_batch(rgb), len(rgb)
+
+@benchmark("term256_code.ciede2000")
+def _():
+    colors = _random_rgb(1000)
+    jcolor2.term256_code(colors[0], "ciede2000")
+    def run():
+        for c in colors:
+            jcolor2.term256_code(c, "ciede2000")
+    return run, len(colors)
+
+@benchmark("term_index.nearest_batch.ciede2000")
+def _():
+    rgb = _random_rgb_array(10000)
+    index = jcolor2.term_index(metric="ciede2000")
+    return lambda: index.nearest_batch(rgb), len(rgb)
+
+@benchmark("term_index.nearest_batch.oklch")
+def _():
+    rgb = _random_rgb_array(10000)
+    index = jcolor2.term_index(metric="oklch")
+    return lambda: index.nearest_batch(rgb), len(rgb)
+
+@benchmark("saturate")
+def _():
+    hues = list(range(0, 360, 5))
+    def run():
+        for h in hues:
+            jcolor2.saturate(0.72, h)
+    return run, len(hues)
+
+@benchmark("saturate.cold")
+def _():
+    # At hues between those in the table of gamut cusps.
+    rng = random.Random(0)
+    hues = [360.0 * rng.random() for _ in range(72)]
+    def run():
+        for h in hues:
+            jcolor2.saturate(0.72, h)
+    return run, len(hues)
+
+@benchmark("contrast")
+def _():
+    colors = list(jcolor2.palette.values())
+    pairs = [(fg, bg) for fg in colors for bg in colors]
+    def run():
+        for fg, bg in pairs:
+            jcolor2.contrast(fg, bg)
+    return run, len(pairs)
+
+@benchmark("ContrastMatrix")
+def _():
+    import jcolor2_audit
+    colors = jcolor2_audit.audit_colors()
+    return lambda: jcolor2_audit.ContrastMatrix(colors), len(colors) ** 2
+
+@benchmark("colormap.gradient")
+def _():
+    import jcolor2_colormap
+    colors = [jcolor2.palette[name] for name in ("black_dark", "blue", "white")]
+    n = 4096
+    return lambda: jcolor2_colormap.gradient(colors, n), n
+
+###############################################################################
+# Color schemes
+###############################################################################
+
+def _render(subcmd: str):
+    script = os.path.join(os.path.dirname(os.path.abspath(jcolor2.__file__)),
+                          "jcolor2.py")
+    def run():
+        subprocess.run([sys.executable, script, subcmd], check=True,
+                       stdout=subprocess.DEVNULL)
+    return run, 1
+
+@benchmark("render.vim")
+def _():
+    return _render("vim")
+
+@benchmark("render.vim-airline")
+def _():
+    return _render("vim-airline")
+
+@benchmark("render.all")
+def _():
+    # In process, from the palette.
+    import jcolor2_render
+    jcolor2.palette
+    def run():
+        table = jcolor2_render.ColorTable()
+        for name in jcolor2_render.targets:
+            jcolor2_render.render_to_string(name, table)
+    return run, 1
+
+###############################################################################
+# Driver
+###############################################################################
+
+def run_benchmark(name: str, repeat: int) -> float:
+    """Returns the best time per operation of the named benchmark, in
+    seconds."""
+    fn, ops = BENCHMARKS[name]()
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number / ops
+
+def format_time(t: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if t >= scale:
+            return f"{t / scale:.3g} {unit}"
+    return f"{t / 1e-9:.3g} ns"
+
+if __name__ == "__main__":
+    argp = argparse.ArgumentParser(description="Benchmark jcolor2.")
+    argp.add_argument("-k", "--filter", default="",
+                      help="only run benchmarks whose names match this regex")
+    argp.add_argument("-r", "--repeat", type=int, default=5,
+                      help="timing repetitions per benchmark; defaults to 5")
+    argp.add_argument("--save", metavar="PATH",
+                      help="save results as a JSON baseline")
+    argp.add_argument("--compare", metavar="PATH",
+                      help="compare results against a JSON baseline")
+    argp.add_argument("--threshold", type=float, default=0.2,
+                      help="fail if slower than the baseline by more than "
+                           "this fraction; defaults to 0.2")
+    args = argp.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    regressions = []
+    name_re = re.compile(args.filter)
+    for name in BENCHMARKS:
+        if not name_re.search(name):
+            continue
+        try:
+            t = run_benchmark(name, args.repeat)
+        except ImportError as e:
+            print(f"{name:<28} skipped ({e})")
+            continue
+        results[name] = t
+        line = f"{name:<28} {format_time(t):>10}/op"
+        if name in baseline:
+            change = t / baseline[name] - 1.0
+            line += f" {change:+7.1%}"
+            if change > args.threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": sys.version, "results": results}, f,
+                      indent=2, sort_keys=True)
+            f.write("\n")
+    if regressions:
+        print(f"Error: {len(regressions)} benchmark(s) regressed by more than "
+              f"{args.threshold:.0%}: {', '.join(regressions)}",
+              file=sys.stderr)
+        exit(1)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Client of the jcolor2 color daemon (see jcolor2_serve).
+
+Sends requests to the daemon listening on the socket given by --socket,
+$JCOLOR2_SOCKET, or default_socket_path(), and prints its responses. If no
+daemon is listening, computes them in-process instead, as slowly as running
+jcolor2.py would. This module only imports jcolor2 in that case, so that a
+query answered by the daemon costs little more than starting Python.
+
+    ./jcolor2_client.py term256 '#5f87af'
+    printf 'rgb red\ncontrast white black\n' | ./jcolor2_client.py
+
+With a request on the command line, prints its results, or an error to
+standard error. Otherwise, reads requests from standard input, one per line,
+and prints one response per line, as the daemon sends them."""
+
+import os
+import socket
+import sys
+import threading
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "jcolor2.sock")
+    return f"/tmp/jcolor2-{os.getuid()}.sock"
+
+def socket_path() -> str:
+    return os.environ.get("JCOLOR2_SOCKET") or default_socket_path()
+
+def connect(path: str | None = None) -> socket.socket | None:
+    """Returns a socket connected to the daemon, or None if none is
+    listening."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path or socket_path())
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+def _send(sock: socket.socket, data: bytes) -> None:
+    try:
+        sock.sendall(data)
+        sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        # The daemon went away; reading the responses notices.
+        pass
+
+def query(requests: list[str], path: str | None = None) -> list[str]:
+    """Returns the daemon's responses to requests, pipelined on one
+    connection, or the responses computed in-process if no daemon is
+    listening."""
+    sock = connect(path)
+    if sock is None:
+        import jcolor2_serve
+        return [jcolor2_serve.respond(r) for r in requests]
+    with sock:
+        # Send from another thread, so that neither side blocks writing
+        # while the other does too.
+        writer = threading.Thread(
+                target=_send, daemon=True,
+                args=(sock, "".join(r + "\n" for r in requests).encode()))
+        writer.start()
+        chunks = []
+        while True:
+            data = sock.recv(1 << 16)
+            if not data:
+                break
+            chunks.append(data)
+        writer.join()
+    responses = b"".join(chunks).decode().split("\n")[:-1]
+    if len(responses) != len(requests):
+        raise ConnectionError("the daemon closed the connection early")
+    return responses
+
+def main() -> None:
+    import argparse
+    argp = argparse.ArgumentParser(
+            description="Query the jcolor2 color daemon.")
+    argp.add_argument("--socket", metavar="PATH",
+                      help="daemon socket; defaults to $JCOLOR2_SOCKET or "
+                           f"{default_socket_path()}")
+    argp.add_argument("request", nargs=argparse.REMAINDER,
+                      help="request; if none, reads requests from standard "
+                           "input")
+    args = argp.parse_args()
+    try:
+        if args.request:
+            (response,) = query([" ".join(args.request)], args.socket)
+        else:
+            requests = sys.stdin.read().splitlines()
+            sys.stdout.write("".join(r + "\n"
+                                     for r in query(requests, args.socket)))
+            return
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        exit(1)
+    status, _, results = response.partition(" ")
+    if status != "ok":
+        print(f"Error: {results}", file=sys.stderr)
+        exit(1)
+    print(results)
+
+if __name__ == "__main__":
+    main()
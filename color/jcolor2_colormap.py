@@ -0,0 +1,190 @@
+"""Perceptually uniform colormaps for plots, e.g. in LaTeX documents.
+
+A gradient runs through given colors, e.g. palette colors, interpolating
+lightness, chroma and hue in Oklch. A cyclic map runs through all hues at a
+constant lightness and chroma. Colors are mapped into gamut as
+jcolor2.saturate() does, reducing chroma at constant lightness and hue, and
+then spaced evenly by perceptual distance, so that equal steps of data look
+like equal steps of color. All stops are computed at once with
+jcolor2_batch, so thousands of stops take little longer than a few.
+Requires NumPy.
+
+Colormaps are written as pgfplots colormap definitions, CSV, or raw
+little-endian float32 sRGB triples. E.g., for a paper's graphs:
+
+    ./jcolor2.py colormap gradient black_dark blue yellow -n 1024 \\
+        -o graphs/colormap.tex
+    \\input{graphs/colormap.tex}
+    \\begin{axis}[colormap name=jcolor2-gradient] ..."""
+
+import sys
+
+import numpy as np
+
+import jcolor2
+import jcolor2_batch
+
+# Samples of a colormap's curve from which its stops are spaced evenly: a
+# multiple of the number of stops, up to a limit beyond which more samples
+# don't change the spacing noticeably.
+_OVERSAMPLE = 8
+_MAX_SAMPLES = 1 << 13
+
+###############################################################################
+# Colormaps
+###############################################################################
+
+def _gamut_mapped(lch: np.ndarray) -> np.ndarray:
+    # Reduces the chroma of out-of-gamut colors, as jcolor2.saturate().
+    lch = lch.copy()
+    lch[:, 1] = np.minimum(lch[:, 1],
+                           jcolor2_batch.max_chroma(lch[:, 0], lch[:, 2]))
+    return lch
+
+def _evenly_spaced(curve, n: int, cyclic: bool = False,
+                   knots: np.ndarray | None = None) -> np.ndarray:
+    # Returns n Oklch colors of curve(t) for t in [0, 1], spaced evenly by
+    # Oklab distance. For cyclic curves, where curve(1) is curve(0), the last
+    # stop is one step short of 1. The curve is sampled at knots, where it
+    # may bend sharply, and evenly in between.
+    t = np.linspace(0.0, 1.0, min(n * _OVERSAMPLE, _MAX_SAMPLES) + 1)
+    if knots is not None:
+        t = np.union1d(t, knots)
+    lab = jcolor2_batch.oklab_from_oklch(curve(t))
+    steps = np.sqrt((np.diff(lab, axis=0) ** 2).sum(axis=1))
+    dist = np.concatenate([[0.0], np.cumsum(steps)])
+    targets = np.linspace(0.0, dist[-1], n + 1 if cyclic else n)
+    if cyclic:
+        targets = targets[:-1]
+    return curve(np.interp(targets, dist, t))
+
+def gradient(colors: list[jcolor2.RGBColor], n: int) -> np.ndarray:
+    """Returns an (n, 3) array of the sRGB colors of a gradient through
+    colors, at least two, in order."""
+    if len(colors) < 2:
+        raise ValueError("a gradient needs at least two colors")
+    anchors = jcolor2_batch.oklch_from_rgb(jcolor2_batch.rgb_array(colors))
+    # Greys have no hue; take it from the nearest colorful neighbor, so that
+    # e.g. a gradient from black to blue stays blue.
+    grey = anchors[:, 1] < 1e-4
+    if not grey.all():
+        colorful = np.flatnonzero(~grey)
+        nearest = colorful[np.abs(np.arange(len(anchors))[:, None] -
+                                  colorful[None, :]).argmin(axis=1)]
+        anchors[:, 2] = anchors[nearest, 2]
+    # Interpolate hue the short way around.
+    dh = (np.diff(anchors[:, 2]) + 180.0) % 360.0 - 180.0
+    anchors[1:, 2] = anchors[0, 2] + np.cumsum(dh)
+    knots = np.linspace(0.0, 1.0, len(anchors))
+    def curve(t: np.ndarray) -> np.ndarray:
+        lch = np.stack([np.interp(t, knots, anchors[:, i]) for i in range(3)],
+                       axis=-1)
+        lch[:, 2] %= 360.0
+        return _gamut_mapped(lch)
+    return _to_rgb(_evenly_spaced(curve, n, knots=knots))
+
+def cyclic(n: int, L: float | None = None, C: float | None = None,
+           h: float = 0.0) -> np.ndarray:
+    """Returns an (n, 3) array of the sRGB colors of a cyclic colormap of all
+    hues, starting at h, at lightness L (by default jcolor2.L_seq) and chroma
+    C. C defaults to the highest chroma that is in gamut at every hue;
+    higher chroma is reduced where out of gamut."""
+    if L is None:
+        L = jcolor2.L_seq
+    if C is None:
+        # Sampled finely enough that the minimum is within about 1e-6 of the
+        # true one.
+        C = float(jcolor2_batch.max_chroma(
+                L, np.linspace(0.0, 360.0, 3600, endpoint=False)).min())
+    def curve(t: np.ndarray) -> np.ndarray:
+        return _gamut_mapped(np.stack([np.full_like(t, L), np.full_like(t, C),
+                                       (h + 360.0 * t) % 360.0], axis=-1))
+    return _to_rgb(_evenly_spaced(curve, n, cyclic=True))
+
+def _to_rgb(lch: np.ndarray) -> np.ndarray:
+    # Clip rounding error at the gamut boundary.
+    return np.clip(jcolor2_batch.rgb_from_oklch(lch), 0.0, 1.0)
+
+###############################################################################
+# Output
+###############################################################################
+
+def _format_rows(fmt: str, rgb: np.ndarray) -> str:
+    # One formatting operation for all stops, rather than one per stop.
+    return (fmt * len(rgb)) % tuple(rgb.ravel().tolist())
+
+def to_pgfplots(rgb: np.ndarray, name: str) -> str:
+    """Returns a pgfplots colormap definition, for \\input in a document."""
+    return (f"\\pgfplotsset{{colormap={{{name}}}{{%\n" +
+            _format_rows("rgb=(%.5f,%.5f,%.5f)\n", rgb) + "}}\n")
+
+def to_csv(rgb: np.ndarray) -> str:
+    """Returns CSV with the position in [0, 1] and the sRGB components of each
+    stop."""
+    t = np.linspace(0.0, 1.0, len(rgb))
+    return "t,r,g,b\n" + _format_rows("%.6f,%.6f,%.6f,%.6f\n",
+                                      np.column_stack([t, rgb]))
+
+def to_float32(rgb: np.ndarray) -> bytes:
+    return rgb.astype("<f4").tobytes()
+
+###############################################################################
+# Command line
+###############################################################################
+
+def add_arguments(argp: "argparse.ArgumentParser", subcmd: str) -> None:
+    argp.add_argument("kind", choices=("gradient", "cyclic"))
+    argp.add_argument("colors", nargs="*", metavar="COLOR",
+                      help="colors of a gradient, as palette color names or "
+                           "#rrggbb")
+    argp.add_argument("-n", "--stops", type=int, default=256,
+                      help="number of stops; defaults to 256")
+    argp.add_argument("-f", "--format", choices=("pgfplots", "csv", "float32"),
+                      default="pgfplots",
+                      help="output format; defaults to pgfplots")
+    argp.add_argument("-o", "--output",
+                      help="file to write; defaults to standard output")
+    argp.add_argument("--name",
+                      help="pgfplots colormap name; defaults to jcolor2-KIND")
+    argp.add_argument("-L", "--lightness", type=float,
+                      help="lightness of a cyclic map; defaults to L_seq")
+    argp.add_argument("-C", "--chroma", type=float,
+                      help="chroma of a cyclic map; defaults to the highest "
+                           "in gamut at all hues")
+    argp.add_argument("--hue", type=float, default=0.0,
+                      help="starting hue of a cyclic map; defaults to 0")
+
+def _parse_color(s: str) -> jcolor2.RGBColor:
+    if s in jcolor2.palette:
+        return jcolor2.palette[s]
+    if len(s) == 7 and s.startswith("#"):
+        try:
+            return jcolor2.RGBColor.from_str(s)
+        except ValueError:
+            pass
+    raise ValueError(f"invalid color {s!r}")
+
+def main(args: "argparse.Namespace") -> None:
+    try:
+        if args.stops < 2:
+            raise ValueError("a colormap needs at least two stops")
+        if args.kind == "gradient":
+            rgb = gradient([_parse_color(s) for s in args.colors], args.stops)
+        else:
+            if args.colors:
+                raise ValueError("a cyclic map takes no colors")
+            rgb = cyclic(args.stops, args.lightness, args.chroma, args.hue)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        exit(1)
+    if args.format == "float32":
+        data = to_float32(rgb)
+    elif args.format == "csv":
+        data = to_csv(rgb).encode()
+    else:
+        data = to_pgfplots(rgb, args.name or f"jcolor2-{args.kind}").encode()
+    if args.output:
+        import jcolor2_render
+        jcolor2_render.write_atomic(args.output, data)
+    else:
+        sys.stdout.buffer.write(data)
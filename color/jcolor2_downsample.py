@@ -0,0 +1,165 @@
+"""Rewrites truecolor escape sequences in a byte stream to 256-color ones.
+
+SGR sequences' 38;2;R;G;B and 48;2;R;G;B parameters are replaced by 38;5;N
+and 48;5;N, where N is the nearest color of a terminal palette by a metric,
+by default the perceptually nearest, as found by
+jcolor2.term_index(palette, metric).nearest() or a jcolor2_lut table. All
+other bytes pass through unchanged. Recently used colors are kept in an LRU
+cache, and data without truecolor sequences is copied without being parsed,
+so that filtering e.g. `cat` of a large log costs little more than the copy.
+
+    some-command | ./jcolor2.py downsample"""
+
+import functools
+import os
+import re
+import select
+import sys
+from collections.abc import Callable
+
+import jcolor2
+
+# SGR sequences with a truecolor parameter. The group makes split() return
+# them. It also matches e.g. 58;2, which is passed through, since a simpler
+# pattern is faster to search for.
+_TRUECOLOR_SGR_RE = re.compile(rb"(\x1b\[[0-9;]*8;2;[0-9;]*m)")
+# A prefix of an SGR sequence, which may continue in the next read.
+_PARTIAL_SGR_RE = re.compile(rb"\x1b(?:\[[0-9;]*)?")
+# Longest partial sequence to hold back; longer ones aren't SGR sequences
+# that anything writes.
+_MAX_PARTIAL = 256
+
+class Downsampler(object):
+    """Rewrites a stream given as a sequence of chunks, which may split escape
+    sequences anywhere."""
+
+    def __init__(self, code: Callable[[int, int, int], int],
+                 cache_size: int = 4096):
+        """code returns the color code for 8-bit sRGB components. Up to
+        cache_size of its results are cached."""
+        self._code = functools.lru_cache(maxsize=cache_size)(code)
+        # Streams tend to repeat the same few sequences, so also cache whole
+        # sequences.
+        self._rewrite = functools.lru_cache(maxsize=cache_size)(
+                self._rewrite_uncached)
+        self._pending = b""
+
+    def _rewrite_uncached(self, seq: bytes) -> bytes:
+        params = seq[2:-1].split(b";")
+        out = []
+        i = 0
+        while i < len(params):
+            p = params[i]
+            if p in (b"38", b"48") and i + 1 < len(params):
+                kind = params[i + 1]
+                if kind == b"2" and i + 4 < len(params):
+                    try:
+                        r, g, b = (int(x) for x in params[i + 2:i + 5])
+                    except ValueError:
+                        r = g = b = -1
+                    if 0 <= r <= 255 and 0 <= g <= 255 and 0 <= b <= 255:
+                        out += (p, b"5", b"%d" % self._code(r, g, b))
+                        i += 5
+                        continue
+                elif kind == b"5":
+                    # Don't mistake the color code for a parameter.
+                    out += params[i:i + 3]
+                    i += 3
+                    continue
+            out.append(p)
+            i += 1
+        return b"\x1b[" + b";".join(out) + b"m"
+
+    def feed(self, data: bytes) -> bytes:
+        """Returns the rewritten data, except for a trailing partial escape
+        sequence, which is held back until the next call."""
+        if self._pending:
+            data = self._pending + data
+            self._pending = b""
+        esc = data.rfind(b"\x1b", max(0, len(data) - _MAX_PARTIAL))
+        if esc >= 0 and _PARTIAL_SGR_RE.fullmatch(data, esc):
+            self._pending = data[esc:]
+            data = data[:esc]
+        if b"8;2;" not in data:
+            return data
+        # Faster than sub() with a function, which is called through a match
+        # object per sequence.
+        parts = _TRUECOLOR_SGR_RE.split(data)
+        rewrite = self._rewrite
+        parts[1::2] = [rewrite(seq) for seq in parts[1::2]]
+        return b"".join(parts)
+
+    @property
+    def pending(self) -> bytes:
+        """The data held back by the last call of feed()."""
+        return self._pending
+
+    def finish(self) -> bytes:
+        """Returns any data held back at the end of the stream, or when the
+        rest of it is taking too long to arrive."""
+        data = self._pending
+        self._pending = b""
+        return data
+
+    def cache_info(self) -> "functools._CacheInfo":
+        return self._code.cache_info()
+
+def filter_fd(downsampler: Downsampler, in_fd: int, out,
+              chunk_size: int = 1 << 20, timeout: float = 0.1) -> None:
+    """Rewrites the input file descriptor in_fd to the binary file out until
+    end of file. Output is flushed after each read, so that interactive
+    streams aren't delayed. Data held back as a partial escape sequence, e.g.
+    the ESC of a key press, is written unchanged if no more input arrives
+    within timeout seconds."""
+    while True:
+        if downsampler.pending:
+            readable, _, _ = select.select([in_fd], [], [], timeout)
+            if not readable:
+                out.write(downsampler.finish())
+                out.flush()
+                continue
+        data = os.read(in_fd, chunk_size)
+        if not data:
+            break
+        out.write(downsampler.feed(data))
+        out.flush()
+    out.write(downsampler.finish())
+    out.flush()
+
+def add_arguments(argp: "argparse.ArgumentParser", subcmd: str) -> None:
+    argp.add_argument("--palette", default="240",
+                      choices=("16", "88", "240", "256"),
+                      help="terminal palette; defaults to 240")
+    argp.add_argument("--metric", default="oklab",
+                      choices=tuple(jcolor2.metrics),
+                      help="color-difference metric; defaults to oklab")
+    argp.add_argument("--lut", metavar="PATH",
+                      help="look colors up in this table (see the lut "
+                           "subcommand), which must be current")
+    argp.add_argument("--cache-size", type=int, default=4096,
+                      help="number of recent colors to cache; defaults to "
+                           "4096")
+
+def main(args: "argparse.Namespace") -> None:
+    if args.lut:
+        import jcolor2_lut
+        try:
+            lut = jcolor2_lut.load(args.lut, args.palette, args.metric,
+                                   rebuild=False)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            exit(1)
+        def code(r: int, g: int, b: int) -> int:
+            return lut.code_24((r << 16) | (g << 8) | b)
+    else:
+        index = jcolor2.term_index(args.palette, args.metric)
+        def code(r: int, g: int, b: int) -> int:
+            return index.nearest(jcolor2.RGBColor.from_8b(r, g, b))
+    try:
+        filter_fd(Downsampler(code, args.cache_size), sys.stdin.fileno(),
+                  sys.stdout.buffer)
+    except BrokenPipeError:
+        # E.g. when piped into head. Python would otherwise complain again
+        # when flushing stdout at exit.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        exit(1)
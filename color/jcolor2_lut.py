@@ -0,0 +1,195 @@
+"""Precomputed lookup table from 24-bit sRGB values to terminal color codes.
+
+A table file holds the result of jcolor2.term_index(palette, metric).nearest()
+for every 8-bit sRGB color, i.e. term256_code() for the default "240" palette, so
+that lookups are a single byte read from a memory-mapped file. Building a table
+requires NumPy; reading one doesn't.
+
+File layout:
+- 8 bytes: MAGIC.
+- 4 bytes: length of the JSON header, little-endian.
+- JSON header recording the palette and metric the table was built with.
+- Padding to a multiple of 4096 bytes.
+- 2**24 bytes: the color code for each 24-bit value 0xRRGGBB."""
+
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+
+import jcolor2
+
+MAGIC = b"JC2LUT\r\n"
+VERSION = 1
+_ALIGN = 4096
+_SIZE = 1 << 24
+
+def palette_info(palette: str = "240", metric: str = "oklab") -> dict:
+    """Returns the header describing a table built from the current definition
+    of the given palette and metric, including the metric's parameters. A
+    table is current iff its header is equal to this."""
+    if metric not in jcolor2.metrics:
+        raise ValueError(f"unknown metric {metric!r}")
+    index = jcolor2.term_index(palette)
+    colors = {str(code): str(c) for code, c in zip(index.codes, index.colors)}
+    params = jcolor2.metrics[metric].params()
+    fingerprint = hashlib.sha256(json.dumps(
+            [VERSION, palette, metric, params, colors],
+            sort_keys=True).encode()).hexdigest()
+    return {
+            "version": VERSION,
+            "palette": palette,
+            "metric": metric,
+            "metric_params": params,
+            "colors": colors,
+            "fingerprint": fingerprint,
+    }
+
+def _build_rows(args: tuple[str, str, int, int]) -> bytes:
+    # Computes the codes for red values [r0, r1). Runs in worker processes.
+    import numpy as np
+    palette, metric, r0, r1 = args
+    vals = np.arange(r0 << 16, r1 << 16, dtype=np.uint32)
+    rgb8 = np.stack([(vals >> 16) & 0xff, (vals >> 8) & 0xff, vals & 0xff],
+                    axis=-1)
+    codes = jcolor2.term_index(palette, metric).nearest_batch(rgb8 / 255.0)
+    return codes.astype(np.uint8).tobytes()
+
+def build(path: str, palette: str = "240", metric: str = "oklab",
+          jobs: int | None = None) -> None:
+    """Builds the table for the given palette and metric and writes it to
+    path, using a pool of jobs processes (by default, one per CPU)."""
+    header = json.dumps(palette_info(palette, metric), sort_keys=True).encode()
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % _ALIGN)
+    # Write to a temporary file and rename it into place, so that concurrent
+    # readers never see a partial table.
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".lut-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(prefix)
+            step = 4
+            tasks = [(palette, metric, r, r + step)
+                     for r in range(0, 256, step)]
+            with multiprocessing.Pool(jobs) as pool:
+                # imap() returns results in task order, which is file order.
+                for rows in pool.imap(_build_rows, tasks):
+                    f.write(rows)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+class Term256LUT(object):
+    """A memory-mapped lookup table file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path}: not a lookup table file")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._mm) < len(MAGIC) + 4:
+                raise ValueError(f"{path}: truncated lookup table file")
+            (header_len,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+            header_start = len(MAGIC) + 4
+            self.info = json.loads(
+                    self._mm[header_start:header_start+header_len])
+            if not isinstance(self.info, dict):
+                raise ValueError(f"{path}: invalid lookup table header")
+            self._offset = header_start + header_len
+            self._offset += -self._offset % _ALIGN
+            if len(self._mm) != self._offset + _SIZE:
+                raise ValueError(f"{path}: truncated lookup table file")
+        except BaseException:
+            self._mm.close()
+            raise
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def __enter__(self) -> Term256LUT:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def is_current(self) -> bool:
+        """Returns true if the table was built from the current definition of
+        its palette and metric."""
+        try:
+            return self.info == palette_info(self.info["palette"],
+                                             self.info["metric"])
+        except (KeyError, ValueError):
+            return False
+
+    def code_24(self, val: int) -> int:
+        """Returns the color code for a 24-bit sRGB value 0xRRGGBB."""
+        return self._mm[self._offset + val]
+
+    def code(self, c: jcolor2.RGBColor) -> int:
+        """Returns the color code for c, rounded to 8 bits per component."""
+        r, g, b = c.to_8b()
+        return self._mm[self._offset + ((r << 16) | (g << 8) | b)]
+
+    def codes_24(self, vals) -> "numpy.ndarray":
+        """Returns the color codes for a NumPy array of 24-bit values."""
+        import numpy as np
+        table = np.frombuffer(self._mm, dtype=np.uint8, count=_SIZE,
+                              offset=self._offset)
+        return table[vals]
+
+def load(path: str, palette: str = "240", metric: str = "oklab",
+         rebuild: bool = True, jobs: int | None = None) -> Term256LUT:
+    """Opens the table at path. If it doesn't exist, or wasn't built from the
+    current definition of the given palette and metric, rebuilds it if
+    rebuild is true and raises FileNotFoundError or ValueError otherwise.
+    Raises ValueError if path is some other file, rather than overwriting
+    it."""
+    try:
+        lut = Term256LUT(path)
+    except FileNotFoundError:
+        if not rebuild:
+            raise
+    else:
+        if (lut.info.get("palette") == palette and
+                lut.info.get("metric") == metric and lut.is_current()):
+            return lut
+        lut.close()
+        if not rebuild:
+            raise ValueError(f"{path}: lookup table is out of date")
+    build(path, palette, metric, jobs)
+    return Term256LUT(path)
+
+def add_arguments(argp: "argparse.ArgumentParser", subcmd: str) -> None:
+    argp.add_argument("action", choices=("build", "check"))
+    argp.add_argument("path", help="lookup table file")
+    argp.add_argument("--palette", default="240",
+                      choices=("16", "88", "240", "256"),
+                      help="terminal palette; defaults to 240")
+    argp.add_argument("--metric", default="oklab",
+                      choices=tuple(jcolor2.metrics),
+                      help="color-difference metric; defaults to oklab")
+    argp.add_argument("-j", "--jobs", type=int, default=None,
+                      help="worker processes; defaults to one per CPU")
+
+def main(args: "argparse.Namespace") -> None:
+    if args.action == "build":
+        build(args.path, args.palette, args.metric, args.jobs)
+        return
+    try:
+        with Term256LUT(args.path) as lut:
+            current = lut.is_current()
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        exit(1)
+    if not current:
+        print(f"{args.path}: out of date", file=sys.stderr)
+        exit(1)
+    print(f"{args.path}: up to date")
@@ -0,0 +1,455 @@
+"""Nearest-color search: an index that finds the perceptually closest color of
+a fixed palette, by one of several color-difference metrics.
+
+jcolor2 provides the names defined here and imports this module when one of
+them is first used, so that running jcolor2.py for something that doesn't
+search for colors doesn't compile it. Use them through jcolor2, e.g.
+jcolor2.term_index()."""
+
+import bisect
+import math
+from collections.abc import Iterable, Sequence
+
+import jcolor2
+
+###############################################################################
+# Metrics
+###############################################################################
+
+class Metric(object):
+    """A color-difference metric. Colors are first prepared, converting them to
+    the metric's coordinates and computing whatever the metric needs of each
+    color alone, so that an index prepares its palette only once."""
+
+    name: str
+    # The tolerance within which distances computed by distance() and
+    # distances() may differ.
+    tolerance = 1e-12
+    # Whether distances() costs enough more than Oklab distance that
+    # NearestColorIndex.nearest_batch() should first rule out pairs of colors
+    # by lightness_bounds().
+    prune_batch = False
+
+    def params(self) -> dict:
+        """Returns the parameters the metric was created with, as JSON
+        values."""
+        return {}
+
+    def prepare(self, p: jcolor2.OklabColor) -> tuple:
+        """Returns the prepared coordinates of an Oklab color, starting with
+        its lightness."""
+        raise NotImplementedError
+
+    def distance(self, p: tuple, q: tuple) -> float:
+        """Returns the distance between two prepared colors."""
+        raise NotImplementedError
+
+    def lightness_bound(self, L: float, lo: float, hi: float) -> float:
+        """Returns k such that the distance between a color of lightness L and
+        any color whose lightness is between lo and hi is at least k times
+        their difference in lightness."""
+        return 1.0
+
+    def prepare_batch(self, lab: "numpy.ndarray") -> "numpy.ndarray":
+        """Returns the prepared coordinates of an (N, 3) array of Oklab colors,
+        as an (N, K) array."""
+        raise NotImplementedError
+
+    def distances(self, p: "numpy.ndarray", q: "numpy.ndarray"
+                  ) -> "numpy.ndarray":
+        """Returns the broadcast distances between arrays of prepared colors,
+        e.g. the (N, M) matrix for p of shape (N, 1, K) and q of shape
+        (1, M, K)."""
+        raise NotImplementedError
+
+    def lightness_bounds(self, L: "numpy.ndarray", lo: float, hi: float
+                         ) -> "numpy.ndarray":
+        """Returns lightness_bound() of each of an array of lightnesses."""
+        import numpy as np
+        return np.array([self.lightness_bound(x, lo, hi) for x in L.tolist()])
+
+class OklabMetric(Metric):
+    """Euclidean distance in Oklab, as jcolor2.perc_distance()."""
+
+    name = "oklab"
+
+    def prepare(self, p: jcolor2.OklabColor) -> tuple:
+        return (p.L, p.a, p.b)
+
+    def distance(self, p: tuple, q: tuple) -> float:
+        dL = p[0] - q[0]
+        da = p[1] - q[1]
+        db = p[2] - q[2]
+        return math.sqrt(dL*dL + da*da + db*db)
+
+    def prepare_batch(self, lab: "numpy.ndarray") -> "numpy.ndarray":
+        return lab
+
+    def distances(self, p: "numpy.ndarray", q: "numpy.ndarray"
+                  ) -> "numpy.ndarray":
+        import numpy as np
+        dL = p[..., 0] - q[..., 0]
+        da = p[..., 1] - q[..., 1]
+        db = p[..., 2] - q[..., 2]
+        dist = dL * dL
+        dist += da * da
+        dist += db * db
+        return np.sqrt(dist, out=dist)
+
+class OklchMetric(Metric):
+    """Distance in Oklch with the differences in lightness, chroma and hue
+    scaled by weights. Hue differences are measured as distances, i.e. scaled
+    by chroma, so that hue matters less for greyish colors. The default
+    weights count hue differences twice, and chroma differences half, as
+    much as lightness ones: a color of the right hue but less chroma is a
+    better match than one of a different hue."""
+
+    name = "oklch"
+    tolerance = 1e-9
+
+    def __init__(self, weights: tuple[float, float, float] = (1.0, 0.5, 2.0)):
+        self.weights = weights
+
+    def params(self) -> dict:
+        return {"weights": list(self.weights)}
+
+    def prepare(self, p: jcolor2.OklabColor) -> tuple:
+        return (p.L, p.a, p.b, math.hypot(p.a, p.b))
+
+    def distance(self, p: tuple, q: tuple) -> float:
+        wL, wC, wH = self.weights
+        dL = p[0] - q[0]
+        da = p[1] - q[1]
+        db = p[2] - q[2]
+        dC = p[3] - q[3]
+        dH2 = max(da*da + db*db - dC*dC, 0.0)
+        return math.sqrt(wL*wL*dL*dL + wC*wC*dC*dC + wH*wH*dH2)
+
+    def lightness_bound(self, L: float, lo: float, hi: float) -> float:
+        return self.weights[0]
+
+    def prepare_batch(self, lab: "numpy.ndarray") -> "numpy.ndarray":
+        import numpy as np
+        return np.concatenate(
+                [lab, np.hypot(lab[:, 1], lab[:, 2])[:, None]], axis=1)
+
+    def distances(self, p: "numpy.ndarray", q: "numpy.ndarray"
+                  ) -> "numpy.ndarray":
+        import jcolor2_batch
+        return jcolor2_batch.weighted_oklch_distance(
+                p[..., :3], q[..., :3], self.weights, p[..., 3], q[..., 3])
+
+    def lightness_bounds(self, L: "numpy.ndarray", lo: float, hi: float
+                         ) -> "numpy.ndarray":
+        import numpy as np
+        return np.full(len(L), self.weights[0])
+
+# CIE XYZ (D65) from linear sRGB, and the D65 white point.
+_XYZ_FROM_LINEAR = (
+        (0.4124564, 0.3575761, 0.1804375),
+        (0.2126729, 0.7151522, 0.0721750),
+        (0.0193339, 0.1191920, 0.9503041),
+)
+_XYZ_WHITE = (0.95047, 1.0, 1.08883)
+
+def _cielab_from_oklab(p: jcolor2.OklabColor) -> tuple[float, float, float]:
+    l_ = p.L + 0.3963377774 * p.a + 0.2158037573 * p.b
+    m_ = p.L - 0.1055613458 * p.a - 0.0638541728 * p.b
+    s_ = p.L - 0.0894841775 * p.a - 1.2914855480 * p.b
+    l = l_ * l_ * l_
+    m = m_ * m_ * m_
+    s = s_ * s_ * s_
+    lin = (+4.0767416621 * l - 3.3077115913 * m + 0.2309699292 * s,
+           -1.2684380046 * l + 2.6097574011 * m - 0.3413193965 * s,
+           -0.0041960863 * l - 0.7034186147 * m + 1.7076147010 * s)
+    d = 6.0 / 29.0
+    fx, fy, fz = (
+            t ** (1.0 / 3.0) if t > d * d * d
+            else t / (3.0 * d * d) + 4.0 / 29.0
+            for t in (sum(m * x for m, x in zip(row, lin)) / white
+                      for row, white in zip(_XYZ_FROM_LINEAR, _XYZ_WHITE)))
+    return (116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz))
+
+def _ciede2000_lightness_weight(L: float) -> float:
+    # S_L of CIEDE2000 at mean lightness L.
+    L50 = (L - 50.0) ** 2
+    return 1.0 + 0.015 * L50 / math.sqrt(20.0 + L50)
+
+class CIEDE2000Metric(Metric):
+    """The CIEDE2000 color difference, in CIELAB (D65)."""
+
+    name = "ciede2000"
+    tolerance = 1e-9
+    prune_batch = True
+
+    def prepare(self, p: jcolor2.OklabColor) -> tuple:
+        L, a, b = _cielab_from_oklab(p)
+        return (L, a, b, math.hypot(a, b))
+
+    def distance(self, p: tuple, q: tuple) -> float:
+        # As jcolor2_batch.ciede2000().
+        L1, a1, b1, C1 = p
+        L2, a2, b2, C2 = q
+        C7 = ((C1 + C2) * 0.5) ** 7
+        G = 0.5 * (1.0 - math.sqrt(C7 / (C7 + 25.0 ** 7)))
+        a1p = (1.0 + G) * a1
+        a2p = (1.0 + G) * a2
+        C1p = math.hypot(a1p, b1)
+        C2p = math.hypot(a2p, b2)
+        h1p = math.degrees(math.atan2(b1, a1p)) % 360.0
+        h2p = math.degrees(math.atan2(b2, a2p)) % 360.0
+        CCp = C1p * C2p
+        hsum = h1p + h2p
+        if CCp == 0.0:
+            dhp = 0.0
+            hbp = hsum
+        else:
+            dhp = h2p - h1p
+            if dhp > 180.0:
+                dhp -= 360.0
+            elif dhp < -180.0:
+                dhp += 360.0
+            if abs(h1p - h2p) <= 180.0:
+                hbp = hsum * 0.5
+            elif hsum < 360.0:
+                hbp = (hsum + 360.0) * 0.5
+            else:
+                hbp = (hsum - 360.0) * 0.5
+        dLp = L2 - L1
+        dCp = C2p - C1p
+        dHp = 2.0 * math.sqrt(CCp) * math.sin(math.radians(dhp * 0.5))
+        Cbp = (C1p + C2p) * 0.5
+        T = (1.0 - 0.17 * math.cos(math.radians(hbp - 30.0)) +
+             0.24 * math.cos(math.radians(2.0 * hbp)) +
+             0.32 * math.cos(math.radians(3.0 * hbp + 6.0)) -
+             0.20 * math.cos(math.radians(4.0 * hbp - 63.0)))
+        dtheta = 30.0 * math.exp(-((hbp - 275.0) / 25.0) ** 2)
+        Cbp7 = Cbp ** 7
+        RC = 2.0 * math.sqrt(Cbp7 / (Cbp7 + 25.0 ** 7))
+        SL = _ciede2000_lightness_weight((L1 + L2) * 0.5)
+        SC = 1.0 + 0.045 * Cbp
+        SH = 1.0 + 0.015 * Cbp * T
+        RT = -math.sin(math.radians(2.0 * dtheta)) * RC
+        dL = dLp / SL
+        dC = dCp / SC
+        dH = dHp / SH
+        return math.sqrt(dL*dL + dC*dC + dH*dH + RT*dC*dH)
+
+    def lightness_bound(self, L: float, lo: float, hi: float) -> float:
+        # |RT| <= 2, so the chroma and hue terms are never negative, and the
+        # difference is at least the lightness term, which is smallest where
+        # S_L is largest, i.e. at the mean lightness farthest from 50.
+        farthest = max(abs(L - 50.0), abs(lo - 50.0), abs(hi - 50.0))
+        return 1.0 / _ciede2000_lightness_weight(50.0 + farthest)
+
+    def prepare_batch(self, lab: "numpy.ndarray") -> "numpy.ndarray":
+        import numpy as np
+        import jcolor2_batch
+        cielab = jcolor2_batch.cielab_from_linear(
+                jcolor2_batch.linear_from_oklab(lab))
+        return np.concatenate(
+                [cielab, np.hypot(cielab[:, 1], cielab[:, 2])[:, None]],
+                axis=1)
+
+    def distances(self, p: "numpy.ndarray", q: "numpy.ndarray"
+                  ) -> "numpy.ndarray":
+        import jcolor2_batch
+        return jcolor2_batch.ciede2000(p[..., :3], q[..., :3], p[..., 3],
+                                       q[..., 3])
+
+    def lightness_bounds(self, L: "numpy.ndarray", lo: float, hi: float
+                         ) -> "numpy.ndarray":
+        import numpy as np
+        farthest = np.maximum(np.abs(L - 50.0),
+                              max(abs(lo - 50.0), abs(hi - 50.0)))
+        L50 = farthest * farthest
+        return 1.0 / (1.0 + 0.015 * L50 / np.sqrt(20.0 + L50))
+
+# Metrics by name.
+metrics: dict[str, Metric] = {
+        m.name: m for m in (OklabMetric(), OklchMetric(), CIEDE2000Metric())}
+
+###############################################################################
+# Nearest-color index
+###############################################################################
+
+class NearestColorIndex(object):
+    """Finds the color in a fixed palette that is perceptually closest to a
+    given color by the named metric, one of metrics. Ties are broken in favor
+    of the lowest code, so results are identical to a linear scan with the
+    metric's distance(), e.g. jcolor2.perc_distance() for "oklab".
+
+    For "oklab", searches a k-d tree over the palette's Oklab coordinates.
+    Other metrics scan the palette's prepared colors in order of their
+    difference in lightness from the given color, stopping once the metric's
+    lightness_bound() shows that no remaining color can be closer."""
+
+    _LEAF_SIZE = 8
+
+    def __init__(self, colors: Sequence[jcolor2.RGBColor],
+                 codes: Iterable[int] | None = None, metric: str = "oklab"):
+        self.colors = jcolor2.ColorArray.from_colors(colors, jcolor2.RGBColor)
+        self.codes = (list(codes) if codes is not None
+                      else list(range(len(self.colors))))
+        if len(self.codes) != len(self.colors):
+            raise ValueError("colors and codes differ in length")
+        if not self.colors:
+            raise ValueError("empty palette")
+        if metric not in metrics:
+            raise ValueError(f"unknown metric {metric!r}")
+        self.metric = metrics[metric]
+        self.perc = jcolor2.ColorArray.from_colors(
+                (c.to_oklab() for c in self.colors), jcolor2.OklabColor)
+        if metric == "oklab":
+            self._root = self._build([(p.L, p.a, p.b, code)
+                                      for p, code in zip(self.perc, self.codes)])
+        else:
+            self._root = None
+            # (prepared color, code), ordered by lightness.
+            self._points = sorted(
+                    ((self.metric.prepare(p), code)
+                     for p, code in zip(self.perc, self.codes)),
+                    key=lambda pc: pc[0][0])
+            self._lightness = [pc[0][0] for pc in self._points]
+
+    @classmethod
+    def _build(cls, points: list) -> list | tuple:
+        # Leaves are lists of (L, a, b, code); inner nodes are tuples of
+        # (axis, split, left, right), splitting on the axis of widest spread.
+        if len(points) <= cls._LEAF_SIZE:
+            return points
+        axis = max(range(3), key=lambda i: max(p[i] for p in points) -
+                                           min(p[i] for p in points))
+        points.sort(key=lambda p: p[axis])
+        mid = len(points) // 2
+        return (axis, points[mid][axis],
+                cls._build(points[:mid]), cls._build(points[mid:]))
+
+    def nearest(self, c: jcolor2.RGBColor) -> int:
+        """Returns the code of the palette color closest to c."""
+        return self.nearest_oklab(c.to_oklab())
+
+    def nearest_oklab(self, p: jcolor2.OklabColor) -> int:
+        """Returns the code of the palette color closest to the Oklab color
+        p."""
+        if self._root is None:
+            return self._scan(self.metric.prepare(p))
+        best = [math.inf, -1]
+        self._search(self._root, p.L, p.a, p.b, best)
+        return best[1]
+
+    def _scan(self, q: tuple) -> int:
+        points = self._points
+        lightness = self._lightness
+        distance = self.metric.distance
+        L = q[0]
+        k = self.metric.lightness_bound(L, lightness[0], lightness[-1])
+        hi = bisect.bisect_left(lightness, L)
+        lo = hi - 1
+        best = math.inf
+        best_code = -1
+        while lo >= 0 or hi < len(points):
+            # Visit the nearer in lightness of the next colors on either side,
+            # so that once it's too far, so are all the others.
+            if hi < len(points) and (lo < 0 or
+                                     lightness[hi] - L <= L - lightness[lo]):
+                i = hi
+                hi += 1
+            else:
+                i = lo
+                lo -= 1
+            if k * abs(lightness[i] - L) > best:
+                break
+            p, code = points[i]
+            dist = distance(q, p)
+            if dist < best or (dist == best and code < best_code):
+                best = dist
+                best_code = code
+        return best_code
+
+    @classmethod
+    def _search(cls, node: list | tuple, L: float, a: float, b: float,
+                best: list) -> None:
+        if type(node) is list:
+            for pL, pa, pb, code in node:
+                dL = L - pL
+                da = a - pa
+                db = b - pb
+                # Same expression as jcolor2.perc_distance(), so that ties
+                # compare equal in exactly the same cases.
+                dist = math.sqrt(dL*dL + da*da + db*db)
+                if dist < best[0] or (dist == best[0] and code < best[1]):
+                    best[0] = dist
+                    best[1] = code
+            return
+        axis, split, left, right = node
+        diff = (L, a, b)[axis] - split
+        if diff < 0:
+            cls._search(left, L, a, b, best)
+            if -diff <= best[0]:
+                cls._search(right, L, a, b, best)
+        else:
+            cls._search(right, L, a, b, best)
+            if diff <= best[0]:
+                cls._search(left, L, a, b, best)
+
+    def nearest_batch(self, rgb) -> "numpy.ndarray":
+        """Returns the codes of the palette colors closest to each color in
+        rgb, an (N, 3) NumPy array of sRGB colors. Requires NumPy."""
+        import numpy as np
+        import jcolor2_batch
+        rgb_flat = np.asarray(rgb, dtype=np.float64).reshape(-1, 3)
+        lab = jcolor2_batch.oklab_from_rgb(rgb_flat)
+        # np.argmin() returns the first minimum, so order the palette by code
+        # to break ties the same way as nearest().
+        order = np.argsort(self.codes, kind="stable")
+        pal_lab = np.asarray(self.perc)[order]
+        pal = self.metric.prepare_batch(pal_lab)
+        prepared = self.metric.prepare_batch(lab)
+        codes = np.asarray(self.codes)[order]
+        out = np.empty(len(lab), dtype=np.intp)
+        # Bound the size of the (chunk, palette) distance matrix.
+        chunk = max(1, (1 << 20) // len(pal))
+        for i in range(0, len(lab), chunk):
+            q = prepared[i:i+chunk]
+            if self.metric.prune_batch:
+                dist = self._pruned_distances(q, pal, lab[i:i+chunk], pal_lab)
+            else:
+                dist = self.metric.distances(q[:, None], pal[None, :])
+            best = np.argmin(dist, axis=1)
+            out[i:i+chunk] = codes[best]
+            # NumPy's pow() can differ from Python's in the last bit, so where
+            # the runner-up is within rounding error of the winner, defer to
+            # the scalar search to get the same answer as nearest().
+            rows = np.arange(len(q))
+            best_dist = dist[rows, best]
+            dist[rows, best] = np.inf
+            close = np.flatnonzero(dist.min(axis=1) - best_dist <
+                                   self.metric.tolerance)
+            for j in close.tolist():
+                out[i+j] = self.nearest(
+                        jcolor2.RGBColor(*rgb_flat[i+j].tolist()))
+        return out.reshape(np.shape(rgb)[:-1])
+
+    def _pruned_distances(self, q: "numpy.ndarray", pal: "numpy.ndarray",
+                          q_lab: "numpy.ndarray", pal_lab: "numpy.ndarray"
+                          ) -> "numpy.ndarray":
+        # Returns the (N, M) matrix of distances between prepared colors q and
+        # pal, with Oklab coordinates q_lab and pal_lab, except that it's
+        # infinite where the metric's lightness_bound() shows that the pair is
+        # farther apart than the nearest. This computes the metric for only a
+        # fraction of the pairs, as _scan() does.
+        import numpy as np
+        # The distance to the color nearest in Oklab, which bounds the
+        # distance to the nearest by the metric.
+        sq = ((q_lab[:, None, :] - pal_lab[None, :, :]) ** 2).sum(axis=-1)
+        upper = self.metric.distances(q, pal[np.argmin(sq, axis=1)])
+        k = self.metric.lightness_bounds(q[:, 0], pal[:, 0].min(),
+                                         pal[:, 0].max())
+        # Keep pairs within the tolerance of the bound, so that nearest_batch()
+        # sees every runner-up that it might need to defer to nearest().
+        rows, cols = np.nonzero(k[:, None] * np.abs(q[:, 0, None] - pal[:, 0])
+                                <= upper[:, None] + self.metric.tolerance)
+        dist = np.full((len(q), len(pal)), np.inf)
+        dist[rows, cols] = self.metric.distances(q[rows], pal[cols])
+        return dist
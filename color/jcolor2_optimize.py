@@ -0,0 +1,236 @@
+"""Search for values of jcolor2's tuning constants.
+
+Candidates vary L_black, L_hue, L_seq, C_seq, dL_dark and delim_hues around
+their current values, on a grid so that nearby candidates are shared. Each is
+evaluated by building its palette and delims with jcolor2's own functions, in
+a pool of worker processes, for:
+- delim_distance: the minimum perceptual distance between two delims;
+- contrast: the minimum contrast of a foreground color against the background
+  it's intended for;
+- cterm_error: the maximum perceptual distance between a color and its
+  term256_code().
+The best candidates are those whose contrast and cterm_error meet the given
+bounds, ordered by delim_distance and then contrast.
+
+Evaluations are saved to an optional checkpoint file, so that an interrupted
+or extended search doesn't evaluate any candidate twice. Candidates are drawn
+from a seeded random number generator, so resuming a search with the same
+arguments continues where it stopped."""
+
+import itertools
+import json
+import multiprocessing
+import random
+import sys
+from collections import namedtuple
+from collections.abc import Iterable
+
+import jcolor2
+
+# Values of the tuning constants.
+Params = namedtuple("Params", ("L_black", "L_hue", "L_seq", "C_seq",
+                               "dL_dark", "delim_hues"))
+
+# The range (lo, hi, step) of each scalar constant.
+ranges = {
+        "L_black": (0.18, 0.30, 0.005),
+        "L_hue": (0.65, 0.80, 0.005),
+        "L_seq": (0.55, 0.70, 0.005),
+        "C_seq": (0.06, 0.14, 0.0025),
+        "dL_dark": (-0.10, -0.02, 0.005),
+}
+
+# Each delim hue varies by up to this many degrees, in steps of
+# DELIM_HUE_STEP.
+DELIM_HUE_RANGE = 20
+DELIM_HUE_STEP = 5
+
+def current_params() -> Params:
+    return Params(jcolor2.L_black, jcolor2.L_hue, jcolor2.L_seq,
+                  jcolor2.C_seq, jcolor2.dL_dark, tuple(jcolor2.delim_hues))
+
+def random_params(rng: random.Random) -> Params:
+    values = {}
+    for name, (lo, hi, step) in ranges.items():
+        # Rounded so that equal grid points compare equal.
+        values[name] = round(lo + step * rng.randint(0, round((hi - lo) / step)),
+                             6)
+    steps = DELIM_HUE_RANGE // DELIM_HUE_STEP
+    values["delim_hues"] = tuple(
+            (h + DELIM_HUE_STEP * rng.randint(-steps, steps)) % 360
+            for h in jcolor2.delim_hues)
+    return Params(**values)
+
+def candidates(seed: int) -> Iterable[Params]:
+    """Yields the current constants, then an endless sequence of random
+    candidates determined by seed."""
+    yield current_params()
+    rng = random.Random(seed)
+    while True:
+        yield random_params(rng)
+
+def evaluate(params: Params) -> dict[str, float]:
+    """Returns the objectives of a candidate. Sets jcolor2's constants to
+    params while it runs, so it must not run concurrently with other users of
+    jcolor2 in the same process."""
+    saved = current_params()
+    try:
+        for name, value in params._asdict().items():
+            setattr(jcolor2, name, value)
+        palette = jcolor2.make_palette()
+        delims = jcolor2.make_delims()
+    finally:
+        for name, value in saved._asdict().items():
+            setattr(jcolor2, name, value)
+    # As rendered, which rounds out-of-gamut colors into gamut.
+    palette = {name: c.clamped() for name, c in palette.items()}
+    delims = [c.clamped() for c in delims]
+    perc = [c.to_oklab() for c in delims]
+    delim_distance = min(jcolor2.perc_distance(p, q)
+                         for p, q in itertools.combinations(perc, 2))
+    # See the usage notes on jcolor2.make_palette().
+    pairs = [(palette[fg], palette["black"])
+             for fg in ("white", "grey", *jcolor2.named_hues)]
+    pairs += [(c, palette["black"]) for c in delims]
+    pairs += [(c, palette["black_dark"]) for name, c in palette.items()
+              if name == "white_dark" or name.endswith(("_weak", "_strong"))]
+    contrast = min(jcolor2.contrast(fg, bg) for fg, bg in pairs)
+    term256_perc = jcolor2.term256_perc
+    cterm_error = max(
+            jcolor2.perc_distance(c.to_oklab(),
+                                  term256_perc[jcolor2.term256_code(c)])
+            for c in (*palette.values(), *delims))
+    return {
+            "delim_distance": delim_distance,
+            "contrast": contrast,
+            "cterm_error": cterm_error,
+    }
+
+def _evaluate(params: Params) -> tuple[Params, dict[str, float]]:
+    # Runs in worker processes.
+    return params, evaluate(params)
+
+def rank(results: dict[Params, dict[str, float]], min_contrast: float,
+         max_cterm_error: float) -> list[tuple[Params, dict[str, float]]]:
+    """Returns the evaluated candidates, best first."""
+    def key(item: tuple[Params, dict[str, float]]) -> tuple:
+        obj = item[1]
+        feasible = (obj["contrast"] >= min_contrast and
+                    obj["cterm_error"] <= max_cterm_error)
+        return (feasible, obj["delim_distance"], obj["contrast"])
+    return sorted(results.items(), key=key, reverse=True)
+
+def load_checkpoint(path: str) -> dict[Params, dict[str, float]]:
+    """Returns the evaluations saved at path, or none if it doesn't exist."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    try:
+        if data["palette_key"] != jcolor2.palette_key():
+            # Evaluated with different constants, from which different
+            # candidates are drawn, or a different definition of the palette.
+            return {}
+        results = {}
+        for entry in data["results"]:
+            params = dict(entry["params"])
+            params["delim_hues"] = tuple(params["delim_hues"])
+            results[Params(**params)] = dict(entry["objectives"])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"{path}: invalid checkpoint file") from e
+    return results
+
+def save_checkpoint(path: str, results: dict[Params, dict[str, float]]
+                    ) -> None:
+    import jcolor2_render
+    jcolor2_render.write_atomic(path, json.dumps({
+            "palette_key": jcolor2.palette_key(),
+            "results": [{"params": params._asdict(), "objectives": obj}
+                        for params, obj in results.items()],
+    }) + "\n")
+
+def search(count: int, seed: int = 0, jobs: int | None = None,
+           checkpoint: str | None = None,
+           results: dict[Params, dict[str, float]] | None = None
+           ) -> dict[Params, dict[str, float]]:
+    """Evaluates the first count distinct candidates(seed) that aren't
+    already in results or the checkpoint file, using a pool of jobs processes
+    (by default, one per CPU), and returns all evaluations. If checkpoint is
+    given, saves progress to it periodically, including when interrupted."""
+    if results is None:
+        results = load_checkpoint(checkpoint) if checkpoint else {}
+    todo = []
+    seen = set()
+    for params in candidates(seed):
+        if len(todo) >= count:
+            break
+        if params not in results and params not in seen:
+            seen.add(params)
+            todo.append(params)
+    if not todo:
+        return results
+    # Save periodically, so that an interrupted search loses little work.
+    save_every = 200
+    try:
+        with multiprocessing.Pool(jobs) as pool:
+            unsaved = 0
+            for params, obj in pool.imap_unordered(_evaluate, todo,
+                                                   chunksize=8):
+                results[params] = obj
+                unsaved += 1
+                if checkpoint and unsaved >= save_every:
+                    save_checkpoint(checkpoint, results)
+                    unsaved = 0
+    finally:
+        if checkpoint:
+            save_checkpoint(checkpoint, results)
+    return results
+
+def _format_params(params: Params) -> str:
+    scalars = " ".join(f"{name}={getattr(params, name):g}" for name in ranges)
+    hues = ",".join(str(h) for h in params.delim_hues)
+    return f"{scalars} delim_hues={hues}"
+
+def _format_objectives(obj: dict[str, float]) -> str:
+    return (f"delim_distance={obj['delim_distance']:.4f} "
+            f"contrast={obj['contrast']:.2f} "
+            f"cterm_error={obj['cterm_error']:.4f}")
+
+def add_arguments(argp: "argparse.ArgumentParser", subcmd: str) -> None:
+    argp.add_argument("-n", "--candidates", type=int, default=1000,
+                      help="number of new candidates to evaluate; defaults "
+                           "to 1000")
+    argp.add_argument("--seed", type=int, default=0,
+                      help="random seed; defaults to 0")
+    argp.add_argument("-j", "--jobs", type=int, default=None,
+                      help="worker processes; defaults to one per CPU")
+    argp.add_argument("--checkpoint", metavar="PATH",
+                      help="file to resume from and save evaluations to")
+    argp.add_argument("--min-contrast", type=float, default=4.5,
+                      help="minimum contrast of foreground colors; defaults "
+                           "to 4.5")
+    argp.add_argument("--max-cterm-error", type=float, default=0.06,
+                      help="maximum distance of a color from its terminal "
+                           "color; defaults to 0.06")
+    argp.add_argument("--top", type=int, default=5,
+                      help="number of candidates to print; defaults to 5")
+
+def main(args: "argparse.Namespace") -> None:
+    try:
+        results = search(args.candidates, args.seed, args.jobs,
+                         args.checkpoint)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        exit(1)
+    current = current_params()
+    if current not in results:
+        results[current] = evaluate(current)
+    print(f"Evaluated {len(results)} candidates")
+    print()
+    print(f"current: {_format_params(current)}")
+    print(f"         {_format_objectives(results[current])}")
+    ranked = rank(results, args.min_contrast, args.max_cterm_error)
+    for i, (params, obj) in enumerate(ranked[:args.top]):
+        print(f"{i + 1:>7}: {_format_params(params)}")
+        print(f"         {_format_objectives(obj)}")
@@ -0,0 +1,287 @@
+"""Quantizes images to a terminal palette.
+
+Reads a PPM (P6) or PAM (P7) image through mmap, a block of rows at a time, so
+that memory use doesn't grow with the image. Each block is mapped to the
+perceptually nearest colors of the palette in batches, as
+jcolor2.term_index(palette).nearest() would map each pixel, optionally with
+Floyd-Steinberg error diffusion in Oklab, which is also batched. The result is
+written as a PPM image of the palette's colors or as ANSI escape sequences that
+draw the image in a terminal, two rows of pixels per line of text. Requires
+NumPy."""
+
+import mmap
+import sys
+from collections.abc import Iterator
+
+import numpy as np
+
+import jcolor2
+import jcolor2_batch
+
+# Pixels per block of rows, bounding memory use. Dithering takes a number of
+# steps per block proportional to its width plus its height, so it uses larger
+# blocks.
+_BLOCK_PIXELS = 1 << 16
+_DITHER_BLOCK_PIXELS = 1 << 20
+
+###############################################################################
+# Input
+###############################################################################
+
+class NetpbmImage(object):
+    """A memory-mapped PPM or PAM image file. PAM images may also be greyscale
+    or have an alpha channel, which is ignored."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic = self._mm[:2]
+            if magic == b"P6":
+                self._parse_ppm_header(path)
+            elif magic == b"P7":
+                self._parse_pam_header(path)
+            else:
+                raise ValueError(f"{path}: not a PPM or PAM image")
+            if not (self.width > 0 and self.height > 0 and
+                    0 < self.maxval < 65536 and self.depth in (1, 2, 3, 4)):
+                raise ValueError(f"{path}: unsupported image format")
+            self._dtype = np.dtype(">u2" if self.maxval > 255 else "u1")
+            row_bytes = self.width * self.depth * self._dtype.itemsize
+            if len(self._mm) < self._offset + self.height * row_bytes:
+                raise ValueError(f"{path}: truncated image")
+        except BaseException:
+            self._mm.close()
+            raise
+
+    def _parse_ppm_header(self, path: str) -> None:
+        # Whitespace-separated width, height and maxval, which may be preceded
+        # by comments, then a single whitespace character.
+        mm = self._mm
+        pos = 2
+        fields = []
+        while len(fields) < 3:
+            while pos < len(mm) and mm[pos:pos+1].isspace():
+                pos += 1
+            if mm[pos:pos+1] == b"#":
+                pos = mm.find(b"\n", pos)
+                if pos < 0:
+                    break
+                continue
+            start = pos
+            while pos < len(mm) and mm[pos:pos+1].isdigit():
+                pos += 1
+            if pos == start:
+                break
+            fields.append(int(mm[start:pos]))
+        if len(fields) < 3 or not mm[pos:pos+1].isspace():
+            raise ValueError(f"{path}: invalid PPM header")
+        self.width, self.height, self.maxval = fields
+        self.depth = 3
+        self._offset = pos + 1
+
+    def _parse_pam_header(self, path: str) -> None:
+        end = self._mm.find(b"\nENDHDR\n")
+        if end < 0:
+            raise ValueError(f"{path}: invalid PAM header")
+        header = {}
+        for line in self._mm[3:end].decode("ascii", "replace").splitlines():
+            words = line.split(None, 1)
+            if words and not words[0].startswith("#"):
+                header[words[0]] = words[1] if len(words) > 1 else ""
+        try:
+            self.width = int(header["WIDTH"])
+            self.height = int(header["HEIGHT"])
+            self.depth = int(header["DEPTH"])
+            self.maxval = int(header["MAXVAL"])
+        except (KeyError, ValueError):
+            raise ValueError(f"{path}: invalid PAM header") from None
+        self._offset = end + len(b"\nENDHDR\n")
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def __enter__(self) -> NetpbmImage:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def rows(self, start: int, stop: int) -> np.ndarray:
+        """Returns rows [start, stop) of the image as a (rows, width, 3) array
+        of sRGB colors."""
+        n = self.width * self.depth
+        raw = np.frombuffer(self._mm, dtype=self._dtype,
+                            count=(stop - start) * n,
+                            offset=self._offset +
+                                   start * n * self._dtype.itemsize)
+        raw = raw.reshape(stop - start, self.width, self.depth)
+        if self.depth <= 2:
+            # Greyscale, possibly with alpha.
+            raw = raw[..., :1].repeat(3, axis=-1)
+        return raw[..., :3] / float(self.maxval)
+
+###############################################################################
+# Quantization
+###############################################################################
+
+def block_rows(width: int, dither: bool = False, even: bool = False) -> int:
+    """Returns the number of rows of an image of the given width to quantize
+    at a time, a multiple of 2 if even is true."""
+    pixels = _DITHER_BLOCK_PIXELS if dither else _BLOCK_PIXELS
+    rows = max(1, pixels // width)
+    if even:
+        rows += rows % 2
+    return rows
+
+def quantize(image: NetpbmImage, palette: str = "240", dither: bool = False,
+             rows: int | None = None) -> Iterator[np.ndarray]:
+    """Yields the color codes of each block of rows of image, as (rows, width)
+    arrays, in order. rows defaults to block_rows(image.width, dither)."""
+    index = jcolor2.term_index(palette)
+    if rows is None:
+        rows = block_rows(image.width, dither)
+    if dither:
+        yield from _quantize_dithered(image, index, rows)
+        return
+    for start in range(0, image.height, rows):
+        rgb = image.rows(start, min(start + rows, image.height))
+        if image.maxval == 255:
+            # Images usually have far fewer distinct colors than pixels.
+            rgb8 = np.rint(rgb * 255.0).astype(np.uint32)
+            vals = (rgb8[..., 0] << 16) | (rgb8[..., 1] << 8) | rgb8[..., 2]
+            uniq, inverse = np.unique(vals, return_inverse=True)
+            uniq_rgb = np.stack([uniq >> 16, (uniq >> 8) & 0xff, uniq & 0xff],
+                                axis=-1) / 255.0
+            codes = index.nearest_batch(uniq_rgb)[inverse]
+            yield codes.reshape(vals.shape)
+        else:
+            yield index.nearest_batch(rgb)
+
+def _quantize_dithered(image: NetpbmImage,
+                       index: "jcolor2.NearestColorIndex",
+                       rows: int) -> Iterator[np.ndarray]:
+    # Floyd-Steinberg error diffusion, in Oklab. Each pixel depends on the
+    # pixel to its left and the three above it, so all pixels (y, x) of a
+    # block with the same 2 * y + x can be quantized at once, a wavefront that
+    # sweeps the block in width + 2 * rows steps.
+    width = image.width
+    # Ordered by code, so that np.argmin() breaks ties like nearest().
+    order = np.argsort(index.codes, kind="stable")
+    pal = np.asarray(index.perc)[order]
+    codes = np.asarray(index.codes)[order]
+    pal_sq = (pal * pal).sum(axis=1)
+    # Error diffused into the first row of the next block.
+    carry = np.zeros((width, 3))
+    for start in range(0, image.height, rows):
+        n = min(rows, image.height - start)
+        # Pixel (y, x) is at work[y, x + 1]; the padding columns and the last
+        # row receive error that leaves the block.
+        work = np.zeros((n + 1, width + 2, 3))
+        work[:n, 1:width + 1] = jcolor2_batch.oklab_from_rgb(
+                image.rows(start, start + n))
+        work[0, 1:width + 1] += carry
+        out = np.empty((n, width), dtype=np.intp)
+        for t in range(width + 2 * (n - 1)):
+            ys = np.arange(max(0, (t - width + 2) // 2), min(n - 1, t // 2) + 1)
+            xs = t - 2 * ys
+            lab = work[ys, xs + 1]
+            # The squared distance, less the pixel's own squared norm, which
+            # doesn't change the nearest color.
+            best = np.argmin(pal_sq - 2.0 * (lab @ pal.T), axis=1)
+            out[ys, xs] = codes[best]
+            err = lab - pal[best]
+            work[ys, xs + 2] += err * (7.0 / 16.0)
+            work[ys + 1, xs] += err * (3.0 / 16.0)
+            work[ys + 1, xs + 1] += err * (5.0 / 16.0)
+            work[ys + 1, xs + 2] += err * (1.0 / 16.0)
+        carry = work[n, 1:width + 1]
+        yield out
+
+###############################################################################
+# Output
+###############################################################################
+
+def palette_rgb8(palette: str = "240") -> np.ndarray:
+    """Returns a (codes, 3) array of the 8-bit sRGB color of each code of the
+    palette, indexed by code."""
+    index = jcolor2.term_index(palette)
+    rgb8 = np.zeros((max(index.codes) + 1, 3), dtype=np.uint8)
+    for code, c in zip(index.codes, index.colors):
+        rgb8[code] = c.to_8b()
+    return rgb8
+
+def write_ppm(out, width: int, height: int, blocks: Iterator[np.ndarray],
+              palette: str = "240") -> None:
+    """Writes blocks of color codes to the binary file out as a PPM image of
+    the palette's colors."""
+    rgb8 = palette_rgb8(palette)
+    out.write(f"P6\n{width} {height}\n255\n".encode())
+    for codes in blocks:
+        out.write(rgb8[codes].tobytes())
+
+def _ansi_line(top: list[int], bottom: list[int] | None) -> str:
+    # Upper half blocks, with the top pixel as the foreground and the bottom
+    # one as the background. Escape sequences are only written when a color
+    # changes.
+    parts = []
+    fg = bg = None
+    for x, t in enumerate(top):
+        b = bottom[x] if bottom is not None else None
+        if t != fg:
+            parts.append(f"\x1b[38;5;{t}m")
+            fg = t
+        if b != bg:
+            parts.append(f"\x1b[48;5;{b}m" if b is not None else "\x1b[49m")
+            bg = b
+        parts.append("▀")
+    parts.append("\x1b[0m\n")
+    return "".join(parts)
+
+def write_ansi(out, blocks: Iterator[np.ndarray]) -> None:
+    """Writes blocks of color codes, each with an even number of rows except
+    perhaps the last, to the binary file out as ANSI escape sequences."""
+    for codes in blocks:
+        rows = codes.tolist()
+        lines = []
+        for y in range(0, len(rows), 2):
+            lines.append(_ansi_line(rows[y],
+                                    rows[y + 1] if y + 1 < len(rows) else None))
+        out.write("".join(lines).encode())
+
+###############################################################################
+# Command line
+###############################################################################
+
+def add_arguments(argp: "argparse.ArgumentParser", subcmd: str) -> None:
+    argp.add_argument("input", help="PPM or PAM image")
+    argp.add_argument("-o", "--output",
+                      help="file to write; defaults to standard output")
+    argp.add_argument("-f", "--format", choices=("ansi", "ppm"),
+                      default="ansi", help="output format; defaults to ansi")
+    argp.add_argument("--palette", default="240",
+                      choices=("16", "88", "240", "256"),
+                      help="terminal palette; defaults to 240")
+    argp.add_argument("-d", "--dither", action="store_true",
+                      help="diffuse quantization error (Floyd-Steinberg)")
+
+def main(args: "argparse.Namespace") -> None:
+    try:
+        image = NetpbmImage(args.input)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        exit(1)
+    with image:
+        blocks = quantize(image, args.palette, args.dither,
+                          block_rows(image.width, args.dither, even=True))
+        out = (open(args.output, "wb") if args.output
+               else sys.stdout.buffer)
+        try:
+            if args.format == "ppm":
+                write_ppm(out, image.width, image.height, blocks,
+                          args.palette)
+            else:
+                write_ansi(out, blocks)
+        finally:
+            if args.output:
+                out.close()
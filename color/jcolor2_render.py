@@ -0,0 +1,457 @@
+"""Renders jcolor2's palette into configuration files for each target program.
+
+The palette is resolved once into a ColorTable of GUI hex strings and terminal
+color codes, which every target then shares. Each target is rendered into a
+string and written atomically. A manifest in jcolor2's cache directory records
+a hash of each target's inputs, so that unchanged targets aren't rewritten."""
+
+import io
+import os
+import sys
+from collections import namedtuple
+from collections.abc import Iterable
+
+import jcolor2
+from jcolor2_stats import phase
+
+# The record types here are collections.namedtuples rather than
+# typing.NamedTuples, whose import and class creation add several milliseconds
+# to the startup of `jcolor2.py vim`.
+
+# A color as written by the renderers: the jcolor2.RGBColor, its GUI hex
+# string and its terminal color code.
+ColorEntry = namedtuple("ColorEntry", ("color", "gui", "cterm"))
+
+class ColorTable(object):
+    """Resolves colors to ColorEntries, computing each color's terminal code
+    only once. The codes of jcolor2's own palette and delims are taken from
+    jcolor2.palette_codes, which is cached along with them."""
+
+    def __init__(self, palette: dict[str, jcolor2.RGBColor] | None = None):
+        self._codes: dict[jcolor2.RGBColor, int]
+        if palette is None:
+            palette = jcolor2.palette
+            self._codes = jcolor2.palette_codes
+        else:
+            self._codes = {}
+        self._entries: dict[jcolor2.RGBColor, ColorEntry] = {}
+        self.named = {name: self.resolve(c) for name, c in palette.items()}
+
+    def resolve(self, c: jcolor2.RGBColor) -> ColorEntry:
+        entry = self._entries.get(c)
+        if entry is None:
+            code = self._codes.get(c)
+            if code is None:
+                code = jcolor2.term256_code(c)
+            entry = ColorEntry(c, str(c), code)
+            self._entries[c] = entry
+        return entry
+
+    def __getitem__(self, name: str) -> ColorEntry:
+        return self.named[name]
+
+###############################################################################
+# Vim
+###############################################################################
+
+# A Vim highlight group, given by the names of its palette colors, each of
+# which may be None.
+Highlight = namedtuple("Highlight", ("group", "fg", "bg", "attrs", "ul"),
+                       defaults=(None, None, None, None))
+
+# Contents of the Vim color scheme after the palette. Strings are copied
+# verbatim as lines.
+vim_highlights: list[Highlight | str] = [
+        Highlight("Normal", "white", "black"),
+        "",
+        "\" From :help E669",
+        Highlight("Comment", "grey"),
+        Highlight("Constant", "blue"),
+        Highlight("Identifier", "white"),
+        Highlight("Statement", "green"),
+        Highlight("PreProc", "purple"),
+        Highlight("Type", "white"),
+        Highlight("Special", "orange"),
+        Highlight("Underlined", attrs="underline"),
+        Highlight("Bold", attrs="bold"),
+        Highlight("Italic", attrs="italic"),
+        Highlight("BoldItalic", attrs="bold,italic"),
+        Highlight("Ignore", "black"),
+        Highlight("Error", "red"),
+        Highlight("Todo", "white"),
+        Highlight("Added", "green"),
+        Highlight("Changed", "blue"),
+        Highlight("Removed", "red"),
+        "",
+        Highlight("ColorColumn", None, "black_dark"),
+        Highlight("Conceal", attrs="italic"),
+        Highlight("CursorColumn", None, "black_light"),
+        Highlight("CursorLine", None, "black_light"),
+        Highlight("CursorLineNr", None, "black_light"),
+        Highlight("Directory", "blue"),
+        Highlight("LineNr", "grey"),
+        Highlight("MatchParen", attrs="bold"),
+        Highlight("NonText", "grey"), # ~ lines after EOF, @ after truncation
+        Highlight("Folded", attrs="italic"),
+        Highlight("FoldColumn", "white"),
+        Highlight("Pmenu", None, "black_dark"),
+        Highlight("PmenuSel", attrs="inverse"),
+        Highlight("Search", "yellow", attrs="inverse"),
+        Highlight("SignColumn", "white"),
+        Highlight("SpecialKey", "grey"), # listchars showing tabs
+        Highlight("SpellBad", attrs="undercurl", ul="red"),
+        Highlight("SpellCap", attrs="undercurl", ul="red"),
+        Highlight("SpellLocal", attrs="undercurl", ul="blue"),
+        Highlight("SpellRare", attrs="undercurl", ul="yellow"),
+        Highlight("StatusLine", "white_dark", "black_dark"),
+        Highlight("VertSplit", "grey", "black_dark"),
+        Highlight("Visual", attrs="inverse"),
+        Highlight("WinSeparator", "grey", "black_dark"),
+        "",
+        Highlight("CtrlPMatch", attrs="inverse"),
+        "",
+        "\" llama.vim",
+        Highlight("llama_hl_fim_hint", "cyan", "black"),
+        Highlight("llama_hl_inst_src", "white", attrs="italic"),
+        Highlight("llama_hl_inst_virt_proc", "grey", attrs="italic"),
+        Highlight("llama_hl_inst_virt_gen", "cyan", attrs="italic"),
+        Highlight("llama_hl_inst_virt_ready", "cyan"),
+]
+
+def render_vim(table: ColorTable, out: io.TextIOBase) -> None:
+    print("""" Generated by `jcolor2.py vim`
+
+highlight clear
+if exists('syntax_on')
+  syntax reset
+endif
+
+let colors_name = 'jcolor2'
+
+if !has('gui_running') && !(has('termguicolors') && &termguicolors) && &t_Co != 256
+  finish
+endif
+
+set background=dark""", file=out)
+    print(file=out)
+    term256_rgb = jcolor2.term256_rgb
+    for name, c in table.named.items():
+        print(f"\" {name}: {c.gui} (cterm={c.cterm} {term256_rgb[c.cterm]})",
+              file=out)
+    print(file=out)
+    for hl in vim_highlights:
+        if isinstance(hl, str):
+            print(hl, file=out)
+            continue
+        if hl.fg:
+            fg_gui = table[hl.fg].gui
+            fg_term = str(table[hl.fg].cterm)
+        else:
+            fg_gui = "NONE"
+            fg_term = "NONE"
+        if hl.bg:
+            bg_gui = table[hl.bg].gui
+            bg_term = str(table[hl.bg].cterm)
+        else:
+            bg_gui = "NONE"
+            bg_term = "NONE"
+        attrs = hl.attrs if hl.attrs is not None else "NONE"
+        if hl.ul:
+            guisp = " guisp=" + table[hl.ul].gui
+            ctermul = " ctermul=" + str(table[hl.ul].cterm)
+        else:
+            guisp = ""
+            ctermul = ""
+        print(f"highlight {hl.group} guifg={fg_gui} guibg={bg_gui}{guisp} gui={attrs} ctermfg={fg_term} ctermbg={bg_term}{ctermul} cterm={attrs}", file=out)
+    rainbow_colors = ",\n".join(
+            f"\\     ['{c.cterm}', '{c.gui}']"
+            for c in map(table.resolve, jcolor2.delims))
+    print("""
+" rainbow_parentheses
+if !exists('g:rainbow#colors')
+  let g:rainbow#colors = {
+\\   'dark': [
+%s
+\\   ],
+\\   'light': [
+%s
+\\   ] }
+endif""" % (rainbow_colors, rainbow_colors), file=out)
+
+def airline_accent_color() -> jcolor2.RGBColor:
+    return jcolor2.OklchColor(jcolor2.L_hue + jcolor2.dL_dark,
+                              jcolor2.C_hue_dark_strong,
+                              jcolor2.named_hues["red"]).to_rgb()
+
+def render_vim_airline(table: ColorTable, out: io.TextIOBase) -> None:
+    black = table["black"]
+    black_dark = table["black_dark"]
+    grey_dark = table["grey_dark"]
+    accent = table.resolve(airline_accent_color())
+    ctrlp = table["bluepurple_dark_strong"]
+    print("""" Generated by `jcolor2.py vim-airline`
+
+let g:airline#themes#jcolor2#palette = {}
+
+let g:airline#themes#jcolor2#palette.accents = {
+\\ 'red': ['%s', '', %d, '', ''],
+\\ }""" % (accent.gui, accent.cterm), file=out)
+    def line(fg: ColorEntry, bg: ColorEntry, attrs: str = "",
+             indent: int = 1) -> str:
+        return f"\\{" " * (indent * 2 - 1)}['{fg.gui}', '{bg.gui}', {fg.cterm}, {bg.cterm}, '{attrs}'],"
+    def pal(p_name: str, c_name: str, indent: int = 0):
+        c = table[c_name]
+        print(f"""
+let g:airline#themes#jcolor2#palette.{p_name} = airline#themes#generate_color_map(
+{line(black_dark, c, indent=indent+1)}
+{line(c, black, indent=indent+1)}
+{line(c, black_dark, indent=indent+1)}
+\\ )""", file=out)
+    def mode(p_name: str, h_name: str):
+        pal(p_name, f"{h_name}_dark_weak")
+        pal(f"{p_name}_modified", f"{h_name}_dark_strong")
+    mode("normal", "greencyan")
+    mode("insert", "yellowgreen")
+    mode("replace", "purplepink")
+    mode("visual", "cyanblue")
+    print(f"""
+let s:IA = ['{grey_dark.gui}', '{black_dark.gui}', {grey_dark.cterm}, {black_dark.cterm}, '']
+let g:airline#themes#jcolor2#palette.inactive = airline#themes#generate_color_map(s:IA, s:IA, s:IA)""", file=out)
+    print(f"""
+if get(g:, 'loaded_ctrlp', 0)
+  let g:airline#themes#jcolor2#palette.ctrlp = airline#extensions#ctrlp#generate_color_map(
+{line(ctrlp, black_dark, "bold", indent=2)}
+{line(ctrlp, black, indent=2)}
+{line(black_dark, ctrlp, indent=2)}
+\\   )
+endif""", file=out)
+
+###############################################################################
+# Terminals and window managers
+###############################################################################
+
+# Palette colors for the 16 ANSI terminal colors, by color code. The palette
+# has no bright hue variants, so codes 9-14 repeat codes 1-6, except that
+# bright magenta is pink.
+ansi_colors = [
+        "black_light", "red", "green", "yellow",
+        "blue", "purple", "cyan", "white_dark",
+        "grey_dark", "red", "green", "yellow",
+        "blue", "pink", "cyan", "white",
+]
+
+def render_xresources(table: ColorTable, out: io.TextIOBase) -> None:
+    print("! Generated by `jcolor2.py render xresources`", file=out)
+    print(file=out)
+    print(f"*background: {table['black'].gui}", file=out)
+    print(f"*foreground: {table['white'].gui}", file=out)
+    print(f"*cursorColor: {table['white'].gui}", file=out)
+    for code, name in enumerate(ansi_colors):
+        print(f"*color{code}: {table[name].gui}", file=out)
+
+def render_tmux(table: ColorTable, out: io.TextIOBase) -> None:
+    # default-terminal is screen-256color, so use terminal color codes, which
+    # tmux passes through as is.
+    def style(fg: str, bg: str | None = None) -> str:
+        s = f"fg=colour{table[fg].cterm}"
+        if bg:
+            s += f",bg=colour{table[bg].cterm}"
+        return f"\"{s}\""
+    print("# Generated by `jcolor2.py render tmux`", file=out)
+    print(file=out)
+    print(f"set -g status-style {style('white_dark', 'black_dark')}", file=out)
+    print(f"set -g window-status-style {style('grey', 'black_dark')}",
+          file=out)
+    print("set -g window-status-current-style "
+          f"{style('black_dark', 'greencyan_dark_weak')}", file=out)
+    print(f"set -g message-style {style('black_dark', 'yellowgreen_dark_weak')}",
+          file=out)
+    print(f"set -g mode-style {style('black_dark', 'cyanblue_dark_weak')}",
+          file=out)
+    print(f"set -g pane-border-style {style('grey_dark')}", file=out)
+    print("set -g pane-active-border-style "
+          f"{style('greencyan_dark_strong')}", file=out)
+
+def render_i3(table: ColorTable, out: io.TextIOBase) -> None:
+    print("# Generated by `jcolor2.py render i3`", file=out)
+    print(file=out)
+    # Variables for use in bar { colors { ... } } blocks, which can't be
+    # included.
+    for name, c in table.named.items():
+        print(f"set $jcolor2_{name} {c.gui}", file=out)
+    print(file=out)
+    def client(cls: str, border: str, bg: str, text: str) -> None:
+        # Border, background, text, indicator and child border.
+        colors = (border, bg, text, border, border)
+        print(f"client.{cls:<17}" + " ".join(table[c].gui for c in colors),
+              file=out)
+    client("focused", "greencyan_dark_weak", "greencyan_dark_weak",
+           "black_dark")
+    client("focused_inactive", "black_light", "black_light", "white_dark")
+    client("unfocused", "black_dark", "black_dark", "grey")
+    client("urgent", "red", "red", "black_dark")
+    print(f"client.background {table['black'].gui}", file=out)
+
+###############################################################################
+# Targets
+###############################################################################
+
+# A renderer taking a ColorTable and a text file; the output path, relative to
+# the home/ directory of this repository; and JSON-serializable data, other
+# than the palette, that determines the output.
+Target = namedtuple("Target", ("render", "path", "inputs"), defaults=(None,))
+
+targets = {
+        "vim": Target(render_vim, ".vim/colors/jcolor2.vim", vim_highlights),
+        "vim-airline": Target(render_vim_airline,
+                              ".vim/autoload/airline/themes/jcolor2.vim"),
+        "xresources": Target(render_xresources, ".config/jcolor2/Xresources",
+                             ansi_colors),
+        "tmux": Target(render_tmux, ".config/jcolor2/tmux.conf"),
+        "i3": Target(render_i3, ".config/jcolor2/i3.conf"),
+}
+
+# Increment this when a change to the renderers changes their output for the
+# same inputs, so that render() rewrites all targets.
+GENERATOR_VERSION = 1
+
+# The home/ directory of this repository.
+default_home = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            os.pardir, "home")
+
+def default_manifest_path() -> str | None:
+    """Returns the path of the manifest of rendered targets, in jcolor2's
+    cache directory, or None if the cache is disabled."""
+    if jcolor2.cache_dir is None:
+        return None
+    return os.path.join(jcolor2.cache_dir, "render-manifest.json")
+
+def target_key(name: str) -> str:
+    """Returns a hash of the inputs that determine the named target's output.
+    Doesn't compute the palette."""
+    import hashlib
+    import json
+    inputs = [GENERATOR_VERSION, name, jcolor2.palette_key(),
+              targets[name].inputs]
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+def render_to_string(name: str, table: ColorTable | None = None) -> str:
+    if table is None:
+        with phase("palette"):
+            table = ColorTable()
+    with phase(f"render {name}"):
+        out = io.StringIO()
+        targets[name].render(table, out)
+        return out.getvalue()
+
+def write_atomic(path: str, text: str | bytes) -> None:
+    """Writes text, or binary data, to path, such that readers see either the
+    old or the new file contents and never a partial file."""
+    import tempfile
+    dirname = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".jcolor2-")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(text, bytes) else "w") as f:
+            f.write(text)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def _file_hash(path: str) -> str | None:
+    import hashlib
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+def render(names: Iterable[str], home: str | None = None,
+           table: ColorTable | None = None, force: bool = False,
+           manifest_path: str | None = None) -> list[tuple[str, bool]]:
+    """Renders each named target to its path under home (by default,
+    default_home), and returns a list of (path, written) for each.
+
+    Targets whose inputs and output file are unchanged since they were last
+    rendered are skipped unless force is true. The manifest at manifest_path
+    (by default, default_manifest_path()) records them by absolute output
+    path, so that rendering into several homes doesn't mix them up. If no
+    target needs rendering, the palette isn't computed."""
+    import hashlib
+    import json
+    if home is None:
+        home = default_home
+    if manifest_path is None:
+        manifest_path = default_manifest_path()
+    manifest = {}
+    if manifest_path is not None:
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)["targets"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        if not isinstance(manifest, dict):
+            manifest = {}
+    results = []
+    changed = False
+    for name in names:
+        path = os.path.abspath(os.path.join(home, targets[name].path))
+        key = target_key(name)
+        entry = manifest.get(path)
+        if (not force and isinstance(entry, dict) and
+                entry.get("key") == key and
+                entry.get("output") == _file_hash(path)):
+            results.append((path, False))
+            continue
+        if table is None:
+            with phase("palette"):
+                table = ColorTable()
+        text = render_to_string(name, table)
+        with phase("output"):
+            write_atomic(path, text)
+        manifest[path] = {
+                "key": key,
+                "output": hashlib.sha256(text.encode()).hexdigest(),
+        }
+        changed = True
+        results.append((path, True))
+    if changed and manifest_path is not None:
+        try:
+            write_atomic(manifest_path, json.dumps(
+                    {"version": GENERATOR_VERSION, "targets": manifest},
+                    indent=2, sort_keys=True) + "\n")
+        except OSError:
+            # The manifest is only an optimization.
+            pass
+    return results
+
+def print_target(name: str) -> None:
+    text = render_to_string(name)
+    with phase("output"):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+###############################################################################
+# Command line
+###############################################################################
+
+def add_arguments(argp: "argparse.ArgumentParser", subcmd: str) -> None:
+    if subcmd == "render":
+        argp.add_argument("targets", nargs="*", metavar="TARGET",
+                          choices=tuple(targets),
+                          help="targets to write; defaults to all")
+        argp.add_argument("--home",
+                          help="directory to write to; defaults to the home/ "
+                               "directory of this repository")
+        argp.add_argument("-f", "--force", action="store_true",
+                          help="write targets even if they're up to date")
+
+def main(args: "argparse.Namespace") -> None:
+    if args.subcmd != "render":
+        print_target(args.subcmd)
+        return
+    names = args.targets or list(targets)
+    for path, written in render(names, args.home, force=args.force):
+        print(f"{'Wrote' if written else 'Up to date:'} {path}")
@@ -0,0 +1,210 @@
+"""A daemon that answers color queries on a Unix domain socket.
+
+Scripts that need a color now and then would otherwise start Python and build
+the palette and nearest-color index for each lookup. The daemon builds them
+once, and answers each request from memory. jcolor2_client sends requests, and
+computes the responses itself if no daemon is running.
+
+Each request is a line of words separated by spaces: a command and its
+arguments. Each response is a line: "ok" followed by the results, separated by
+spaces, or "error" followed by a message. A client may send any number of
+requests without waiting for responses, which come in the same order, several
+to a write. Commands:
+- ping: no results.
+- rgb COLOR...: each color as "#rrggbb", clamped into gamut.
+- oklab COLOR...: each color, clamped into gamut, as "oklab:L,a,b".
+- oklch COLOR...: each color, clamped into gamut, as "oklch:L,C,h".
+- term256 COLOR...: the term256_code() of each color.
+- contrast FG BG [FG BG]...: the contrast ratio of each pair of colors.
+- palette [NAME...]: each named palette color as "#rrggbb", or all of them as
+  "NAME=#rrggbb".
+A COLOR is "#rrggbb", "oklab:L,a,b", "oklch:L,C,h", or the name of a palette
+color.
+
+The daemon's palette is the one current when it started; restart it after
+changing jcolor2's constants.
+
+    ./jcolor2.py serve &
+    ./jcolor2_client.py term256 '#5f87af'"""
+
+import math
+import os
+import signal
+import socketserver
+import sys
+
+import jcolor2
+import jcolor2_client
+
+# Longest request line; longer ones end the connection.
+_MAX_LINE = 1 << 20
+
+###############################################################################
+# Requests
+###############################################################################
+
+def parse_color(word: str) -> jcolor2.RGBColor:
+    model, sep, components = word.partition(":")
+    if sep:
+        try:
+            values = [float(x) for x in components.split(",")]
+        except ValueError:
+            values = []
+        if (model in ("oklab", "oklch") and len(values) == 3 and
+                all(math.isfinite(x) for x in values)):
+            # Clamped, since conversions of colors out of the sRGB gamut
+            # back to Oklab take roots of negative numbers.
+            if model == "oklab":
+                return jcolor2.OklabColor(*values).to_rgb().clamped()
+            return jcolor2.OklchColor(*values).to_rgb().clamped()
+    elif word.startswith("#"):
+        if len(word) == 7:
+            try:
+                return jcolor2.RGBColor.from_str(word)
+            except ValueError:
+                pass
+    else:
+        c = jcolor2.palette.get(word)
+        if c is not None:
+            return c
+    raise ValueError(f"invalid color {word!r}")
+
+def _format_oklab(c: jcolor2.RGBColor) -> str:
+    p = c.to_oklab()
+    return f"oklab:{p.L:.6f},{p.a:.6f},{p.b:.6f}"
+
+def _format_oklch(c: jcolor2.RGBColor) -> str:
+    p = c.to_oklab()
+    h = math.degrees(math.atan2(p.b, p.a)) % 360.0
+    return f"oklch:{p.L:.6f},{math.hypot(p.a, p.b):.6f},{h:.6f}"
+
+def _contrast(args: list[str]) -> list[str]:
+    if len(args) % 2:
+        raise ValueError("contrast takes pairs of colors")
+    colors = [parse_color(w) for w in args]
+    return [f"{jcolor2.contrast(fg, bg):.4f}"
+            for fg, bg in zip(colors[::2], colors[1::2])]
+
+def _palette(args: list[str]) -> list[str]:
+    if not args:
+        return [f"{name}={c}" for name, c in jcolor2.palette.items()]
+    results = []
+    for name in args:
+        if name not in jcolor2.palette:
+            raise ValueError(f"unknown palette color {name!r}")
+        results.append(str(jcolor2.palette[name]))
+    return results
+
+# Functions computing the results of each command, given its arguments.
+commands = {
+        "ping": lambda args: [],
+        "rgb": lambda args: [str(parse_color(w)) for w in args],
+        "oklab": lambda args: [_format_oklab(parse_color(w)) for w in args],
+        "oklch": lambda args: [_format_oklch(parse_color(w)) for w in args],
+        "term256": lambda args: [str(jcolor2.term256_code(parse_color(w)))
+                                 for w in args],
+        "contrast": _contrast,
+        "palette": _palette,
+}
+
+def respond(request: str) -> str:
+    """Returns the response line to a request line, without newlines."""
+    words = request.split()
+    if not words:
+        return "error empty request"
+    fn = commands.get(words[0])
+    if fn is None:
+        return f"error unknown command {words[0]!r}"
+    try:
+        results = fn(words[1:])
+    except ValueError as e:
+        return f"error {e}"
+    except Exception as e:
+        # Rather than end the connection, which would leave the client to
+        # compute the responses to the rest of its requests.
+        return f"error {type(e).__name__}: {e}"
+    return " ".join(["ok", *results])
+
+###############################################################################
+# Server
+###############################################################################
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        sock = self.request
+        pending = b""
+        while True:
+            data = sock.recv(1 << 16)
+            if not data:
+                break
+            *lines, pending = (pending + data).split(b"\n")
+            # All complete requests of this read, answered in one write.
+            responses = b"".join(
+                    respond(line.decode(errors="replace")).encode() + b"\n"
+                    for line in lines)
+            if len(pending) > _MAX_LINE:
+                sock.sendall(responses + b"error request too long\n")
+                break
+            if responses:
+                sock.sendall(responses)
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def warm_up() -> None:
+    """Computes what requests use, so that the first ones are as fast as the
+    rest."""
+    jcolor2.term256_code(jcolor2.palette["white"])
+
+def make_server(path: str) -> Server:
+    """Returns a server listening on a socket at path, with requests warmed
+    up. Raises OSError if another daemon is already listening there."""
+    sock = jcolor2_client.connect(path)
+    if sock is not None:
+        sock.close()
+        raise OSError(f"{path}: a daemon is already listening")
+    try:
+        # Left behind by a daemon that didn't exit cleanly.
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    warm_up()
+    # Only the user may connect.
+    umask = os.umask(0o077)
+    try:
+        return Server(path, _Handler)
+    finally:
+        os.umask(umask)
+
+def serve(path: str) -> None:
+    """Answers requests on a socket at path until interrupted, then removes
+    the socket."""
+    server = make_server(path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+###############################################################################
+# Command line
+###############################################################################
+
+def add_arguments(argp: "argparse.ArgumentParser", subcmd: str) -> None:
+    argp.add_argument("--socket", metavar="PATH",
+                      help="socket to listen on; defaults to $JCOLOR2_SOCKET "
+                           f"or {jcolor2_client.default_socket_path()}")
+
+def main(args: "argparse.Namespace") -> None:
+    # Exit through the finally clause of serve(), which removes the socket.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(args.socket or jcolor2_client.socket_path())
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        exit(1)
+    except KeyboardInterrupt:
+        pass
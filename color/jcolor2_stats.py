@@ -0,0 +1,121 @@
+"""Call counts and phase timings of jcolor2.
+
+enable() replaces the color functions listed in counted with wrappers that
+count their calls, and starts timing the phases that jcolor2's modules mark
+with phase(), until disable() restores them. While disabled, which is the
+default, nothing is wrapped and phases aren't timed. Calls made in worker
+processes, e.g. by jcolor2_lut.build(), aren't counted.
+
+    stats = jcolor2_stats.enable()
+    try:
+        jcolor2_render.render(jcolor2_render.targets)
+    finally:
+        jcolor2_stats.disable()
+    print(stats.table())
+
+`jcolor2.py --profile SUBCOMMAND` does the same for any subcommand."""
+
+import functools
+import time
+
+import jcolor2
+
+# Functions whose calls are counted, as (owner, attribute), where owner is
+# jcolor2 or one of its classes.
+counted = (
+        ("RGBColor", "to_oklab"),
+        ("OklchColor", "to_oklab"),
+        ("OklabColor", "to_rgb"),
+        ("OklchColor", "to_rgb"),
+        (None, "term256_code"),
+        (None, "saturate"),
+        (None, "contrast"),
+)
+
+class Stats(object):
+    """Call counts and phase timings collected while enabled."""
+
+    def __init__(self):
+        self.calls: dict[str, int] = {}
+        # Total seconds and number of times entered, by phase name, in the
+        # order in which they were first entered.
+        self.phases: dict[str, list] = {}
+
+    def to_json(self) -> dict:
+        return {
+                "calls": dict(self.calls),
+                "phases": {name: {"seconds": t, "count": n}
+                           for name, (t, n) in self.phases.items()},
+        }
+
+    def table(self) -> str:
+        lines = [f"{'Phase':<32} {'Count':>8} {'Time':>12}"]
+        for name, (t, n) in self.phases.items():
+            lines.append(f"{name:<32} {n:>8} {t * 1e3:>9.3f} ms")
+        lines.append("")
+        lines.append(f"{'Function':<32} {'Calls':>8}")
+        for name, n in self.calls.items():
+            lines.append(f"{name:<32} {n:>8}")
+        return "\n".join(lines) + "\n"
+
+_active: Stats | None = None
+# The replaced attributes, as (owner object, attribute, original).
+_originals: list[tuple[object, str, object]] = []
+
+def _counting(stats: Stats, name: str, fn):
+    stats.calls[name] = 0
+    calls = stats.calls
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        calls[name] += 1
+        return fn(*args, **kwargs)
+    return wrapper
+
+def enable() -> Stats:
+    """Starts collecting statistics into a new Stats, and returns it."""
+    global _active
+    if _active is not None:
+        disable()
+    stats = Stats()
+    for owner_name, attr in counted:
+        owner = (getattr(jcolor2, owner_name) if owner_name is not None
+                 else jcolor2)
+        name = f"{owner_name}.{attr}" if owner_name is not None else attr
+        original = getattr(owner, attr)
+        _originals.append((owner, attr, original))
+        setattr(owner, attr, _counting(stats, name, original))
+    _active = stats
+    return stats
+
+def disable() -> Stats | None:
+    """Stops collecting statistics and returns what was collected, if
+    enabled."""
+    global _active
+    while _originals:
+        owner, attr, original = _originals.pop()
+        setattr(owner, attr, original)
+    stats = _active
+    _active = None
+    return stats
+
+def active() -> Stats | None:
+    return _active
+
+class phase(object):
+    """A context manager that times the enclosed code as the named phase, if
+    enabled. Phases may nest."""
+    __slots__ = ("name", "_entry", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._entry = None
+
+    def __enter__(self) -> None:
+        if _active is not None:
+            self._entry = _active.phases.setdefault(self.name, [0.0, 0])
+            self._start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        if self._entry is not None:
+            self._entry[0] += time.perf_counter() - self._start
+            self._entry[1] += 1
@@ -0,0 +1,23 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# The modules are scripts in the parent directory rather than a package.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+# Keep jcolor2's caches out of the user's, including for what tests compute
+# when collected, before any fixture runs.
+_cache_dir = tempfile.mkdtemp(prefix="jcolor2-tests-")
+os.environ["JCOLOR2_CACHE_DIR"] = _cache_dir
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_cache_dir, ignore_errors=True)
+
+@pytest.fixture(autouse=True)
+def _cache_dir_per_test(tmp_path, monkeypatch):
+    import jcolor2
+    monkeypatch.setattr(jcolor2, "cache_dir", str(tmp_path / "cache"))
@@ -0,0 +1,385 @@
+import math
+import random
+
+import pytest
+
+import jcolor2
+
+def _random_rgb(n: int) -> list[jcolor2.RGBColor]:
+    rng = random.Random(n)
+    return [jcolor2.RGBColor(rng.random(), rng.random(), rng.random())
+            for _ in range(n)]
+
+###############################################################################
+# Color models
+###############################################################################
+
+def test_clamped_results_are_independent():
+    for c in (jcolor2.rgb(0x123456), jcolor2.RGBColor(1.5, -0.5, 0.25)):
+        d = c.clamped()
+        assert d is not c
+        assert d.in_gamut()
+        r = c.r
+        d.r = 0.5
+        assert c.r == r
+
+def _oklab_formula(c: jcolor2.RGBColor) -> tuple[float, float, float]:
+    # RGBColor.to_oklab() without the 8-bit tables.
+    rl, gl, bl = (jcolor2.linear_from_srgb(x) for x in (c.r, c.g, c.b))
+    l = 0.4122214708 * rl + 0.5363325363 * gl + 0.0514459929 * bl
+    m = 0.2119034982 * rl + 0.6806995451 * gl + 0.1073969566 * bl
+    s = 0.0883024619 * rl + 0.2817188376 * gl + 0.6299787005 * bl
+    l_ = l ** (1.0 / 3.0)
+    m_ = m ** (1.0 / 3.0)
+    s_ = s ** (1.0 / 3.0)
+    return (0.2104542553 * l_ + 0.7936177850 * m_ - 0.0040720468 * s_,
+            1.9779984951 * l_ - 2.4285922050 * m_ + 0.4505937099 * s_,
+            0.0259040371 * l_ + 0.7827717662 * m_ - 0.8086757660 * s_)
+
+def test_8b_to_oklab_matches_formula(monkeypatch):
+    monkeypatch.setattr(jcolor2, "_OKLAB_8B_MEMO_SIZE", 16)
+    rng = random.Random(0)
+    for _ in range(1000):
+        r, g, b = (rng.randrange(256) for _ in range(3))
+        c = jcolor2.RGBColor.from_8b(r, g, b)
+        # Computed, then memoized.
+        for _ in range(2):
+            p = c.to_oklab()
+            assert (p.L, p.a, p.b) == _oklab_formula(c)
+        assert jcolor2.oklab_from_8b(r, g, b) == p
+        assert len(jcolor2._oklab_8b_memo) <= 16
+    for c in _random_rgb(100):
+        p = c.to_oklab()
+        assert (p.L, p.a, p.b) == _oklab_formula(c)
+
+def test_8b_from_linear():
+    for c in _random_rgb(1000) + [jcolor2.RGBColor(1.5, -0.5, 0.25)]:
+        linear = [jcolor2.linear_from_srgb(x) for x in (c.r, c.g, c.b)]
+        expected = jcolor2.RGBColor(
+                *(jcolor2.srgb_from_linear(x) for x in linear)).to_8b()
+        assert tuple(jcolor2.srgb_8b_from_linear(x) for x in linear) == expected
+        p = c.to_oklab()
+        assert p.to_8b() == p.to_rgb().to_8b()
+
+###############################################################################
+# ColorArray
+###############################################################################
+
+def test_color_array_views_alias_the_array():
+    arr = jcolor2.ColorArray.from_colors([jcolor2.rgb(0x102030),
+                                          jcolor2.rgb(0x405060)])
+    assert arr.model is jcolor2.RGBColor
+    assert len(arr) == 2
+    view = arr[1]
+    assert view == jcolor2.rgb(0x405060)
+    assert str(view) == "#405060"
+    view.r = 1.0
+    assert str(arr[1]) == "#ff5060"
+    arr[0] = jcolor2.rgb(0xffffff)
+    assert str(view) == "#ff5060"
+    assert str(arr[-2]) == "#ffffff"
+    with pytest.raises(TypeError):
+        hash(view)
+    with pytest.raises(IndexError):
+        arr[2]
+
+def test_color_array_copies():
+    arr = jcolor2.ColorArray(jcolor2.OklabColor, [0.1, 0.2, 0.3, 0.4, 0.5, 0.6])
+    c = arr.copy(0)
+    assert type(c) is jcolor2.OklabColor
+    assert c == jcolor2.OklabColor(0.1, 0.2, 0.3)
+    sliced = arr[1:]
+    arr[1] = c
+    assert sliced[0] == jcolor2.OklabColor(0.4, 0.5, 0.6)
+    assert [(p.L, p.a, p.b) for p in arr[::-1]] == [(0.1, 0.2, 0.3)] * 2
+
+def test_color_array_concatenation():
+    a = jcolor2.ColorArray.from_colors([jcolor2.rgb(0)])
+    b = a + [jcolor2.rgb(0xffffff)]
+    assert [str(c) for c in b] == ["#000000", "#ffffff"]
+    c = [jcolor2.rgb(0x808080)] + a
+    assert [str(x) for x in c] == ["#808080", "#000000"]
+    a.extend(b)
+    assert len(a) == 3
+
+def test_color_array_errors():
+    with pytest.raises(TypeError):
+        jcolor2.ColorArray(float)
+    with pytest.raises(ValueError):
+        jcolor2.ColorArray(jcolor2.RGBColor, [0.0, 0.0])
+    with pytest.raises(ValueError):
+        jcolor2.ColorArray.from_colors([])
+    assert len(jcolor2.ColorArray.from_colors([], jcolor2.RGBColor)) == 0
+
+def test_color_array_buffer():
+    np = pytest.importorskip("numpy")
+    arr = jcolor2.ColorArray(jcolor2.RGBColor, [0.0, 0.5, 1.0] * 4)
+    a = np.asarray(arr)
+    assert a.shape == (4, 3)
+    # A view rather than a copy.
+    a[2, 0] = 0.25
+    assert arr[2].r == 0.25
+
+def test_slots():
+    for cls in (jcolor2.RGBColor, jcolor2.OklabColor, jcolor2.OklchColor):
+        with pytest.raises(AttributeError):
+            cls(0.0, 0.0, 0.0).x = 1.0
+
+###############################################################################
+# NearestColorIndex
+###############################################################################
+
+def _linear_scan(colors, codes, c: jcolor2.RGBColor) -> int:
+    p = c.to_oklab()
+    return min(zip(codes, colors),
+               key=lambda cc: (jcolor2.perc_distance(p, cc[1].to_oklab()),
+                               cc[0]))[0]
+
+@pytest.mark.parametrize("palette", ["16", "88", "240", "256"])
+def test_nearest_matches_linear_scan(palette):
+    index = jcolor2.term_index(palette)
+    colors = list(index.colors)
+    # Include the palette's own colors, which are exact matches.
+    for c in _random_rgb(300) + colors:
+        assert index.nearest(c) == _linear_scan(colors, index.codes, c)
+
+def test_ties_go_to_lowest_code():
+    # Codes 0 and 16 are both black, and 15 and 231 both white.
+    black = jcolor2.rgb(0x000000)
+    white = jcolor2.rgb(0xffffff)
+    assert jcolor2.term_index("256").nearest(black) == 0
+    assert jcolor2.term_index("256").nearest(white) == 15
+    assert jcolor2.term_index("240").nearest(black) == 16
+    # Equidistant from two palette colors.
+    index = jcolor2.NearestColorIndex([jcolor2.rgb(0x000000),
+                                       jcolor2.rgb(0x000000)], [7, 3])
+    assert index.nearest(jcolor2.rgb(0x808080)) == 3
+
+def test_custom_codes():
+    colors = [jcolor2.rgb(0xff0000), jcolor2.rgb(0x00ff00),
+              jcolor2.rgb(0x0000ff)]
+    index = jcolor2.NearestColorIndex(colors, [100, 200, 300])
+    assert index.nearest(jcolor2.rgb(0x10ff10)) == 200
+    assert index.nearest_oklab(jcolor2.rgb(0x0000f0).to_oklab()) == 300
+
+def test_invalid_palettes():
+    with pytest.raises(ValueError):
+        jcolor2.NearestColorIndex([])
+    with pytest.raises(ValueError):
+        jcolor2.NearestColorIndex([jcolor2.rgb(0)], [1, 2])
+    with pytest.raises(ValueError):
+        jcolor2.term_index("17")
+
+def test_nearest_batch_matches_nearest():
+    np = pytest.importorskip("numpy")
+    index = jcolor2.term_index("240")
+    colors = _random_rgb(500) + list(index.colors)
+    rgb = np.array([(c.r, c.g, c.b) for c in colors])
+    assert index.nearest_batch(rgb).tolist() == \
+            [index.nearest(c) for c in colors]
+    assert index.nearest_batch(rgb.reshape(1, -1, 3)).shape == (1, len(rgb))
+
+def test_term256_code():
+    assert jcolor2.term256_code(jcolor2.rgb(0xff0000)) == 196
+    assert jcolor2.term256_code(jcolor2.rgb(0x5f87af)) == 67
+    for metric in jcolor2.metrics:
+        assert jcolor2.term256_code(jcolor2.rgb(0x5f87af), metric) == 67
+
+# Pairs of CIELAB colors and their CIEDE2000 differences, from Sharma, Wu and
+# Dalal's test data.
+_ciede2000_pairs = [
+        ((50.0, 2.6772, -79.7751), (50.0, 0.0, -82.7485), 2.0425),
+        ((50.0, -1.3802, -84.2814), (50.0, 0.0, -82.7485), 1.0000),
+        ((50.0, 0.0, 0.0), (50.0, -1.0, 2.0), 2.3669),
+        ((50.0, 2.49, -0.001), (50.0, -2.49, 0.0011), 7.2195),
+        ((50.0, 2.5, 0.0), (73.0, 25.0, -18.0), 27.1492),
+        ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+        ((22.7233, 20.0904, -46.694), (23.0331, 14.973, -42.5619), 2.0373),
+]
+
+def test_ciede2000():
+    metric = jcolor2.metrics["ciede2000"]
+    for lab1, lab2, expected in _ciede2000_pairs:
+        p = (*lab1, math.hypot(*lab1[1:]))
+        q = (*lab2, math.hypot(*lab2[1:]))
+        assert metric.distance(p, q) == pytest.approx(expected, abs=5e-5)
+        assert metric.distance(q, p) == pytest.approx(expected, abs=5e-5)
+
+def test_ciede2000_lightness_bound():
+    metric = jcolor2.metrics["ciede2000"]
+    for c in _random_rgb(100):
+        p = metric.prepare(c.to_oklab())
+        for d in _random_rgb(20):
+            q = metric.prepare(d.to_oklab())
+            k = metric.lightness_bound(p[0], q[0], q[0])
+            assert metric.distance(p, q) >= k * abs(p[0] - q[0])
+
+@pytest.mark.parametrize("metric", ["oklch", "ciede2000"])
+@pytest.mark.parametrize("palette", ["16", "240"])
+def test_nearest_by_metric_matches_linear_scan(palette, metric):
+    index = jcolor2.term_index(palette, metric)
+    m = jcolor2.metrics[metric]
+    points = [(m.prepare(c.to_oklab()), code)
+              for code, c in zip(index.codes, index.colors)]
+    for c in _random_rgb(300) + list(index.colors):
+        q = m.prepare(c.to_oklab())
+        assert index.nearest(c) == min(
+                points, key=lambda pc: (m.distance(q, pc[0]), pc[1]))[1]
+
+@pytest.mark.parametrize("metric", ["oklch", "ciede2000"])
+def test_nearest_batch_by_metric_matches_nearest(metric):
+    np = pytest.importorskip("numpy")
+    index = jcolor2.term_index("240", metric)
+    colors = _random_rgb(500) + list(index.colors)
+    rgb = np.array([(c.r, c.g, c.b) for c in colors])
+    assert index.nearest_batch(rgb).tolist() == \
+            [index.nearest(c) for c in colors]
+
+def test_invalid_metric():
+    with pytest.raises(ValueError):
+        jcolor2.NearestColorIndex([jcolor2.rgb(0)], metric="nonesuch")
+    with pytest.raises(ValueError):
+        jcolor2.term_index("240", "nonesuch")
+
+def test_nearest_names_are_loaded_lazily():
+    import jcolor2_nearest
+    assert jcolor2.NearestColorIndex is jcolor2_nearest.NearestColorIndex
+    assert isinstance(jcolor2.term_index("240"),
+                      jcolor2_nearest.NearestColorIndex)
+    with pytest.raises(AttributeError):
+        jcolor2.nonesuch
+
+###############################################################################
+# Gamut boundary
+###############################################################################
+
+def _in_gamut(L: float, C: float, h: float, eps: float = 1e-9) -> bool:
+    c = jcolor2.OklchColor(L, C, h).to_rgb()
+    return all(-eps <= jcolor2.linear_from_srgb(x) <= 1.0 + eps
+               for x in (c.r, c.g, c.b))
+
+def _bisect_max_chroma(L: float, h: float) -> float:
+    # The search that max_chroma() replaced, to higher precision. Only valid
+    # where the in-gamut chromas are an interval, which they are at the
+    # hues and lightnesses tested.
+    lo, hi = 0.0, 0.5
+    for _ in range(60):
+        mid = 0.5 * (lo + hi)
+        if _in_gamut(L, mid, h, 0.0):
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+@pytest.mark.parametrize("h", [0.0, 20.0, 65.0, 110.0, 155.0, 200.0, 245.0,
+                               264.0, 290.0, 335.0])
+def test_max_chroma_is_on_the_boundary(h):
+    for L in (0.05, 0.24, 0.5, 0.62, 0.72, 0.9, 0.99):
+        C = jcolor2.max_chroma(L, h)
+        assert _in_gamut(L, C, h)
+        assert not _in_gamut(L, C + 1e-6, h, 0.0)
+        assert C == pytest.approx(_bisect_max_chroma(L, h), abs=1e-12)
+
+def test_max_chroma_outside_lightness_range():
+    for L in (-0.1, 0.0, 1.0, 1.5):
+        assert jcolor2.max_chroma(L, 30.0) == 0.0
+
+def test_gamut_cusp():
+    for h in range(0, 360, 15):
+        L, C = jcolor2.gamut_cusp(float(h))
+        assert 0.0 < L < 1.0
+        assert C == pytest.approx(jcolor2.max_chroma(L, float(h)), abs=1e-9)
+        # The cusp is the most chromatic color at its hue.
+        for dL in (-0.02, 0.02):
+            assert jcolor2.max_chroma(L + dL, float(h)) < C
+
+def test_gamut_cusp_between_table_hues():
+    rng = random.Random(0)
+    for _ in range(500):
+        h = 720.0 * rng.random() - 360.0
+        L, C = jcolor2.gamut_cusp(h)
+        assert (L, C) == pytest.approx(jcolor2._cusp_from_saturation(
+                *jcolor2._cusp_saturation(h)), abs=1e-12)
+    # The table doesn't grow with the hues asked about.
+    assert len(jcolor2._cusp_table) == 361
+
+def test_saturate_is_in_gamut():
+    for h in range(0, 360, 5):
+        c = jcolor2.saturate(0.72, float(h))
+        assert c.in_gamut()
+
+def test_max_chroma_batch_matches_scalar():
+    np = pytest.importorskip("numpy")
+    import jcolor2_batch
+    L = np.linspace(0.0, 1.0, 41)[:, None]
+    h = np.arange(0.0, 360.0, 7.5)[None, :]
+    C = jcolor2_batch.max_chroma(L, h)
+    assert C.shape == (41, 48)
+    for i, j in np.ndindex(C.shape):
+        assert C[i, j] == pytest.approx(
+                jcolor2.max_chroma(float(L[i, 0]), float(h[0, j])), abs=1e-12)
+    L_cusp, C_cusp = jcolor2_batch.gamut_cusp(h[0])
+    for k, hk in enumerate(h[0].tolist()):
+        assert (L_cusp[k], C_cusp[k]) == pytest.approx(
+                jcolor2.gamut_cusp(hk), abs=1e-12)
+
+###############################################################################
+# Palette
+###############################################################################
+
+_palette_attrs = ("palette", "delims", "palette_codes")
+
+def _forget_palette() -> None:
+    for name in _palette_attrs:
+        vars(jcolor2).pop(name, None)
+
+@pytest.fixture
+def palette_cache(tmp_path, monkeypatch):
+    # Restores the palette afterwards, since tests may change the constants.
+    for name in _palette_attrs:
+        monkeypatch.setattr(jcolor2, name, getattr(jcolor2, name))
+    monkeypatch.setattr(jcolor2, "cache_dir", str(tmp_path))
+    _forget_palette()
+    return tmp_path
+
+def test_palette_codes():
+    codes = jcolor2.palette_codes
+    colors = [*jcolor2.palette.values(), *jcolor2.delims]
+    assert set(codes) == set(colors)
+    for c in colors:
+        assert codes[c] == jcolor2.term256_code(c)
+
+def test_palette_cache(palette_cache):
+    palette = jcolor2.palette
+    assert list(palette_cache.iterdir()) == [palette_cache / "palette.marshal"]
+    assert palette == jcolor2.make_palette()
+    codes = jcolor2.palette_codes
+    _forget_palette()
+    # Loaded from the cache.
+    assert jcolor2.palette_codes == codes
+    assert jcolor2.palette == palette
+    assert jcolor2.delims == jcolor2.make_delims()
+
+def test_palette_cache_of_other_constants(palette_cache, monkeypatch):
+    palette = jcolor2.palette
+    _forget_palette()
+    monkeypatch.setattr(jcolor2, "L_hue", jcolor2.L_hue - 0.05)
+    assert jcolor2.palette != palette
+    assert jcolor2.palette == jcolor2.make_palette()
+    for c, code in jcolor2.palette_codes.items():
+        assert code == jcolor2.term256_code(c)
+
+@pytest.mark.parametrize("data", [b"", b"junk", b"\0" * 100])
+def test_invalid_palette_cache(palette_cache, data):
+    (palette_cache / "palette.marshal").write_bytes(data)
+    assert jcolor2.palette == jcolor2.make_palette()
+    assert jcolor2.delims == jcolor2.make_delims()
+    # Replaced by a valid one.
+    _forget_palette()
+    assert jcolor2.palette == jcolor2.make_palette()
+
+def test_palette_without_cache(palette_cache, monkeypatch):
+    monkeypatch.setattr(jcolor2, "cache_dir", None)
+    assert jcolor2.palette == jcolor2.make_palette()
+    assert jcolor2.palette_codes
+    assert not list(palette_cache.iterdir())
@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import jcolor2
+import jcolor2_audit
+
+def test_contrast_matrix_matches_contrast():
+    colors = jcolor2_audit.audit_colors()
+    matrix = jcolor2_audit.ContrastMatrix(colors)
+    assert matrix.ratios.shape == (len(colors), len(colors))
+    for fg, fg_c in colors.items():
+        for bg, bg_c in colors.items():
+            assert matrix[fg, bg] == pytest.approx(
+                    jcolor2.contrast(fg_c, bg_c), rel=1e-12)
+    assert matrix["black", "black"] == 1.0
+    assert matrix["white", "black"] == \
+            pytest.approx(matrix["black", "white"], rel=1e-15)
+
+def test_audit_pairs():
+    pairs = jcolor2_audit.audit_pairs()
+    assert ("Comment", "grey", "black") in pairs
+    # Inverted.
+    assert ("Search", "black", "yellow") in pairs
+    assert ("SpellBad (underline)", "red", "black") in pairs
+    assert ("rainbow_parentheses", "delims[0]", "black_light") in pairs
+    assert not [p for p in pairs if p.what == "Ignore"]
+
+def test_audit():
+    assert jcolor2_audit.audit(1.0) == []
+    low = jcolor2_audit.audit(100.0)
+    assert len(low) == len(jcolor2_audit.audit_pairs())
+    matrix = jcolor2_audit.ContrastMatrix(jcolor2_audit.audit_colors())
+    for pair, ratio in low:
+        assert ratio == matrix[pair.fg, pair.bg]
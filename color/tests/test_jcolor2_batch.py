@@ -0,0 +1,102 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import jcolor2
+import jcolor2_batch
+
+def _random_rgb(n: int, lo: float = 0.0, hi: float = 1.0) -> np.ndarray:
+    return np.random.default_rng(n).uniform(lo, hi, (n, 3))
+
+def test_transfer_functions_match_scalar():
+    # Include both sides of the linear segment.
+    c = np.concatenate([np.linspace(0.0, 0.05, 101), np.linspace(0.0, 1.0, 101)])
+    np.testing.assert_allclose(
+            jcolor2_batch.linear_from_srgb(c),
+            [jcolor2.linear_from_srgb(x) for x in c.tolist()],
+            rtol=1e-14, atol=1e-17)
+    np.testing.assert_allclose(
+            jcolor2_batch.srgb_from_linear(c),
+            [jcolor2.srgb_from_linear(x) for x in c.tolist()],
+            rtol=1e-14, atol=1e-17)
+
+def test_oklab_from_rgb_matches_scalar():
+    rgb = _random_rgb(500)
+    lab = jcolor2_batch.oklab_from_rgb(rgb)
+    for c, p in zip(rgb.tolist(), lab.tolist()):
+        q = jcolor2.RGBColor(*c).to_oklab()
+        assert p == pytest.approx((q.L, q.a, q.b), abs=1e-12)
+
+# The published Oklab matrices aren't exact inverses, so round trips are only
+# good to about 1e-6.
+ROUND_TRIP_TOL = 1e-5
+
+def test_rgb_from_oklab_round_trips():
+    rgb = _random_rgb(500)
+    np.testing.assert_allclose(
+            jcolor2_batch.rgb_from_oklab(jcolor2_batch.oklab_from_rgb(rgb)),
+            rgb, atol=ROUND_TRIP_TOL)
+
+def test_oklch_hue_range_and_round_trip():
+    rgb = _random_rgb(500)
+    lch = jcolor2_batch.oklch_from_rgb(rgb)
+    assert ((lch[:, 2] >= 0.0) & (lch[:, 2] < 360.0)).all()
+    np.testing.assert_allclose(jcolor2_batch.rgb_from_oklch(lch), rgb,
+                               atol=ROUND_TRIP_TOL)
+    for c, p in zip(lch.tolist()[:50], rgb.tolist()[:50]):
+        q = jcolor2.OklchColor(*c).to_rgb()
+        assert (q.r, q.g, q.b) == pytest.approx(p, abs=ROUND_TRIP_TOL)
+
+def test_shapes_are_preserved():
+    rgb = _random_rgb(24).reshape(2, 4, 3, 3)
+    assert jcolor2_batch.oklab_from_rgb(rgb).shape == rgb.shape
+    assert jcolor2_batch.oklch_from_rgb(rgb).shape == rgb.shape
+
+def test_in_gamut():
+    rgb = np.array([[0.0, 0.5, 1.0], [-1e-9, 0.5, 0.5], [0.5, 1.0 + 1e-9, 0.5]])
+    assert jcolor2_batch.in_gamut(rgb).tolist() == [True, False, False]
+
+def test_8b_round_trip():
+    rgb8 = np.arange(256, dtype=np.uint8)[:, None].repeat(3, axis=1)
+    assert (jcolor2_batch.rgb_to_8b(jcolor2_batch.rgb_from_8b(rgb8)) ==
+            rgb8).all()
+    # Clamped and rounded as RGBColor.to_8b().
+    rgb = np.array([[-0.5, 0.5 / 255.0, 1.5]])
+    assert jcolor2_batch.rgb_to_8b(rgb).tolist() == \
+            [list(jcolor2.RGBColor(*rgb[0].tolist()).to_8b())]
+
+def test_contrast_matrix_matches_scalar():
+    fg = _random_rgb(20)
+    bg = _random_rgb(30)
+    matrix = jcolor2_batch.contrast_matrix(fg, bg)
+    assert matrix.shape == (20, 30)
+    for i, f in enumerate(fg.tolist()):
+        for j, b in enumerate(bg.tolist()):
+            assert matrix[i, j] == pytest.approx(
+                    jcolor2.contrast(jcolor2.RGBColor(*f),
+                                     jcolor2.RGBColor(*b)), rel=1e-12)
+    np.testing.assert_array_equal(jcolor2_batch.contrast_matrix(fg),
+                                  jcolor2_batch.contrast_matrix(fg, fg))
+
+def test_ciede2000_matches_scalar():
+    lab = jcolor2_batch.cielab_from_linear(
+            jcolor2_batch.linear_from_srgb(_random_rgb(50)))
+    # White is L = 100 with a = b = 0.
+    assert jcolor2_batch.cielab_from_linear([1.0, 1.0, 1.0]) == \
+            pytest.approx([100.0, 0.0, 0.0], abs=1e-3)
+    dist = jcolor2_batch.ciede2000(lab[:, None], lab[None, :])
+    metric = jcolor2.metrics["ciede2000"]
+    prepared = [(*p, np.hypot(p[1], p[2])) for p in lab.tolist()]
+    for i, p in enumerate(prepared):
+        for j, q in enumerate(prepared):
+            assert dist[i, j] == pytest.approx(metric.distance(p, q),
+                                               rel=1e-9, abs=1e-12)
+
+def test_weighted_oklch_distance():
+    lab = jcolor2_batch.oklab_from_rgb(_random_rgb(30))
+    # With equal weights, it's the Oklab distance.
+    np.testing.assert_allclose(
+            jcolor2_batch.weighted_oklch_distance(lab[:, None], lab[None, :],
+                                                  (1.0, 1.0, 1.0)),
+            jcolor2_batch.perc_distance(lab[:, None], lab[None, :]),
+            atol=1e-7)
@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import jcolor2_bench
+
+script = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                      "jcolor2_bench.py")
+
+# Those that don't run jcolor2.py.
+in_process = [name for name in jcolor2_bench.BENCHMARKS
+              if name not in ("render.vim", "render.vim-airline")]
+
+@pytest.mark.parametrize("name", in_process)
+def test_benchmark_runs(name):
+    try:
+        fn, ops = jcolor2_bench.BENCHMARKS[name]()
+    except ImportError:
+        pytest.skip("needs NumPy")
+    assert ops >= 1
+    fn()
+
+@pytest.mark.parametrize("t, formatted", [
+        (2.5, "2.5 s"),
+        (0.0123, "12.3 ms"),
+        (4.56e-6, "4.56 us"),
+        (7.89e-8, "78.9 ns"),
+])
+def test_format_time(t, formatted):
+    assert jcolor2_bench.format_time(t) == formatted
+
+def _bench(tmp_path, *args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, JCOLOR2_CACHE_DIR=str(tmp_path / "cache"))
+    return subprocess.run([sys.executable, script, "-k", "^contrast$",
+                           "-r", "1", *args], env=env, capture_output=True,
+                          text=True)
+
+def test_save_and_compare(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    result = _bench(tmp_path, "--save", path)
+    assert result.returncode == 0
+    assert result.stdout.split()[0] == "contrast"
+    with open(path) as f:
+        baseline = json.load(f)
+    assert list(baseline["results"]) == ["contrast"]
+    # Far faster than this run, which then regressed.
+    baseline["results"]["contrast"] /= 100
+    with open(path, "w") as f:
+        json.dump(baseline, f)
+    result = _bench(tmp_path, "--compare", path)
+    assert result.returncode == 1
+    assert "REGRESSION" in result.stdout
+    assert "contrast" in result.stderr
+    # Far slower.
+    baseline["results"]["contrast"] *= 10000
+    with open(path, "w") as f:
+        json.dump(baseline, f)
+    result = _bench(tmp_path, "--compare", path)
+    assert result.returncode == 0
+    assert "REGRESSION" not in result.stdout
@@ -0,0 +1,142 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+script = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                      "jcolor2.py")
+
+def _run(tmp_path, *args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, JCOLOR2_CACHE_DIR=str(tmp_path / "cache"))
+    return subprocess.run([sys.executable, script, *args], env=env,
+                          capture_output=True, text=True)
+
+def test_no_subcommand(tmp_path):
+    result = _run(tmp_path)
+    assert result.returncode == 1
+    assert "vim-airline" in result.stdout
+
+def test_unknown_subcommand(tmp_path):
+    result = _run(tmp_path, "nonesuch")
+    assert result.returncode == 2
+    assert "invalid choice" in result.stderr
+
+def test_vim(tmp_path):
+    result = _run(tmp_path, "vim")
+    assert result.returncode == 0
+    assert result.stdout.startswith('" Generated by `jcolor2.py vim`')
+    # Loaded from the cache the first run wrote.
+    assert _run(tmp_path, "vim").stdout == result.stdout
+
+def test_subcommand_arguments(tmp_path):
+    result = _run(tmp_path, "render", "--help")
+    assert result.returncode == 0
+    assert result.stdout.startswith("usage: jcolor2.py render")
+    assert "--home" in result.stdout
+    result = _run(tmp_path, "render", "nonesuch")
+    assert result.returncode == 2
+
+def test_render(tmp_path):
+    home = tmp_path / "home"
+    result = _run(tmp_path, "render", "--home", str(home), "vim")
+    assert result.returncode == 0
+    assert result.stdout.startswith("Wrote ")
+    assert (home / ".vim/colors/jcolor2.vim").read_text() == \
+            _run(tmp_path, "vim").stdout
+
+def test_audit(tmp_path):
+    result = _run(tmp_path, "audit", "--threshold", "1")
+    assert result.returncode == 0
+    result = _run(tmp_path, "audit", "--threshold", "100")
+    assert result.returncode == 1
+    assert "Comment: grey (#" in result.stdout
+    assert result.stderr.startswith("Error: ")
+
+def test_quantize(tmp_path):
+    pytest.importorskip("numpy")
+    path = tmp_path / "in.ppm"
+    path.write_bytes(b"P6\n2 1\n255\n\xff\x00\x00\x00\x00\x00")
+    result = _run(tmp_path, "quantize", str(path))
+    assert result.returncode == 0
+    assert result.stdout == "\x1b[38;5;196m▀\x1b[38;5;16m▀\x1b[0m\n"
+    out = tmp_path / "out.ppm"
+    result = _run(tmp_path, "quantize", "-f", "ppm", "-o", str(out), str(path))
+    assert result.returncode == 0
+    assert out.read_bytes() == path.read_bytes()
+
+def test_downsample(tmp_path):
+    env = dict(os.environ, JCOLOR2_CACHE_DIR=str(tmp_path / "cache"))
+    result = subprocess.run([sys.executable, script, "downsample"], env=env,
+                            input=b"\x1b[38;2;255;0;0mred\x1b[0m\n",
+                            capture_output=True)
+    assert result.returncode == 0
+    assert result.stdout == b"\x1b[38;5;196mred\x1b[0m\n"
+
+def test_profile(tmp_path):
+    result = _run(tmp_path, "--profile", "vim")
+    assert result.returncode == 0
+    assert result.stdout == _run(tmp_path, "vim").stdout
+    assert result.stderr.startswith("Phase ")
+    assert "\nrender vim " in result.stderr
+    result = _run(tmp_path, "--profile", "--profile-format", "json", "vim")
+    assert "render vim" in json.loads(result.stderr)["phases"]
+
+def test_errors(tmp_path):
+    result = _run(tmp_path, "lut", "check", str(tmp_path / "nonesuch"))
+    assert result.returncode == 1
+    assert result.stderr.startswith("Error: ")
+
+def test_serve(tmp_path):
+    client = os.path.join(os.path.dirname(script), "jcolor2_client.py")
+    with tempfile.TemporaryDirectory(prefix="jcolor2-", dir="/tmp") as d:
+        env = dict(os.environ, JCOLOR2_CACHE_DIR=str(tmp_path / "cache"),
+                   JCOLOR2_SOCKET=os.path.join(d, "s"))
+        # Twice, to check that a daemon can start where one exited.
+        for _ in range(2):
+            # Without a daemon, the client computes the results itself.
+            result = subprocess.run(
+                    [sys.executable, client, "term256", "#ff0000"], env=env,
+                    capture_output=True, text=True)
+            assert result.returncode == 0
+            assert result.stdout == "196\n"
+            daemon = subprocess.Popen([sys.executable, script, "serve"],
+                                      env=env)
+            try:
+                for _ in range(100):
+                    if os.path.exists(env["JCOLOR2_SOCKET"]):
+                        break
+                    time.sleep(0.1)
+                result = subprocess.run([sys.executable, client], env=env,
+                                        input="ping\nrgb nonesuch\n",
+                                        capture_output=True, text=True)
+                assert result.stdout == \
+                        "ok\nerror invalid color 'nonesuch'\n"
+                result = subprocess.run(
+                        [sys.executable, client, "rgb", "nonesuch"], env=env,
+                        capture_output=True, text=True)
+                assert result.returncode == 1
+                assert result.stderr == "Error: invalid color 'nonesuch'\n"
+            finally:
+                daemon.terminate()
+                assert daemon.wait() == 0
+            assert not os.path.exists(env["JCOLOR2_SOCKET"])
+
+def test_colormap(tmp_path):
+    np = pytest.importorskip("numpy")
+    out = tmp_path / "map.f32"
+    result = _run(tmp_path, "colormap", "cyclic", "-n", "64", "-f", "float32",
+                  "-o", str(out))
+    assert result.returncode == 0
+    assert np.fromfile(out, dtype="<f4").shape == (64 * 3,)
+    result = _run(tmp_path, "colormap", "gradient", "black", "#ffffff",
+                  "-n", "3")
+    assert result.returncode == 0
+    assert result.stdout.startswith(
+            "\\pgfplotsset{colormap={jcolor2-gradient}{")
+    result = _run(tmp_path, "colormap", "gradient", "nonesuch", "black")
+    assert result.returncode == 1
+    assert result.stderr == "Error: invalid color 'nonesuch'\n"
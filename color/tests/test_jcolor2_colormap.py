@@ -0,0 +1,62 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import jcolor2
+import jcolor2_batch
+import jcolor2_colormap
+
+def _steps(rgb: np.ndarray, cyclic: bool = False) -> np.ndarray:
+    lab = jcolor2_batch.oklab_from_rgb(rgb)
+    if cyclic:
+        lab = np.concatenate([lab, lab[:1]])
+    return np.sqrt((np.diff(lab, axis=0) ** 2).sum(axis=1))
+
+def test_gradient():
+    colors = [jcolor2.palette[name] for name in ("black_dark", "blue", "white")]
+    rgb = jcolor2_colormap.gradient(colors, 1000)
+    assert rgb.shape == (1000, 3)
+    assert ((0.0 <= rgb) & (rgb <= 1.0)).all()
+    for stop, c in ((rgb[0], colors[0]), (rgb[-1], colors[-1])):
+        assert stop == pytest.approx([c.r, c.g, c.b], abs=1e-6)
+    # Evenly spaced, except that a step across a corner of the curve, e.g.
+    # where chroma starts being reduced into gamut, is a shorter chord.
+    steps = _steps(rgb)
+    assert steps.max() < 1.01 * np.median(steps)
+    assert (steps < 0.99 * np.median(steps)).sum() <= 2
+    assert steps.min() > 0.8 * np.median(steps)
+    # Lightness rises monotonically, as through the colors.
+    assert (np.diff(jcolor2_batch.oklab_from_rgb(rgb)[:, 0]) > 0.0).all()
+
+def test_gradient_errors():
+    with pytest.raises(ValueError):
+        jcolor2_colormap.gradient([jcolor2.rgb(0)], 10)
+
+def test_cyclic():
+    rgb = jcolor2_colormap.cyclic(360, L=0.7)
+    lch = jcolor2_batch.oklch_from_rgb(rgb)
+    assert lch[:, 0] == pytest.approx(0.7, abs=1e-6)
+    assert lch[:, 1] == pytest.approx(lch[0, 1], abs=1e-6)
+    # Evenly spaced, including from the last stop back to the first.
+    steps = _steps(rgb, cyclic=True)
+    assert steps.max() - steps.min() < 0.01 * steps.mean()
+    # Higher chroma than is in gamut at all hues is reduced where it's not.
+    rgb = jcolor2_colormap.cyclic(360, L=0.7, C=0.3)
+    assert ((0.0 <= rgb) & (rgb <= 1.0)).all()
+    lch = jcolor2_batch.oklch_from_rgb(rgb)
+    assert lch[:, 1].max() < 0.3 and lch[:, 1].min() < lch[:, 1].max() - 0.05
+
+def test_formats():
+    rgb = np.array([[0.0, 0.5, 1.0], [1.0, 0.25, 0.0]])
+    assert jcolor2_colormap.to_pgfplots(rgb, "x") == (
+            "\\pgfplotsset{colormap={x}{%\n"
+            "rgb=(0.00000,0.50000,1.00000)\n"
+            "rgb=(1.00000,0.25000,0.00000)\n"
+            "}}\n")
+    assert jcolor2_colormap.to_csv(rgb) == (
+            "t,r,g,b\n"
+            "0.000000,0.000000,0.500000,1.000000\n"
+            "1.000000,1.000000,0.250000,0.000000\n")
+    data = jcolor2_colormap.to_float32(rgb)
+    assert np.frombuffer(data, dtype="<f4").reshape(-1, 3).tolist() == \
+            rgb.tolist()
@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+
+import pytest
+
+import jcolor2
+import jcolor2_downsample
+
+def _code(r: int, g: int, b: int) -> int:
+    return jcolor2.term256_code(jcolor2.RGBColor.from_8b(r, g, b))
+
+def _downsample(*chunks: bytes) -> bytes:
+    d = jcolor2_downsample.Downsampler(_code)
+    return b"".join(d.feed(chunk) for chunk in chunks) + d.finish()
+
+@pytest.mark.parametrize("data, expected", [
+        (b"\x1b[38;2;255;0;0mred", b"\x1b[38;5;196mred"),
+        (b"\x1b[1;48;2;95;135;175;4m", b"\x1b[1;48;5;67;4m"),
+        (b"\x1b[38;2;255;255;255;48;2;0;0;0m", b"\x1b[38;5;231;48;5;16m"),
+        # 38;5;N whose N looks like truecolor.
+        (b"\x1b[38;5;2;38;2;0;0;0m", b"\x1b[38;5;2;38;5;16m"),
+])
+def test_rewrites_truecolor(data, expected):
+    assert _downsample(data) == expected
+
+@pytest.mark.parametrize("data", [
+        b"plain text\n",
+        b"\x1b[0m\x1b[38;5;196m\x1b[1;31m",
+        b"\x1b[38;2;256;0;0m",
+        b"\x1b[38;2;1;2m",
+        b"\x1b[38:2::1:2:3m",
+        b"\x1b[58;2;1;2;3m",
+        b"\x1b]8;2;x\x1b\\",
+        b"\x1b[",
+        b"\x1b",
+])
+def test_passes_through(data):
+    assert _downsample(data) == data
+
+def test_split_sequences():
+    data = b"a\x1b[38;2;255;0;0mb\x1b[48;2;0;0;255mc" * 3
+    expected = _downsample(data)
+    assert expected == b"a\x1b[38;5;196mb\x1b[48;5;21mc" * 3
+    for i in range(len(data)):
+        assert _downsample(data[:i], data[i:]) == expected
+    assert _downsample(*(data[i:i + 1] for i in range(len(data)))) == expected
+
+def test_cache_is_bounded():
+    d = jcolor2_downsample.Downsampler(_code, cache_size=2)
+    for v in (0, 1, 2, 0):
+        d.feed(b"\x1b[38;2;%d;0;0m" % v)
+    info = d.cache_info()
+    assert info.currsize == 2
+    assert info.misses == 4
+    # A new sequence of a cached color.
+    d.feed(b"\x1b[48;2;0;0;0m")
+    assert d.cache_info().hits == 1
+
+class _Output(object):
+    # A binary file recording what was written when flushed.
+    def __init__(self):
+        self.data = b""
+        self.flushed = b""
+        self.flushed_event = threading.Event()
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    def flush(self) -> None:
+        self.flushed = self.data
+        self.flushed_event.set()
+
+def test_filter_fd_flushes_partial_sequence():
+    r, w = os.pipe()
+    out = _Output()
+    d = jcolor2_downsample.Downsampler(_code)
+    thread = threading.Thread(target=jcolor2_downsample.filter_fd,
+                              args=(d, r, out), kwargs={"timeout": 0.01})
+    thread.start()
+    try:
+        os.write(w, b"a\x1b")
+        # Held back, then written after the timeout without more input.
+        deadline = time.monotonic() + 10
+        while out.flushed != b"a\x1b" and time.monotonic() < deadline:
+            out.flushed_event.wait(0.1)
+            out.flushed_event.clear()
+        assert out.flushed == b"a\x1b"
+        os.write(w, b"[38;2;255;0;0mb\x1b")
+    finally:
+        os.close(w)
+        thread.join()
+        os.close(r)
+    # The rest of a sequence arriving after the timeout is passed through
+    # unchanged, and a partial sequence at the end of the input is written.
+    assert out.data == b"a\x1b[38;2;255;0;0mb\x1b"
@@ -0,0 +1,107 @@
+import json
+import struct
+
+import pytest
+
+import jcolor2
+import jcolor2_lut
+
+def _write_table(path, info: dict, codes: bytes | None = None) -> None:
+    # Writes a table file with the layout described in jcolor2_lut, without
+    # the minute it takes to compute a real one.
+    header = json.dumps(info, sort_keys=True).encode()
+    prefix = jcolor2_lut.MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % 4096)
+    if codes is None:
+        codes = bytes(1 << 24)
+    with open(path, "wb") as f:
+        f.write(prefix + codes)
+
+@pytest.fixture
+def fake_build(monkeypatch):
+    """Replaces build() with one that writes a current table of zeros, and
+    records its calls."""
+    calls = []
+    def build(path, palette="240", metric="oklab", jobs=None):
+        calls.append((str(path), palette, metric))
+        _write_table(path, jcolor2_lut.palette_info(palette, metric))
+    monkeypatch.setattr(jcolor2_lut, "build", build)
+    return calls
+
+def test_lookups(tmp_path):
+    path = tmp_path / "t.lut"
+    codes = bytearray(1 << 24)
+    codes[0xff0000] = 196
+    codes[0x5f87af] = 67
+    _write_table(path, jcolor2_lut.palette_info(), bytes(codes))
+    with jcolor2_lut.Term256LUT(str(path)) as lut:
+        assert lut.is_current()
+        assert lut.code_24(0xff0000) == 196
+        assert lut.code(jcolor2.rgb(0x5f87af)) == 67
+        # Rounded to 8 bits.
+        assert lut.code(jcolor2.RGBColor(0.3725, 0.5294, 0.6863)) == 67
+        np = pytest.importorskip("numpy")
+        assert lut.codes_24(np.array([0xff0000, 0x5f87af, 0])).tolist() == \
+                [196, 67, 0]
+
+def test_load_current(tmp_path, fake_build):
+    path = tmp_path / "t.lut"
+    _write_table(path, jcolor2_lut.palette_info("16", "oklab"))
+    lut = jcolor2_lut.load(str(path), "16", "oklab")
+    lut.close()
+    assert fake_build == []
+
+def test_load_builds_missing_table(tmp_path, fake_build):
+    path = tmp_path / "t.lut"
+    with pytest.raises(FileNotFoundError):
+        jcolor2_lut.load(str(path), rebuild=False)
+    jcolor2_lut.load(str(path)).close()
+    assert fake_build == [(str(path), "240", "oklab")]
+
+@pytest.mark.parametrize("info", [
+        # Built from a different definition of the palette.
+        dict(jcolor2_lut.palette_info(), fingerprint="0" * 64),
+        # Built for another palette or metric.
+        jcolor2_lut.palette_info("16"),
+        jcolor2_lut.palette_info("240", "oklch"),
+])
+def test_load_rebuilds_stale_table(tmp_path, fake_build, info):
+    path = tmp_path / "t.lut"
+    _write_table(path, info)
+    with pytest.raises(ValueError, match="out of date"):
+        jcolor2_lut.load(str(path), rebuild=False)
+    jcolor2_lut.load(str(path)).close()
+    assert fake_build == [(str(path), "240", "oklab")]
+
+@pytest.mark.parametrize("contents", [
+        b"",
+        b"not a lookup table\n" * 100,
+        jcolor2_lut.MAGIC,
+        jcolor2_lut.MAGIC + struct.pack("<I", 2) + b"{}",
+        jcolor2_lut.MAGIC + struct.pack("<I", 2) + b"[]" + bytes(1 << 24),
+        jcolor2_lut.MAGIC + struct.pack("<I", 5) + b"{",
+])
+def test_load_never_overwrites_other_files(tmp_path, fake_build, contents):
+    path = tmp_path / "t.lut"
+    path.write_bytes(contents)
+    with pytest.raises(ValueError):
+        jcolor2_lut.load(str(path))
+    assert path.read_bytes() == contents
+    assert fake_build == []
+
+def test_metric_params_invalidate_table(tmp_path, monkeypatch):
+    path = tmp_path / "t.lut"
+    _write_table(path, jcolor2_lut.palette_info("240", "oklch"))
+    monkeypatch.setattr(jcolor2.metrics["oklch"], "weights", (1.0, 1.0, 1.0))
+    with jcolor2_lut.Term256LUT(str(path)) as lut:
+        assert not lut.is_current()
+    assert jcolor2_lut.palette_info("240", "oklch")["metric_params"] == \
+            {"weights": [1.0, 1.0, 1.0]}
+
+def test_build_rows():
+    pytest.importorskip("numpy")
+    # All colors with red 0x5f: one row of the table, in file order.
+    rows = jcolor2_lut._build_rows(("240", "oklab", 0x5f, 0x60))
+    assert len(rows) == 1 << 16
+    for val, code in enumerate(rows, 0x5f << 16):
+        assert code == jcolor2.term256_code(jcolor2.rgb(val)), hex(val)
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+import jcolor2
+import jcolor2_optimize
+
+def test_evaluate_current():
+    params = jcolor2_optimize.current_params()
+    obj = jcolor2_optimize.evaluate(params)
+    assert obj["contrast"] == min(jcolor2.contrast(c, jcolor2.palette["black"])
+                                  for c in jcolor2.delims)
+    assert obj["delim_distance"] == pytest.approx(jcolor2.C_seq, abs=1e-3)
+    assert 0.0 < obj["cterm_error"] < 0.1
+
+def test_evaluate_restores_constants():
+    current = jcolor2_optimize.current_params()
+    params = current._replace(L_hue=0.7, delim_hues=(0, 180))
+    obj = jcolor2_optimize.evaluate(params)
+    assert jcolor2_optimize.current_params() == current
+    assert obj != jcolor2_optimize.evaluate(current)
+
+def test_candidates_are_on_the_grid():
+    gen = jcolor2_optimize.candidates(0)
+    assert next(gen) == jcolor2_optimize.current_params()
+    for _, params in zip(range(100), gen):
+        for name, (lo, hi, step) in jcolor2_optimize.ranges.items():
+            value = getattr(params, name)
+            assert lo - 1e-9 <= value <= hi + 1e-9
+            assert abs(round((value - lo) / step) * step + lo - value) < 1e-9
+        assert len(params.delim_hues) == len(jcolor2.delim_hues)
+
+def test_rank():
+    results = {
+            "a": {"delim_distance": 0.2, "contrast": 4.0, "cterm_error": 0.0},
+            "b": {"delim_distance": 0.1, "contrast": 5.0, "cterm_error": 0.0},
+            "c": {"delim_distance": 0.1, "contrast": 6.0, "cterm_error": 0.0},
+            "d": {"delim_distance": 0.3, "contrast": 6.0, "cterm_error": 1.0},
+    }
+    ranked = jcolor2_optimize.rank(results, 4.5, 0.5)
+    assert [p for p, _ in ranked] == ["c", "b", "d", "a"]
+
+def test_search_resumes_from_checkpoint(tmp_path, monkeypatch):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    results = jcolor2_optimize.search(3, jobs=1, checkpoint=checkpoint)
+    assert len(results) == 3
+    assert jcolor2_optimize.current_params() in results
+    with open(checkpoint) as f:
+        assert len(json.load(f)["results"]) == 3
+    assert jcolor2_optimize.load_checkpoint(checkpoint) == results
+    # Continues with the next candidates.
+    more = jcolor2_optimize.search(2, jobs=1, checkpoint=checkpoint)
+    assert len(more) == 5
+    assert results.items() <= more.items()
+    # Changed constants invalidate the checkpoint.
+    monkeypatch.setattr(jcolor2, "C_seq", 0.1)
+    assert jcolor2_optimize.load_checkpoint(checkpoint) == {}
+
+def test_invalid_checkpoint(tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text("[]")
+    with pytest.raises(ValueError):
+        jcolor2_optimize.load_checkpoint(str(checkpoint))
+    assert jcolor2_optimize.load_checkpoint(str(tmp_path / "nonesuch")) == {}
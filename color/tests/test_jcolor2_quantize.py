@@ -0,0 +1,101 @@
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import jcolor2
+import jcolor2_quantize
+
+def _random_rgb8(height: int, width: int) -> np.ndarray:
+    return np.random.default_rng(height * width).integers(
+            0, 256, (height, width, 3), dtype=np.uint8)
+
+def _write_ppm(path, rgb8: np.ndarray, comment: bool = False) -> None:
+    height, width, _ = rgb8.shape
+    header = "P6\n# comment\n" if comment else "P6 "
+    with open(path, "wb") as f:
+        f.write(f"{header}{width} {height}\n255\n".encode())
+        f.write(rgb8.tobytes())
+
+def _codes(image, **kwargs) -> np.ndarray:
+    return np.concatenate(list(jcolor2_quantize.quantize(image, **kwargs)))
+
+def test_ppm_matches_nearest(tmp_path):
+    rgb8 = _random_rgb8(7, 5)
+    path = tmp_path / "in.ppm"
+    _write_ppm(path, rgb8, comment=True)
+    with jcolor2_quantize.NetpbmImage(str(path)) as image:
+        assert (image.width, image.height) == (5, 7)
+        codes = _codes(image, rows=3)
+    assert codes.shape == (7, 5)
+    for c, code in zip(rgb8.reshape(-1, 3).tolist(), codes.ravel().tolist()):
+        assert code == jcolor2.term256_code(jcolor2.RGBColor.from_8b(*c))
+
+def test_pam_formats(tmp_path):
+    rgb8 = _random_rgb8(4, 3)
+    path = tmp_path / "in.pam"
+    rgba16 = np.concatenate([rgb8, np.zeros((4, 3, 1), np.uint8)], axis=-1)
+    rgba16 = rgba16.astype(">u2") * 257
+    with open(path, "wb") as f:
+        f.write(b"P7\nWIDTH 3\nHEIGHT 4\nDEPTH 4\nMAXVAL 65535\n"
+                b"TUPLTYPE RGB_ALPHA\nENDHDR\n")
+        f.write(rgba16.tobytes())
+    with jcolor2_quantize.NetpbmImage(str(path)) as image:
+        np.testing.assert_allclose(image.rows(0, 4), rgb8 / 255.0)
+        codes = _codes(image)
+    grey_path = tmp_path / "grey.pam"
+    with open(grey_path, "wb") as f:
+        f.write(b"P7\nWIDTH 3\nHEIGHT 4\nDEPTH 1\nMAXVAL 255\n"
+                b"TUPLTYPE GRAYSCALE\nENDHDR\n")
+        f.write(rgb8[..., 0].tobytes())
+    with jcolor2_quantize.NetpbmImage(str(grey_path)) as image:
+        assert (image.rows(0, 4) == (rgb8[..., :1] / 255.0)).all()
+    with jcolor2_quantize.NetpbmImage(str(path)) as image:
+        assert (_codes(image) == codes).all()
+
+@pytest.mark.parametrize("data", [b"P5 1 1 255\n\0", b"P6 1 1 255\n\0",
+                                  b"P6 1 1", b"P7\nWIDTH 1\nENDHDR\n"])
+def test_invalid_images(tmp_path, data):
+    path = tmp_path / "bad.ppm"
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        jcolor2_quantize.NetpbmImage(str(path))
+
+def test_dither(tmp_path):
+    # A palette color, which dithers to itself, and a color between palette
+    # colors, which dithers to a mix of them.
+    exact = np.full((6, 8, 3), [0x5f, 0x87, 0xaf], dtype=np.uint8)
+    path = tmp_path / "exact.ppm"
+    _write_ppm(path, exact)
+    with jcolor2_quantize.NetpbmImage(str(path)) as image:
+        assert (_codes(image, dither=True, rows=4) == 67).all()
+    between = np.full((6, 8, 3), [0x70, 0x70, 0x70], dtype=np.uint8)
+    _write_ppm(path, between)
+    with jcolor2_quantize.NetpbmImage(str(path)) as image:
+        plain = _codes(image)
+        dithered = _codes(image, dither=True, rows=4)
+    assert len(set(plain.ravel().tolist())) == 1
+    assert len(set(dithered.ravel().tolist())) > 1
+
+def test_dither_blocks_are_seamless(tmp_path):
+    path = tmp_path / "in.ppm"
+    _write_ppm(path, _random_rgb8(9, 6))
+    with jcolor2_quantize.NetpbmImage(str(path)) as image:
+        whole = _codes(image, dither=True, rows=9)
+        assert (_codes(image, dither=True, rows=2) == whole).all()
+
+def test_write_ppm():
+    codes = np.array([[16, 231], [196, 67]])
+    out = io.BytesIO()
+    jcolor2_quantize.write_ppm(out, 2, 2, iter([codes]))
+    assert out.getvalue() == (b"P6\n2 2\n255\n" +
+                              bytes.fromhex("000000 ffffff ff0000 5f87af"))
+
+def test_write_ansi():
+    out = io.BytesIO()
+    jcolor2_quantize.write_ansi(out, iter([np.array([[1, 1], [2, 3]]),
+                                           np.array([[4, 5]])]))
+    assert out.getvalue().decode() == (
+            "\x1b[38;5;1m\x1b[48;5;2m▀\x1b[48;5;3m▀\x1b[0m\n"
+            "\x1b[38;5;4m▀\x1b[38;5;5m▀\x1b[0m\n")
@@ -0,0 +1,131 @@
+import os
+import re
+
+import pytest
+
+import jcolor2
+import jcolor2_render
+
+home = jcolor2_render.default_home
+
+def _read(path: str) -> str:
+    with open(os.path.join(home, path)) as f:
+        return f.read()
+
+def test_color_table():
+    table = jcolor2_render.ColorTable()
+    for name, c in jcolor2.palette.items():
+        entry = table[name]
+        assert entry.color == c
+        assert entry.gui == str(c)
+        assert entry.cterm == jcolor2.term256_code(c)
+    c = jcolor2.rgb(0x5f87af)
+    assert table.resolve(c).cterm == 67
+    assert table.resolve(c) is table.resolve(c)
+
+def test_color_table_of_other_palette():
+    palette = {"fg": jcolor2.rgb(0xff0000), "bg": jcolor2.rgb(0x000000)}
+    table = jcolor2_render.ColorTable(palette)
+    assert table["fg"].cterm == 196
+    assert table["bg"].cterm == 16
+    with pytest.raises(KeyError):
+        table["black"]
+
+@pytest.mark.parametrize("name, path, pattern", [
+        ("xresources", ".Xresources", r'^#include "(.*)"$'),
+        ("tmux", ".tmux.conf", r"^source-file ~/(.*)$"),
+        ("i3", ".i3/config", r"^include ~/(.*)$"),
+])
+def test_dotfiles_include_targets(name, path, pattern):
+    included = re.findall(pattern, _read(path), re.MULTILINE)
+    assert included == [jcolor2_render.targets[name].path]
+
+@pytest.mark.parametrize("name", ["xresources", "tmux", "i3"])
+def test_included_targets_are_current(name):
+    assert _read(jcolor2_render.targets[name].path) == \
+            jcolor2_render.render_to_string(name)
+
+def test_i3_variables_are_defined():
+    config = _read(".i3/config")
+    used = set(re.findall(r"\$jcolor2_\w+", config))
+    assert used
+    defined = set(re.findall(r"^set (\$jcolor2_\w+) ",
+                             jcolor2_render.render_to_string("i3"),
+                             re.MULTILINE))
+    assert used <= defined
+    # Defined before use.
+    include = config.index("include ~/.config/jcolor2/i3.conf")
+    assert include < min(config.index(v) for v in used)
+
+@pytest.fixture
+def render_home(tmp_path):
+    return str(tmp_path / "home"), str(tmp_path / "cache" / "manifest.json")
+
+def test_render_writes_targets(render_home):
+    home, manifest = render_home
+    results = jcolor2_render.render(["vim", "i3"], home,
+                                    manifest_path=manifest)
+    assert [written for _, written in results] == [True, True]
+    for (path, _), name in zip(results, ["vim", "i3"]):
+        assert path == os.path.join(home, jcolor2_render.targets[name].path)
+        with open(path) as f:
+            assert f.read() == jcolor2_render.render_to_string(name)
+    # The manifest isn't written into home.
+    assert os.path.exists(manifest)
+    assert sorted(os.listdir(home)) == [".config", ".vim"]
+    assert os.listdir(os.path.join(home, ".config/jcolor2")) == ["i3.conf"]
+
+def test_render_skips_unchanged_targets(render_home, monkeypatch):
+    home, manifest = render_home
+    jcolor2_render.render(["vim", "tmux"], home, manifest_path=manifest)
+    def fail(*args, **kwargs):
+        raise AssertionError("palette computed")
+    monkeypatch.setattr(jcolor2_render, "ColorTable", fail)
+    results = jcolor2_render.render(["vim", "tmux"], home,
+                                    manifest_path=manifest)
+    assert [written for _, written in results] == [False, False]
+
+def test_render_rewrites_changed_targets(render_home, monkeypatch):
+    home, manifest = render_home
+    jcolor2_render.render(["vim", "tmux"], home, manifest_path=manifest)
+    # Edited output.
+    path = os.path.join(home, jcolor2_render.targets["vim"].path)
+    with open(path, "a") as f:
+        f.write("edited\n")
+    results = jcolor2_render.render(["vim", "tmux"], home,
+                                    manifest_path=manifest)
+    assert [written for _, written in results] == [True, False]
+    with open(path) as f:
+        assert f.read() == jcolor2_render.render_to_string("vim")
+    # Changed inputs.
+    monkeypatch.setattr(jcolor2, "L_hue", jcolor2.L_hue - 0.01)
+    results = jcolor2_render.render(["vim", "tmux"], home,
+                                    manifest_path=manifest)
+    assert [written for _, written in results] == [True, True]
+
+def test_render_force(render_home):
+    home, manifest = render_home
+    jcolor2_render.render(["tmux"], home, manifest_path=manifest)
+    results = jcolor2_render.render(["tmux"], home, force=True,
+                                    manifest_path=manifest)
+    assert results[0][1]
+
+def test_render_homes_are_separate(render_home, tmp_path):
+    home, manifest = render_home
+    other = str(tmp_path / "other")
+    jcolor2_render.render(["tmux"], home, manifest_path=manifest)
+    results = jcolor2_render.render(["tmux"], other, manifest_path=manifest)
+    assert results[0][1]
+    results = jcolor2_render.render(["tmux"], home, manifest_path=manifest)
+    assert not results[0][1]
+
+@pytest.mark.parametrize("data", ["", "junk", "[]", '{"targets": []}'])
+def test_render_invalid_manifest(render_home, data):
+    home, manifest = render_home
+    os.makedirs(os.path.dirname(manifest))
+    with open(manifest, "w") as f:
+        f.write(data)
+    results = jcolor2_render.render(["tmux"], home, manifest_path=manifest)
+    assert results[0][1]
+    results = jcolor2_render.render(["tmux"], home, manifest_path=manifest)
+    assert not results[0][1]
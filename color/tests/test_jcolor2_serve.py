@@ -0,0 +1,97 @@
+import os
+import tempfile
+import threading
+
+import pytest
+
+import jcolor2
+import jcolor2_client
+import jcolor2_serve
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to about 100 bytes, which tmp_path may
+    # exceed.
+    with tempfile.TemporaryDirectory(prefix="jcolor2-", dir="/tmp") as d:
+        yield os.path.join(d, "s")
+
+@pytest.fixture
+def server(socket_path):
+    server = jcolor2_serve.make_server(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+@pytest.mark.parametrize("request_, response", [
+        ("ping", "ok"),
+        ("rgb #5f87af oklab:0,0,0 oklch:1,0,0", "ok #5f87af #000000 #ffffff"),
+        ("oklab #ffffff", "ok oklab:1.000000,0.000000,0.000000"),
+        ("term256 #ff0000 #5f87af", "ok 196 67"),
+        ("contrast #ffffff #000000 #000000 #000000", "ok 21.0000 1.0000"),
+        ("", "error empty request"),
+        ("nonesuch", "error unknown command 'nonesuch'"),
+        ("rgb #12345", "error invalid color '#12345'"),
+        ("rgb oklab:1,2", "error invalid color 'oklab:1,2'"),
+        ("rgb nonesuch", "error invalid color 'nonesuch'"),
+        ("contrast #ffffff", "error contrast takes pairs of colors"),
+        ("rgb oklab:nan,0,0", "error invalid color 'oklab:nan,0,0'"),
+        ("term256 oklab:nan,0,0", "error invalid color 'oklab:nan,0,0'"),
+        ("rgb oklch:inf,0,0", "error invalid color 'oklch:inf,0,0'"),
+        ("rgb oklab:0.5,0,-inf", "error invalid color 'oklab:0.5,0,-inf'"),
+])
+def test_respond(request_, response):
+    assert jcolor2_serve.respond(request_) == response
+
+def test_conversions_round_trip():
+    for word in ("#5f87af", "#ff0000", "black"):
+        c = jcolor2_serve.parse_color(word)
+        for model in ("oklab", "oklch"):
+            status, result = jcolor2_serve.respond(f"{model} {word}").split()
+            assert str(jcolor2_serve.parse_color(result)) == str(c)
+
+@pytest.mark.parametrize("word", [
+        "oklch:0.1,0.3,250", "oklab:2,0,0", "oklab:-1,0,0", "oklab:0.5,1,1",
+])
+def test_out_of_gamut(word):
+    c = jcolor2_serve.parse_color(word)
+    assert c.in_gamut()
+    for command in ("rgb", "oklab", "oklch", "term256"):
+        assert jcolor2_serve.respond(f"{command} {word}").startswith("ok ")
+
+def test_unexpected_error(monkeypatch):
+    def fail(args):
+        raise TypeError("oops")
+    monkeypatch.setitem(jcolor2_serve.commands, "fail", fail)
+    assert jcolor2_serve.respond("fail") == "error TypeError: oops"
+
+def test_palette():
+    white = str(jcolor2.palette["white"])
+    assert jcolor2_serve.respond("palette white") == f"ok {white}"
+    assert jcolor2_serve.respond("rgb white") == f"ok {white}"
+    assert f"white={white}" in jcolor2_serve.respond("palette").split()
+
+def test_query(server, socket_path):
+    requests = ["term256 #ff0000", "nonesuch", "ping"] * 2000
+    assert jcolor2_client.query(requests, socket_path) == \
+            [jcolor2_serve.respond(r) for r in requests]
+
+def test_query_without_daemon(socket_path):
+    assert jcolor2_client.connect(socket_path) is None
+    assert jcolor2_client.query(["term256 #ff0000"], socket_path) == \
+            ["ok 196"]
+
+def test_one_daemon_per_socket(server, socket_path):
+    with pytest.raises(OSError):
+        jcolor2_serve.make_server(socket_path)
+
+def test_request_too_long(server, socket_path):
+    sock = jcolor2_client.connect(socket_path)
+    with sock:
+        sock.sendall(b"ping\n" + b"x" * (jcolor2_serve._MAX_LINE + 1))
+        data = b""
+        while chunk := sock.recv(1 << 16):
+            data += chunk
+    assert data == b"ok\nerror request too long\n"
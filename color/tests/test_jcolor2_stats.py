@@ -0,0 +1,66 @@
+import pytest
+
+import jcolor2
+import jcolor2_render
+import jcolor2_stats
+
+@pytest.fixture
+def stats():
+    stats = jcolor2_stats.enable()
+    yield stats
+    jcolor2_stats.disable()
+
+def test_counts_calls(stats):
+    c = jcolor2.rgb(0x5f87af)
+    jcolor2.term256_code(c)
+    jcolor2.contrast(c, c)
+    jcolor2.contrast(c, c)
+    jcolor2.OklchColor(0.5, 0.1, 20).to_rgb()
+    assert stats.calls["term256_code"] == 1
+    assert stats.calls["contrast"] == 2
+    assert stats.calls["RGBColor.to_oklab"] >= 1
+    assert stats.calls["OklchColor.to_rgb"] == 1
+    assert stats.calls["OklchColor.to_oklab"] == 1
+    assert stats.calls["OklabColor.to_rgb"] == 1
+    assert stats.calls["saturate"] == 0
+
+def test_disable_restores_functions():
+    originals = (jcolor2.term256_code, jcolor2.RGBColor.to_oklab)
+    stats = jcolor2_stats.enable()
+    assert jcolor2.term256_code is not originals[0]
+    assert jcolor2_stats.disable() is stats
+    assert jcolor2_stats.active() is None
+    assert (jcolor2.term256_code, jcolor2.RGBColor.to_oklab) == originals
+    jcolor2.term256_code(jcolor2.rgb(0))
+    assert stats.calls["term256_code"] == 0
+    assert jcolor2_stats.disable() is None
+
+def test_phases(stats, tmp_path):
+    with jcolor2_stats.phase("outer"):
+        with jcolor2_stats.phase("inner"):
+            pass
+        with jcolor2_stats.phase("inner"):
+            pass
+    jcolor2_render.render(["vim", "tmux"], str(tmp_path / "home"), force=True,
+                          manifest_path=str(tmp_path / "manifest.json"))
+    assert list(stats.phases) == ["outer", "inner", "palette", "render vim",
+                                  "output", "render tmux"]
+    assert stats.phases["inner"][1] == 2
+    assert stats.phases["output"][1] == 2
+    assert stats.phases["outer"][0] >= stats.phases["inner"][0]
+
+def test_phases_are_free_when_disabled():
+    with jcolor2_stats.phase("x"):
+        pass
+    assert jcolor2_stats.active() is None
+
+def test_formats(stats):
+    jcolor2.contrast(jcolor2.rgb(0), jcolor2.rgb(0xffffff))
+    with jcolor2_stats.phase("p"):
+        pass
+    data = stats.to_json()
+    assert data["calls"]["contrast"] == 1
+    assert data["phases"]["p"]["count"] == 1
+    table = stats.table()
+    assert "\np " in table
+    assert "\ncontrast " in table
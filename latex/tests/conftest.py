@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules are scripts in the parent directory rather than a package.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
@@ -0,0 +1,235 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import tex_build
+
+class FakeTeX(object):
+    """Stands in for subprocess.call, running LaTeX and BibTeX on paper.tex
+    by writing the files they would."""
+
+    def __init__(self, aux):
+        # Returns the text of paper.aux that the next run of LaTeX writes
+        self.aux = aux
+        self.runs = []
+
+    def __call__(self, args):
+        self.runs.append(os.path.basename(args[0]))
+        if self.runs[-1] == "bibtex":
+            # From the citations and database
+            with open("paper.bbl", "w") as f:
+                f.write(self.aux())
+                with open("refs.bib") as bib:
+                    f.write(bib.read())
+            return 0
+        with open("paper.fls", "w") as f:
+            f.write("PWD {}\nINPUT paper.tex\nINPUT paper.aux\n"
+                    "OUTPUT paper.aux\nINPUT paper.bbl\nOUTPUT paper.pdf\n"
+                    .format(os.getcwd()))
+        with open("paper.aux", "w") as f:
+            f.write(self.aux())
+        return 0
+
+@pytest.fixture
+def paper(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "paper.tex").write_text("\\documentclass{article}\n")
+    (tmp_path / "refs.bib").write_text("@misc{a, title={A}}\n")
+    return tmp_path
+
+def _build(monkeypatch, aux, **kwargs):
+    tex = FakeTeX(aux)
+    monkeypatch.setattr(tex_build.subprocess, "call", tex)
+    deps = tex_build.build("paper", state=tex_build.BuildState(), **kwargs)
+    return tex.runs, deps
+
+def test_build_converges(paper, monkeypatch):
+    aux = lambda: "\\relax\n"
+    runs, deps = _build(monkeypatch, aux)
+    # Once to write the .aux file, and once to read it back
+    assert runs == ["pdflatex", "pdflatex"]
+    assert deps == set(["paper.tex"])
+    runs, deps = _build(monkeypatch, aux)
+    assert runs == ["pdflatex"]
+
+def test_build_stops_after_max_passes(paper, monkeypatch, capsys):
+    passes = []
+    def aux():
+        passes.append(None)
+        return "\\newlabel{pass}{%d}\n" % len(passes)
+    runs, deps = _build(monkeypatch, aux, max_passes=3)
+    assert runs == ["pdflatex"] * 3
+    assert "didn't converge after 3 passes" in capsys.readouterr().err
+
+def test_build_runs_bibtex_when_bibliography_changes(paper, monkeypatch):
+    text = ["\\citation{a}\n\\bibdata{refs}\n\\bibstyle{plain}\n"]
+    aux = lambda: text[0]
+    runs, deps = _build(monkeypatch, aux)
+    assert runs == ["pdflatex", "bibtex", "pdflatex"]
+    assert deps == set(["paper.tex", "refs.bib"])
+    # Unchanged
+    runs, deps = _build(monkeypatch, aux)
+    assert runs == ["pdflatex"]
+    # Other citations, or databases
+    text[0] = "\\citation{a}\n\\citation{b}\n\\bibdata{refs}\n"
+    runs, deps = _build(monkeypatch, aux)
+    assert runs == ["pdflatex", "bibtex", "pdflatex"]
+    (paper / "refs.bib").write_text("@misc{b, title={B}}\n")
+    runs, deps = _build(monkeypatch, aux)
+    assert runs == ["pdflatex", "bibtex", "pdflatex"]
+    # The .bbl file is missing
+    (paper / "paper.bbl").unlink()
+    runs, deps = _build(monkeypatch, aux)
+    assert runs == ["pdflatex", "bibtex", "pdflatex"]
+    # Changes elsewhere in the .aux file
+    text[0] += "\\newlabel{sec}{{1}{1}}\n"
+    runs, deps = _build(monkeypatch, aux)
+    assert runs == ["pdflatex", "pdflatex"]
+
+def test_bib_state(paper):
+    assert tex_build.bib_state("paper") is None
+    (paper / "paper.aux").write_text(
+            "\\citation{a,b}\n\\@input{ch1.aux}\n\\bibdata{refs,other}\n")
+    (paper / "ch1.aux").write_text("\\citation{c}\n")
+    assert tex_build.bib_inputs("paper") == (["a", "b", "c"],
+                                             ["refs", "other"], [])
+    state = tex_build.bib_state("paper")
+    assert tex_build.bib_state("paper") == state
+    (paper / "refs.bib").write_text("")
+    assert tex_build.bib_state("paper") != state
+
+def test_build_state(paper):
+    state = tex_build.BuildState()
+    assert state.docs == {}
+    state.docs["paper"] = {"bib": "x"}
+    state.save()
+    assert tex_build.BuildState().docs == {"paper": {"bib": "x"}}
+    (paper / tex_build.BUILD_STATE).write_text('{"version": 0, "docs": {}}')
+    assert tex_build.BuildState().docs == {}
+
+def test_build_fails(paper, monkeypatch):
+    monkeypatch.setattr(tex_build.subprocess, "call", lambda args: 1)
+    with pytest.raises(tex_build.BuildError):
+        tex_build.build("paper", state=tex_build.BuildState())
+
+def test_command_line():
+    assert tex_build.command_line(
+            "pdflatex -interaction=nonstopmode '-jobname=my paper'",
+            "-recorder") == ["pdflatex", "-recorder",
+                             "-interaction=nonstopmode", "-jobname=my paper"]
+
+DEPS = set(["paper.tex", "sections/intro.tex", "figures/plot.pdf"])
+KNOWN = DEPS | set(["paper.aux", "paper.log", "notes.txt"])
+
+@pytest.mark.parametrize("path, created, source", [
+        # Dependencies, written or replaced
+        ("paper.tex", False, True),
+        ("sections/intro.tex", True, True),
+        # New files, such as figures
+        ("figures/new.pdf", True, True),
+        ("sections/conclusion.tex", True, True),
+        # Files known before, and files written but not created
+        ("notes.txt", True, False),
+        ("figures/new.pdf", False, False),
+        # Written by the build
+        ("paper.pdf", True, False),
+        ("paper.synctex.gz", True, False),
+        # Hidden, backup, and temporary files
+        (".paper.tex.swp", True, False),
+        ("sections/.#intro.tex", True, False),
+        ("sections/#intro.tex#", True, False),
+        ("paper.tex~", True, False),
+        ("sections/intro.tex.tmp1234", True, False),
+])
+def test_is_source(path, created, source):
+    assert tex_build.is_source("paper", path, created, DEPS, KNOWN) == source
+
+def test_watched_dirs(tmp_path, monkeypatch):
+    for d in ("sections", "figures", "figures/old", ".git", "shared"):
+        (tmp_path / d).mkdir()
+    (tmp_path / "paper.tex").write_text("")
+    monkeypatch.chdir(tmp_path)
+    assert tex_build.watched_dirs(
+            ["paper.tex", "sections/intro.tex", "figures/old/plot.pdf",
+             "../common/macros.sty"]) == set([
+            ".", "sections", "figures", "figures/old", "shared",
+            "../common"])
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"),
+                    reason="inotify is Linux only")
+def test_inotify(tmp_path):
+    d = str(tmp_path)
+    (tmp_path / "old.tex").write_text("")
+    inotify = tex_build.Inotify()
+    try:
+        inotify.watch([d])
+        assert inotify.files() == set([os.path.join(d, "old.tex")])
+        assert inotify.read(0) == []
+        (tmp_path / "old.tex").write_text("changed")
+        (tmp_path / "new.tex").write_text("")
+        (tmp_path / "sub").mkdir()
+        changes = []
+        while len(changes) < 3:
+            more = inotify.read(5)
+            assert more
+            changes.extend(more)
+        assert changes == [(os.path.join(d, "old.tex"), False),
+                           (os.path.join(d, "new.tex"), True),
+                           (os.path.join(d, "new.tex"), False)]
+        inotify.watch([])
+        (tmp_path / "other.tex").write_text("")
+        assert inotify.read(0.1) == []
+    finally:
+        inotify.close()
+
+class _Stop(Exception):
+    pass
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"),
+                    reason="inotify is Linux only")
+def test_watch_after_failed_build(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "paper.tex").write_text("\\documentclass{article}\n")
+    builds = []
+    def build(basename, latex, bibtex, max_passes):
+        builds.append(basename)
+        if len(builds) == 1:
+            raise tex_build.BuildError("pdflatex failed on paper.tex")
+        return set(["paper.tex"])
+    def on_build(deps):
+        raise _Stop()
+    monkeypatch.setattr(tex_build, "build", build)
+    result = []
+    def run():
+        try:
+            tex_build.watch("paper", delay=0.01, on_build=on_build)
+        except _Stop:
+            result.append("rebuilt")
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    # Edit the source until it is built again, since the watch may not have
+    # started yet.
+    deadline = time.time() + 10
+    while thread.is_alive() and time.time() < deadline:
+        (tmp_path / "paper.tex").write_text("\\documentclass{article}\n")
+        thread.join(0.1)
+    assert result == ["rebuilt"]
+    assert builds == ["paper", "paper"]
+
+def test_unbuilt_deps(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "paper.tex").write_text("\\input{intro}\n")
+    (tmp_path / "intro.tex").write_text("")
+    (tmp_path / "fig.pdf").write_text("")
+    cache = tex_build.tex_deps.DepCache()
+    cache.put("paper", "pdflatex", ["paper.tex", "fig.pdf"], "recorder")
+    cache.save()
+    assert tex_build.unbuilt_deps("paper", "pdflatex") == set([
+            "paper.tex", "intro.tex", "fig.pdf"])
+    os.remove(tex_build.tex_deps.DEP_CACHE)
+    (tmp_path / "paper.tex").unlink()
+    assert tex_build.unbuilt_deps("paper", "pdflatex") == set(["paper.tex"])
@@ -0,0 +1,421 @@
+import os
+import sys
+
+import pytest
+
+import tex_deps
+
+# A trace of pdflatex and kpsewhich run as in strace_deps_of(), with -f and
+# the output directory /tmp/out.
+TRACE = """\
+1000 execve("/usr/bin/pdflatex", ["pdflatex", "paper"], 0x7ffd /* 30 vars */) = 0
+1000 openat(AT_FDCWD, "/etc/ld.so.cache", O_RDONLY|O_CLOEXEC) = 3
+1000 newfstatat(AT_FDCWD, "paper.tex", {st_mode=S_IFREG|0644, st_size=512, ...}, 0) = 0
+1000 openat(AT_FDCWD, "paper.tex", O_RDONLY) = 3
+1000 openat(AT_FDCWD, "/tmp/out/paper.log", O_WRONLY|O_CREAT|O_TRUNC, 0666) = 4
+1000 openat(AT_FDCWD, "paper.aux", O_RDONLY) = -1 ENOENT (No such file or directory)
+1000 openat(AT_FDCWD, "/tmp/out/paper.aux", O_RDONLY) = 5
+1000 openat(AT_FDCWD, "/tmp/out/paper.aux", O_WRONLY|O_CREAT|O_TRUNC, 0666) = 5
+1000 newfstatat(AT_FDCWD, "sections", {st_mode=S_IFDIR|0755, st_size=4096, ...}, 0) = 0
+1000 openat(AT_FDCWD, "sections", O_RDONLY|O_NONBLOCK|O_CLOEXEC|O_DIRECTORY) = 6
+[pid  1001] execve("/usr/bin/kpsewhich", ["kpsewhich", "fig.pdf"], 0x7ffd /* 30 vars */ <unfinished ...>
+1000 openat(AT_FDCWD, "sections/intro.tex", O_RDONLY <unfinished ...>
+[pid  1001] <... execve resumed>) = 0
+[pid  1001] newfstatat(AT_FDCWD, "figures/fig.pdf", {st_mode=S_IFREG|0644, st_size=9, ...}, 0) = 0
+1000 <... openat resumed>) = 7
+1001 +++ exited with 0 +++
+1000 openat(AT_FDCWD, "figures/fig.pdf", O_RDONLY) = 8
+1000 openat(AT_FDCWD, "new.tex", O_WRONLY|O_CREAT|O_TRUNC, 0666) = 9
+1000 openat(AT_FDCWD, "new.tex", O_RDONLY) = 9
+1000 openat(AT_FDCWD, "my file.tex", O_RDONLY) = 10
+1000 openat(AT_FDCWD, "caf\\303\\251.tex", O_RDONLY) = 11
+1000 openat(3, "relative.tex", O_RDONLY) = 12
+1000 openat(AT_FDCWD, "rw.tex", O_RDWR) = 13
+1000 exit_group(0)                      = ?
+1000 +++ exited with 0 +++
+"""
+
+def test_strace_calls():
+    calls = list(tex_deps.strace_calls(TRACE.splitlines(True)))
+    assert calls[0] == (1000, "execve", '"/usr/bin/pdflatex", ["pdflatex", '
+                        '"paper"], 0x7ffd /* 30 vars */', 0)
+    assert (1000, "openat", '"paper.aux", O_RDONLY', -1) in [
+            (pid, call, args.split(", ", 1)[1], result)
+            for pid, call, args, result in calls if call == "openat"]
+    # Unfinished calls are reassembled, and generated when they finish.
+    opens = [(pid, args) for pid, call, args, result in calls
+             if call == "openat" and "intro" in args]
+    assert opens == [(1000, 'AT_FDCWD, "sections/intro.tex", O_RDONLY')]
+    resumed = [call for pid, call, args, result in calls if pid == 1001]
+    assert resumed == ["execve", "newfstatat"]
+    assert calls.index((1001, "newfstatat",
+                        'AT_FDCWD, "figures/fig.pdf", {st_mode=S_IFREG|0644, '
+                        'st_size=9, ...}, 0', 0)) < \
+            calls.index((1000, "openat",
+                         'AT_FDCWD, "sections/intro.tex", O_RDONLY', 7))
+    assert calls[-1] == (1000, "exit_group", "0", None)
+
+def test_strace_calls_without_pids():
+    assert list(tex_deps.strace_calls([
+            'openat(AT_FDCWD, "a.tex", O_RDONLY) = 3\n',
+            'openat(AT_FDCWD, "b.tex", O_RDONLY <unfinished ...>\n',
+            '<... openat resumed>) = 4\n',
+            '<... openat resumed>) = 5\n',
+            'garbage\n',
+            # Short calls' results are padded to line up.
+            'open("c.tex", O_RDONLY)                 = 6\n',
+    ])) == [(None, "openat", 'AT_FDCWD, "a.tex", O_RDONLY', 3),
+            (None, "openat", 'AT_FDCWD, "b.tex", O_RDONLY', 4),
+            (None, "open", '"c.tex", O_RDONLY', 6)]
+
+@pytest.mark.parametrize("call, args, result, access", [
+        ("openat", 'AT_FDCWD, "a.tex", O_RDONLY', 3, ("a.tex", False)),
+        ("openat", 'AT_FDCWD, "./b/../a.tex", O_RDONLY|O_CLOEXEC', 3,
+         ("a.tex", False)),
+        ("open", '"a.tex", O_RDONLY', 3, ("a.tex", False)),
+        ("openat2", 'AT_FDCWD, "a.tex", {flags=O_RDONLY, mode=0}, 24', 3,
+         ("a.tex", False)),
+        ("openat", 'AT_FDCWD, "a.log", O_WRONLY|O_CREAT|O_TRUNC, 0666', 4,
+         ("a.log", True)),
+        ("openat", 'AT_FDCWD, "a.log", O_WRONLY', 4, ("a.log", True)),
+        ("openat", 'AT_FDCWD, "a.log", O_RDONLY|O_CREAT, 0666', 4,
+         ("a.log", True)),
+        ("openat", 'AT_FDCWD, "a.tex", O_RDWR', 4, ("a.tex", True)),
+        # Failed calls
+        ("openat", 'AT_FDCWD, "a.tex", O_RDONLY', -1, None),
+        ("openat", 'AT_FDCWD, "a.tex", O_RDONLY', None, None),
+        # Absolute, relative to another directory, and directories
+        ("openat", 'AT_FDCWD, "/usr/share/a.sty", O_RDONLY', 3, None),
+        ("openat", '3, "a.tex", O_RDONLY', 3, None),
+        ("openat", 'AT_FDCWD, "d", O_RDONLY|O_DIRECTORY', 3, None),
+        ("newfstatat",
+         'AT_FDCWD, "d", {st_mode=S_IFDIR|0755, st_size=4096, ...}, 0', 0,
+         None),
+        ("newfstatat",
+         'AT_FDCWD, "a.tex", {st_mode=S_IFREG|0644, st_size=9, ...}, 0', 0,
+         ("a.tex", False)),
+        ("stat", '"a.tex", {st_mode=S_IFREG|0644, st_size=9, ...}', 0,
+         ("a.tex", False)),
+        ("execve", '"./run.sh", ["./run.sh"], 0x7ffd /* 30 vars */', 0,
+         ("run.sh", False)),
+        ("read", '3, "a.tex", 4096', 5, None),
+        # Escaped names
+        ("openat", r'AT_FDCWD, "my\"file.tex", O_RDONLY', 3,
+         ('my"file.tex', False)),
+        ("openat", r'AT_FDCWD, "caf\303\251.tex", O_RDONLY', 3,
+         ("café.tex", False)),
+])
+def test_strace_file_access(call, args, result, access):
+    assert tex_deps.strace_file_access(call, args, result) == access
+
+def test_strace_file_access_in_outdir():
+    assert tex_deps.strace_file_access(
+            "openat", 'AT_FDCWD, "/tmp/out/sub/a.aux", O_RDONLY', 3,
+            "/tmp/out") == ("sub/a.aux", False)
+    assert tex_deps.strace_file_access(
+            "openat", 'AT_FDCWD, "/tmp/outside.aux", O_RDONLY', 3,
+            "/tmp/out") is None
+
+def test_strace_deps():
+    assert tex_deps.strace_deps(TRACE.splitlines(True), "/tmp/out") == set([
+            "paper.tex", "sections/intro.tex", "figures/fig.pdf",
+            "my file.tex", "café.tex"])
+
+def test_strace_dep_filename():
+    assert tex_deps.strace_dep_filename(
+            'open("a.tex", O_RDONLY) = 3\n') == "a.tex"
+    assert tex_deps.strace_dep_filename(
+            'open("a.log", O_WRONLY|O_CREAT, 0666) = 3\n') is None
+
+FAKE_STRACE = """\
+#!{python}
+# Runs the command after the options of strace_deps_of(), and writes a trace
+# of it reading paper.tex and writing its .aux file to the -o file.
+import subprocess, sys
+args = sys.argv[1:]
+trace = args[args.index("-o") + 1]
+command = args[args.index("-e") + 2:]
+outdir = command[command.index("-output-directory") + 1]
+status = subprocess.call(command)
+with open(trace, "w") as f:
+    f.write('1 openat(AT_FDCWD, "paper.tex", O_RDONLY) = 3\\n')
+    f.write('1 openat(AT_FDCWD, "%s/paper.aux", O_WRONLY|O_CREAT, 0666) = 4\\n'
+            % outdir)
+sys.exit(status)
+"""
+
+NOISY_LATEX = """\
+#!/bin/sh
+# Writes what looks like a traced call to its standard error.
+echo 'openat(AT_FDCWD, "stderr.tex", O_RDONLY) = 3' >&2
+exit {status}
+"""
+
+def _script(path, text):
+    path.write_text(text)
+    path.chmod(0o755)
+    return str(path)
+
+@pytest.mark.parametrize("status, deps", [(0, set(["paper.tex"])), (1, None)])
+def test_strace_deps_of(tmp_path, monkeypatch, status, deps):
+    monkeypatch.setattr(tex_deps, "STRACE", _script(
+            tmp_path / "strace", FAKE_STRACE.format(python=sys.executable)))
+    monkeypatch.setattr(tex_deps, "HAVE_STRACE", True)
+    latex = _script(tmp_path / "latex", NOISY_LATEX.format(status=status))
+    monkeypatch.chdir(tmp_path)
+    assert tex_deps.strace_deps_of("paper", latex) == deps
+
+FLS = """\
+PWD /home/user/paper
+INPUT /usr/share/texlive/texmf-dist/tex/latex/base/article.cls
+INPUT paper.tex
+OUTPUT /tmp/out/paper.log
+INPUT ./sections/intro.tex
+INPUT sections/intro.tex
+INPUT /tmp/out/paper.aux
+OUTPUT /tmp/out/paper.aux
+INPUT /tmp/out/sections/intro.aux
+OUTPUT /tmp/out/sections/intro.aux
+INPUT paper.bbl
+INPUT other.bbl
+INPUT figures/fig.pdf
+OUTPUT /tmp/out/paper.pdf
+"""
+
+def test_fls_files():
+    inputs, outputs = tex_deps.fls_files(FLS.splitlines(True), "/tmp/out")
+    assert inputs == set(["paper.tex", "sections/intro.tex", "paper.aux",
+                          "sections/intro.aux", "paper.bbl", "other.bbl",
+                          "figures/fig.pdf"])
+    assert outputs == set(["paper.log", "paper.aux", "sections/intro.aux",
+                           "paper.pdf"])
+
+def test_fls_deps():
+    # Files that the run wrote, and the .bbl file generated from its .aux
+    # file, are left out.
+    assert tex_deps.fls_deps(FLS.splitlines(True), "/tmp/out") == set([
+            "paper.tex", "sections/intro.tex", "other.bbl", "figures/fig.pdf"])
+    # Without an output directory, files in it aren't relative.
+    assert tex_deps.fls_deps(FLS.splitlines(True)) == set([
+            "paper.tex", "sections/intro.tex", "paper.bbl", "other.bbl",
+            "figures/fig.pdf"])
+
+FAKE_LATEX = """\
+#!/bin/sh
+# Writes the file list of a run on the last argument to -output-directory.
+while [ $# -gt 1 ]; do
+    [ "$1" = -output-directory ] && outdir=$2
+    shift
+done
+printf 'PWD %s\\nINPUT %s.tex\\nINPUT %s/%s.aux\\nOUTPUT %s/%s.aux\\n' \\
+        "$PWD" "$1" "$outdir" "$1" "$outdir" "$1" > "$outdir/$1.fls"
+exit {status}
+"""
+
+@pytest.mark.parametrize("status, deps", [(0, set(["paper.tex"])), (1, None)])
+def test_recorder_deps_of(tmp_path, monkeypatch, status, deps):
+    latex = _script(tmp_path / "latex", FAKE_LATEX.format(status=status))
+    monkeypatch.chdir(tmp_path)
+    assert tex_deps.recorder_deps_of("paper", latex) == deps
+
+def test_tex_deps_of_falls_back_to_strace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tex_deps, "strace_deps_of",
+                        lambda basename, latex: set(["traced.tex"]))
+    latex = str(tmp_path / "nonesuch")
+    assert tex_deps.tex_deps_of("paper", latex) == set(["traced.tex"])
+    assert tex_deps.tex_deps_of("paper", latex, "recorder") is None
+    assert tex_deps.tex_deps_of("paper", latex, "strace") == \
+            set(["traced.tex"])
+
+def test_dep_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "paper.tex").write_text("\\input{intro}\n")
+    (tmp_path / "intro.tex").write_text("Intro\n")
+    path = str(tmp_path / tex_deps.DEP_CACHE)
+    deps = set(["paper.tex", "intro.tex"])
+    cache = tex_deps.DepCache(path)
+    assert cache.get("paper", "pdflatex", "recorder") is None
+    cache.put("paper", "pdflatex", deps | set(["missing.tex"]), "recorder")
+    cache.save()
+
+    cache = tex_deps.DepCache(path)
+    get = lambda: cache.get("paper", "pdflatex", "recorder")
+    assert get() == deps
+    assert cache.get("paper", "lualatex", "recorder") is None
+    assert cache.get("other", "pdflatex", "recorder") is None
+
+    # Touched, but unchanged
+    os.utime(str(tmp_path / "intro.tex"), (0, 0))
+    assert get() == deps
+    assert cache.modified
+    # Changed, in size or only in content
+    (tmp_path / "intro.tex").write_text("Outro\n")
+    os.utime(str(tmp_path / "intro.tex"), (1, 1))
+    assert get() is None
+    (tmp_path / "intro.tex").write_text("Introduction\n")
+    assert get() is None
+    # Deleted
+    cache.put("paper", "pdflatex", deps, "recorder")
+    assert get() == deps
+    (tmp_path / "intro.tex").unlink()
+    assert get() is None
+
+@pytest.mark.parametrize("contents", ["", "{}", "[]", '{"version": 0}',
+                                      "not JSON"])
+def test_dep_cache_unknown_format(tmp_path, contents):
+    path = tmp_path / tex_deps.DEP_CACHE
+    path.write_text(contents)
+    assert tex_deps.DepCache(str(path)).docs == {}
+
+def test_make_deps():
+    assert tex_deps.make_deps(
+            ["paper.pdf", "paper.d"],
+            ["paper.tex", "my figure.pdf", "cost$.tex", "#1.tex"]) == (
+            "paper.pdf paper.d: \\#1.tex \\\n cost$$.tex \\\n"
+            " my\\ figure.pdf \\\n paper.tex\n"
+            "\\#1.tex:\n"
+            "cost$$.tex:\n"
+            "my\\ figure.pdf:\n"
+            "paper.tex:\n")
+
+def test_dep_cache_backends(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "paper.tex").write_text("Paper\n")
+    cache = tex_deps.DepCache(str(tmp_path / tex_deps.DEP_CACHE))
+    cache.put("paper", "pdflatex", ["paper.tex"], "strace")
+    assert cache.docs["paper"]["found_by"] == "strace"
+    assert cache.get("paper", "pdflatex", "strace") == set(["paper.tex"])
+    for backend in ("auto", "static", "recorder"):
+        assert cache.get("paper", "pdflatex", backend) is None
+    # Found by the backend that "auto" chose
+    for used in ("static", "recorder", "strace"):
+        cache.put("paper", "pdflatex", ["paper.tex"], "auto", used)
+        assert cache.get("paper", "pdflatex") == set(["paper.tex"])
+        assert cache.get("paper", "pdflatex", used) is None
+    # Found by a backend that wasn't asked for
+    cache.put("paper", "pdflatex", ["paper.tex"], "recorder", "strace")
+    assert cache.get("paper", "pdflatex", "recorder") is None
+
+def test_cached_tex_deps_of(tmp_path, monkeypatch):
+    (tmp_path / "paper.tex").write_text("\\subfile{missing}\n")
+    (tmp_path / "traced.tex").write_text("")
+    monkeypatch.chdir(tmp_path)
+    def no_recorder(basename, latex):
+        raise OSError("no file list")
+    monkeypatch.setattr(tex_deps, "recorder_deps_of", no_recorder)
+    monkeypatch.setattr(tex_deps, "strace_deps_of",
+                        lambda basename, latex: set(["traced.tex"]))
+    cache = tex_deps.DepCache()
+    assert tex_deps.cached_tex_deps_of("paper", "pdflatex", cache=cache) == \
+            set(["traced.tex"])
+    assert cache.docs["paper"]["found_by"] == "strace"
+    # Reused without tracing LaTeX again, but not for -recorder
+    monkeypatch.setattr(tex_deps, "strace_deps_of", None)
+    assert tex_deps.cached_tex_deps_of(
+            "paper", "pdflatex", cache=tex_deps.DepCache()) == \
+            set(["traced.tex"])
+    assert tex_deps.cached_tex_deps_of(
+            "paper", "pdflatex", "recorder", tex_deps.DepCache()) is None
+
+def _write_tree(top, files):
+    for fn, text in files.items():
+        path = top / fn
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+TREE = {
+        "a.tex": "\\documentclass{article}\n\\input{sec}\n",
+        "sec.tex": "A section, \\input by a.tex\n",
+        "notes.tex": "% \\documentclass{article}\nNot a document\n",
+        "sub/b.tex": "  \\documentclass[a4paper]{article}\n"
+                     "\\includegraphics{fig}\n",
+        "sub/fig.png": "",
+        "sub/b.txt": "\\documentclass{article}\n",
+        ".hidden/c.tex": "\\documentclass{article}\n",
+}
+
+def test_find_root_documents(tmp_path):
+    _write_tree(tmp_path, TREE)
+    assert tex_deps.find_root_documents(str(tmp_path)) == [
+            str(tmp_path / "a.tex"), str(tmp_path / "sub" / "b.tex")]
+
+def test_tree_deps_of(tmp_path, monkeypatch):
+    _write_tree(tmp_path / "tree", TREE)
+    latex = _script(tmp_path / "latex", FAKE_LATEX.format(status=0))
+    monkeypatch.chdir(tmp_path / "tree")
+    docs = tex_deps.find_root_documents(".")
+    expected = {"a.tex": set(["a.tex"]),
+                os.path.join("sub", "b.tex"): set(["b.tex"])}
+    assert tex_deps.tree_deps_of(docs, latex, "recorder", jobs=2) == \
+            expected
+    # Recorded in a cache in each document's directory, and reused without
+    # running LaTeX
+    assert (tmp_path / "tree" / tex_deps.DEP_CACHE).exists()
+    assert tex_deps.DepCache(os.path.join("sub", tex_deps.DEP_CACHE)).get(
+            "b", latex, "recorder") == set(["b.tex"])
+    os.remove(latex)
+    assert tex_deps.tree_deps_of(docs, latex, "recorder") == expected
+
+STATIC_TREE = {
+        "paper.tex": "\\documentclass{article}\n"
+                     "\\usepackage{local}\n"
+                     "\\graphicspath{{figures/}}\n"
+                     "\\import{chapters/}{one}\n"
+                     "\\subfile{appendix}\n"
+                     "\\includepdf[pages=-]{cover}\n"
+                     "\\includegraphics[width=5cm]{plot}\n"
+                     "% \\input{commented}\n"
+                     "\\begin{verbatim}\n\\input{verbatim}\n\\end{verbatim}\n"
+                     "\\lstinputlisting{code.py}\n"
+                     "\\bibliographystyle{local}\n"
+                     "\\bibliographystyle{plain}\n"
+                     "\\bibliography{refs,installed}\n",
+        "local.sty": "\\RequirePackage{graphicx}\n",
+        "chapters/one.tex": "\\input{two}\n\\subimport{sub/}{three}\n",
+        "chapters/two.tex": "",
+        "chapters/sub/three.tex": "\\includegraphics{fig}\n",
+        "chapters/sub/fig.png": "",
+        "appendix.tex": "\\documentclass[paper.tex]{subfiles}\n",
+        "cover.pdf": "",
+        "figures/plot.pdf": "",
+        "code.py": "",
+        "local.bst": "",
+        "refs.bib": "",
+        "commented.tex": "",
+        "verbatim.tex": "",
+}
+
+def test_static_deps_of(tmp_path, monkeypatch):
+    _write_tree(tmp_path, STATIC_TREE)
+    monkeypatch.chdir(tmp_path)
+    deps, unresolved = tex_deps.static_deps_of("paper")
+    assert unresolved == []
+    assert deps == set(fn for fn in STATIC_TREE
+                       if fn not in ("commented.tex", "verbatim.tex"))
+
+@pytest.mark.parametrize("source", [
+        "\\input{\\jobname-extra}",
+        "\\import{chapters/}{missing}",
+        "\\import{chapters/}",
+        "\\subfile{missing}",
+        "\\includepdf{missing}",
+        "\\includegraphics{missing}",
+        "\\lstinputlisting{missing.py}",
+        "\\inputminted{python}{missing.py}",
+])
+def test_static_deps_of_unresolved(tmp_path, monkeypatch, source):
+    (tmp_path / "paper.tex").write_text(source + "\n")
+    monkeypatch.chdir(tmp_path)
+    deps, unresolved = tex_deps.static_deps_of("paper")
+    assert deps == set(["paper.tex"])
+    assert unresolved == [("paper.tex", source)]
+
+def test_auto_backend_falls_back(tmp_path, monkeypatch):
+    (tmp_path / "paper.tex").write_text("\\subfile{missing}\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tex_deps, "recorder_deps_of",
+                        lambda basename, latex: set(["traced.tex"]))
+    assert tex_deps.tex_deps_of("paper", "pdflatex") == set(["traced.tex"])
+    assert tex_deps.tex_deps_of("paper", "pdflatex", "static") == \
+            set(["paper.tex"])
@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Build a .tex file, running LaTeX until its auxiliary files stop changing
+and BibTeX only when the citations or bibliography databases change, and
+record its dependencies from the build. Optionally, watch the dependencies
+with inotify and build again whenever they change."""
+
+from __future__ import absolute_import, division, print_function, \
+        unicode_literals
+import sys
+if sys.version_info.major < 3:
+    str = unicode
+    chr = unichr
+    from io import open
+
+import ctypes
+import ctypes.util
+import errno
+import glob
+import json
+import os
+import re
+import select
+import shlex
+import struct
+import subprocess
+
+import tex_deps
+
+
+# Files that LaTeX writes for a later pass to read, besides those of the
+# .fls file, which are found from the previous build's file list
+AUX_EXTS = (".aux", ".toc", ".lof", ".lot", ".out", ".nav", ".snm", ".bbl")
+# Files that BibTeX writes, which aren't dependencies
+BIBTEX_EXTS = (".bbl", ".blg")
+
+BUILD_STATE = ".tex_build.json"
+
+
+def files_read_back(basename):
+    """Return the files that the last run of LaTeX with -recorder on
+    `basename`.tex both wrote and read, such as the .aux files of \\include,
+    or an empty set if it didn't run."""
+    try:
+        with open(basename + ".fls", encoding="utf-8",
+                  errors="replace") as fls:
+            inputs, outputs = tex_deps.fls_files(fls)
+    except (IOError, OSError):
+        return set()
+    return inputs & outputs
+
+
+def hash_files(fns):
+    """Return a dictionary from each of the files `fns` to the hash of its
+    contents, or `None` if it doesn't exist."""
+    hashes = {}
+    for fn in fns:
+        try:
+            hashes[fn] = tex_deps.file_hash(fn)
+        except (IOError, OSError):
+            hashes[fn] = None
+    return hashes
+
+
+AUX_CITATION_RE = re.compile(r"^\\(citation|bibdata|bibstyle|@input)\{(.*)\}")
+def bib_inputs(basename):
+    """Return a tuple (citations, bibdata, bibstyle) of what `basename`.aux,
+    and the .aux files it inputs, give BibTeX: the cited keys in order, and
+    the names of the databases and the style."""
+    citations = []
+    bibdata = []
+    bibstyle = []
+    seen = set()
+    def read(aux):
+        if aux in seen:
+            return
+        seen.add(aux)
+        try:
+            with open(aux, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    m = AUX_CITATION_RE.match(line)
+                    if not m:
+                        continue
+                    kind, arg = m.groups()
+                    if kind == "@input":
+                        read(arg)
+                    elif kind == "citation":
+                        citations.extend(arg.split(","))
+                    elif kind == "bibdata":
+                        bibdata.extend(arg.split(","))
+                    else:
+                        bibstyle.append(arg)
+        except (IOError, OSError):
+            pass
+    read(basename + ".aux")
+    return citations, bibdata, bibstyle
+
+
+def bib_files(bibdata, bibstyle):
+    """Return the local files of the databases `bibdata` and styles
+    `bibstyle`."""
+    fns = [name if name.endswith(".bib") else name + ".bib"
+           for name in bibdata]
+    fns.extend(name + ".bst" for name in bibstyle)
+    return [os.path.normpath(fn) for fn in fns
+            if not os.path.isabs(fn) and os.path.isfile(fn)]
+
+
+def bib_state(basename):
+    """Return a string identifying everything BibTeX's output for
+    `basename` depends on, or `None` if it has no bibliography."""
+    citations, bibdata, bibstyle = bib_inputs(basename)
+    if not bibdata:
+        return None
+    state = {"citations": citations, "bibdata": bibdata, "bibstyle": bibstyle,
+             "files": hash_files(bib_files(bibdata, bibstyle))}
+    return str(json.dumps(state, sort_keys=True))
+
+
+class BuildState(object):
+    """A file recording, for each document, what its .bbl file was made
+    from."""
+
+    VERSION = 1
+
+    def __init__(self, path=BUILD_STATE):
+        self.path = path
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if (not isinstance(data, dict) or
+                    data.get("version") != self.VERSION or
+                    not isinstance(data.get("docs"), dict)):
+                raise ValueError("unknown format")
+            self.docs = data["docs"]
+        except (IOError, OSError, ValueError):
+            self.docs = {}
+
+    def save(self):
+        tex_deps.write_atomic(self.path, str(json.dumps(
+                {"version": self.VERSION, "docs": self.docs},
+                indent=1, sort_keys=True)) + "\n")
+
+
+class BuildError(Exception):
+    pass
+
+
+def command_line(command, *args):
+    """Return the command line that runs the shell-quoted `command`, which
+    may include options, with the options `args`, which come before those of
+    `command`, so that those given take precedence."""
+    words = shlex.split(command)
+    return words[:1] + list(args) + words[1:]
+
+
+def build(basename, latex="pdflatex", bibtex="bibtex", max_passes=5,
+          state=None):
+    """Build `basename`.tex and return its dependencies.
+
+    `latex` and `bibtex` are commands, which may include options. Each pass
+    runs `latex`, then `bibtex` if the citations, databases, or
+    style changed since it last ran, as recorded in the `BuildState`
+    `state`. Passes stop once the files that LaTeX reads back are the same
+    after a pass as before it, usually after one pass, or after `max_passes`
+    with a warning. The dependencies are those the last pass read, as for
+    `tex_deps.recorder_deps_of`, and BibTeX's inputs. Raises `BuildError` if
+    LaTeX or BibTeX fails."""
+    if state is None:
+        state = BuildState()
+    doc = state.docs.setdefault(basename, {})
+    for n in range(max_passes):
+        watched = (files_read_back(basename) |
+                   set(basename + ext for ext in AUX_EXTS))
+        before = hash_files(watched)
+        status = subprocess.call(command_line(
+                latex, "-recorder", "-interaction", "nonstopmode") +
+                [basename])
+        if status != 0:
+            raise BuildError("{} failed on {}.tex".format(latex, basename))
+        bib = bib_state(basename)
+        if bib is not None and (bib != doc.get("bib") or
+                                not os.path.exists(basename + ".bbl")):
+            # Don't trust a .bbl file from a BibTeX run that failed
+            doc.pop("bib", None)
+            state.save()
+            if subprocess.call(command_line(bibtex) + [basename]) >= 2:
+                raise BuildError("{} failed on {}.aux".format(bibtex,
+                                                             basename))
+            doc["bib"] = bib
+            state.save()
+        watched |= files_read_back(basename)
+        after = hash_files(watched)
+        if all(before.get(fn) == h for fn, h in after.items()):
+            break
+    else:
+        print("Warning: {}.tex didn't converge after {} passes.".format(
+                basename, max_passes), file=sys.stderr)
+    with open(basename + ".fls", encoding="utf-8", errors="replace") as fls:
+        deps = tex_deps.fls_deps(fls)
+    deps -= set(basename + ext for ext in BIBTEX_EXTS)
+    citations, bibdata, bibstyle = bib_inputs(basename)
+    deps.update(bib_files(bibdata, bibstyle))
+    return deps
+
+
+def record_deps(basename, latex, deps, make_deps=None, targets=None):
+    """Record `deps` as the dependencies of `basename`.tex in the
+    `tex_deps.DepCache`, as found from the file list of -recorder, and as
+    Make rules in the file `make_deps`, if given, for the files `targets`, by
+    default `basename`.pdf."""
+    cache = tex_deps.DepCache()
+    cache.put(basename, latex, deps, "recorder")
+    cache.save()
+    if make_deps:
+        tex_deps.write_atomic(make_deps, tex_deps.make_deps(
+                targets or [basename + ".pdf"], deps))
+
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class Inotify(object):
+    """Watches directories for changes to the files in them, using Linux's
+    inotify through libc."""
+
+    # Files written, or replaced, as editors that save to a temporary file
+    # do, created, or deleted
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+            IN_DELETE
+
+    def __init__(self):
+        """Raises `OSError` if inotify isn't available."""
+        name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(name, use_errno=True) if name else None
+        if libc is None or not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify isn't available")
+        self.libc = libc
+        self.fd = self.check(libc.inotify_init1(IN_CLOEXEC))
+        # Watched directories, and the other way around
+        self.dirs = {}
+        self.wds = {}
+
+    def check(self, result):
+        if result < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        return result
+
+    def watch(self, dirs):
+        """Watch exactly the directories `dirs`, as far as they exist."""
+        dirs = set(dirs)
+        for d in set(self.wds) - dirs:
+            self.libc.inotify_rm_watch(self.fd, self.wds.pop(d))
+        for d in dirs - set(self.wds):
+            wd = self.libc.inotify_add_watch(
+                    self.fd, d.encode(sys.getfilesystemencoding()),
+                    self.MASK | IN_ONLYDIR)
+            if wd >= 0:
+                self.wds[d] = wd
+                self.dirs[wd] = d
+
+    def read(self, timeout=None):
+        """Wait up to `timeout` seconds, or indefinitely if `None`, for
+        changes, and return a list of (path, created) tuples of the changed
+        files, where `created` is True if the file was created or moved
+        there. If changes were lost, returns `None`."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 1 << 16)
+        changes = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, pos)
+            pos += INOTIFY_EVENT.size
+            name = data[pos:pos + length].rstrip(b"\0")
+            pos += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                # The directory is gone
+                d = self.dirs.pop(wd, None)
+                if self.wds.get(d) == wd:
+                    del self.wds[d]
+            elif wd in self.dirs and not mask & IN_ISDIR:
+                path = os.path.normpath(os.path.join(
+                        self.dirs[wd],
+                        name.decode(sys.getfilesystemencoding(), "replace")))
+                changes.append((path, bool(mask & (IN_CREATE | IN_MOVED_TO))))
+        return changes
+
+    def files(self):
+        """Return the set of paths of the files in the watched
+        directories."""
+        paths = set()
+        for d in self.wds:
+            try:
+                paths.update(os.path.normpath(os.path.join(d, name))
+                             for name in os.listdir(d))
+            except OSError:
+                pass
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+def is_source(basename, path, created, deps, known):
+    """Return whether a change to the file `path` may change the build of
+    `basename`.tex, whose dependencies are `deps`: whether it is one of
+    them, or a new file in their directories, such as a figure. Files that
+    were `known` to exist after the build, those that the build writes, and
+    hidden, backup, and temporary files don't count."""
+    if path in deps:
+        return True
+    if not created or path in known:
+        return False
+    name = os.path.basename(path)
+    return not (name.startswith((".", "#")) or name.endswith("~") or
+                ".tmp" in name or
+                os.path.dirname(path) == "" and name.startswith(basename + "."))
+
+
+def watched_dirs(deps):
+    """Return the directories to watch for changes to the dependencies
+    `deps`: theirs, the current directory, and its subdirectories, where new
+    figures and sections may appear."""
+    dirs = set(os.path.dirname(fn) or os.curdir for fn in deps)
+    dirs.add(os.curdir)
+    dirs.update(d for d in os.listdir(os.curdir)
+                if not d.startswith(".") and os.path.isdir(d))
+    return dirs
+
+
+def unbuilt_deps(basename, latex):
+    """Return what to watch for changes to `basename`.tex while no build of
+    it has succeeded: the file, the dependencies last recorded in the
+    `tex_deps.DepCache`, and those found by reading its source."""
+    deps = set([basename + ".tex"])
+    doc = tex_deps.DepCache().docs.get(basename)
+    if isinstance(doc, dict) and isinstance(doc.get("deps"), dict):
+        deps.update(doc["deps"])
+    static = tex_deps.static_deps_of(basename)
+    if static is not None:
+        deps.update(static[0])
+    return deps
+
+
+def watch(basename, latex="pdflatex", bibtex="bibtex", max_passes=5,
+          delay=0.2, on_build=None):
+    """Build `basename`.tex, then build it again whenever its dependencies
+    change, until interrupted. Changes are waited for until none has been
+    made for `delay` seconds, so that bursts of writes, such as saving
+    several files at once, build once. `on_build` is called with the
+    dependencies after each build.
+
+    The `watched_dirs` of the dependencies are watched, rather than the
+    files, so that new files and files replaced by editors are noticed. The
+    dependencies of each build replace those watched before; until a build
+    succeeds, the `unbuilt_deps` are watched."""
+    inotify = Inotify()
+    deps = set()
+    try:
+        while True:
+            try:
+                deps = build(basename, latex, bibtex, max_passes)
+                if on_build is not None:
+                    on_build(deps)
+            except BuildError as e:
+                # Keep watching the last dependencies, to build again when
+                # the error is fixed
+                print("Error: {}.".format(e), file=sys.stderr)
+                if not deps:
+                    deps = unbuilt_deps(basename, latex)
+            inotify.watch(watched_dirs(deps))
+            known = inotify.files()
+            print("Watching {} files for changes.".format(len(deps)),
+                  file=sys.stderr)
+            # Wait for a change, then for the changes to stop
+            while True:
+                changes = inotify.read()
+                if changes is None or any(
+                        is_source(basename, path, created, deps, known)
+                        for path, created in changes):
+                    break
+            while inotify.read(delay):
+                pass
+    finally:
+        inotify.close()
+
+
+if __name__ == "__main__":
+
+    # Parse command-line arguments
+    import argparse
+    ap = argparse.ArgumentParser(description="TeX build script.")
+    ap.add_argument("basename", type=str, nargs='?', default=None,
+                    help="TeX file basename (can be autodetected)")
+    ap.add_argument("--latex", type=str, default="pdflatex",
+                    help="TeX command to run, which may include options, "
+                         "quoted as for the shell; defaults to pdflatex")
+    ap.add_argument("--bibtex", type=str, default="bibtex",
+                    help="BibTeX command to run, which may include options; "
+                         "defaults to bibtex")
+    ap.add_argument("--max-passes", type=int, default=5,
+                    help="most times to run LaTeX; defaults to 5")
+    ap.add_argument("-M", "--make-deps", type=str, metavar="FILE",
+                    help="write the dependencies as Make rules to this file")
+    ap.add_argument("--target", type=str, action="append",
+                    help="target of the Make rules, which may be given more "
+                         "than once; defaults to BASENAME.pdf")
+    ap.add_argument("-w", "--watch", action="store_true",
+                    help="build again whenever the dependencies change, "
+                         "until interrupted")
+    ap.add_argument("--delay", type=float, default=0.2,
+                    help="with --watch, seconds without changes to wait "
+                         "for before building; defaults to 0.2")
+    args = ap.parse_args()
+
+    # Ensure we have a .tex file
+    if args.basename:
+        basename = args.basename
+    else:
+        # Try to find exactly one document in the cwd
+        cwd_tex = [fn for fn in glob.glob("*.tex")
+                   if tex_deps.is_root_document(fn)]
+        if len(cwd_tex) == 0:
+            print("Error: No TeX file specified and no TeX files found.")
+            sys.exit(1)
+        elif len(cwd_tex) > 1:
+            print("Error: No TeX file specified and multiple TeX files found.")
+            sys.exit(1)
+        else:
+            basename = cwd_tex[0][:-4]
+
+    # Build the .tex file, and record its dependencies
+    def on_build(deps):
+        record_deps(basename, args.latex, deps, args.make_deps, args.target)
+    if args.watch:
+        try:
+            watch(basename, args.latex, args.bibtex, args.max_passes,
+                  args.delay, on_build)
+        except OSError as e:
+            print("Error: {}.".format(e))
+            sys.exit(1)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    try:
+        on_build(build(basename, args.latex, args.bibtex, args.max_passes))
+    except BuildError as e:
+        print("Error: {}.".format(e))
+        sys.exit(1)
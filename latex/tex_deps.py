@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-"""Get the dependencies of a .tex file using strace."""
+"""Get the dependencies of a .tex file, from the file list that TeX writes
+when run with -recorder, or using strace."""
 
 from __future__ import absolute_import, division, print_function, \
         unicode_literals
@@ -12,64 +13,802 @@ if sys.version_info.major < 3:
     from io import open
 
 import glob
+import hashlib
+import json
+import multiprocessing
 import os
 import re
+import shutil
+import subprocess
+import tempfile
 
 
-# Check for sh.py
-try:
-    import sh
-    HAVE_SH = True
-except ImportError:
-    HAVE_SH = False
+def find_program(name):
+    """Return the path of the program `name` on the search path, or `None` if
+    it isn't found."""
+    for d in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        path = os.path.join(d or os.curdir, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
 
 
 # Check for strace
-if HAVE_SH:
-    try:
-        sh.strace("true")
-        HAVE_STRACE = True
-    except sh.ErrorReturnCode:
-        HAVE_STRACE = True
-    except sh.CommandNotFound:
-        HAVE_STRACE = False
-else:
-    HAVE_STRACE = False
-if HAVE_STRACE:
-    trace_open = sh.strace.bake(e="trace=open", _no_out=True)
-
-
-STRACE_OPEN_RE = re.compile('^open\("(.*)", (\w*)\).*$')
+STRACE = find_program("strace")
+HAVE_STRACE = STRACE is not None
+
+
+# System calls that read, write, or look up files by name. Those that a
+# kernel or strace doesn't know are ignored, thanks to the "?".
+STRACE_OPEN_CALLS = frozenset(["open", "openat", "openat2"])
+STRACE_STAT_CALLS = frozenset(["stat", "stat64", "lstat", "lstat64",
+                               "newfstatat", "fstatat64", "statx"])
+STRACE_EXEC_CALLS = frozenset(["execve"])
+STRACE_TRACE = "trace=" + ",".join(
+        "?" + call for call in sorted(STRACE_OPEN_CALLS | STRACE_STAT_CALLS |
+                                      STRACE_EXEC_CALLS))
+
+# A line of strace output. With -f, lines start with the ID of the process
+# making the call, as "PID " or "[pid PID] ". A call that another process
+# interrupts ends in "<unfinished ...>", and is continued on a later line
+# starting "<... CALL resumed>".
+STRACE_LINE_RE = re.compile(
+        r'^(?:\[pid +(\d+)\] |(\d+) +)?(?:<\.\.\. (\w+) resumed>|(\w+)\()(.*)$')
+STRACE_UNFINISHED = " <unfinished ...>"
+# What separates a finished call's arguments from its result, which strace
+# pads with spaces to line results up
+STRACE_RESULT = " = "
+# The leading arguments of a call that takes a filename: the directory file
+# descriptor, if any, the filename as a C string, and any open flags.
+STRACE_ARGS_RE = re.compile(
+        r'^(?:(\w+), )?"((?:[^"\\]|\\.)*)"(?:, (?:\{flags=)?([A-Z0-9_|]+))?')
+STRACE_ESCAPE_RE = re.compile(r'\\(x[0-9a-fA-F]{2}|[0-7]{1,3}|.)')
+STRACE_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "v": "\v", "f": "\f"}
+
+
+def strace_unescape(s):
+    """Return the string that strace prints as the C string `s`."""
+    if "\\" not in s:
+        return s
+    data = bytearray()
+    pos = 0
+    for m in STRACE_ESCAPE_RE.finditer(s):
+        data += s[pos:m.start()].encode("utf-8")
+        esc = m.group(1)
+        if esc[0] == "x" and len(esc) == 3:
+            data.append(int(esc[1:], 16))
+        elif esc[0] in "01234567":
+            data.append(int(esc, 8) & 0xff)
+        else:
+            data += STRACE_ESCAPES.get(esc, esc).encode("utf-8")
+        pos = m.end()
+    data += s[pos:].encode("utf-8")
+    return bytes(data).decode("utf-8", "replace")
+
+
+def strace_calls(lines):
+    """Given an iterable of lines of strace output, generate a tuple
+    (pid, call, args, result) for each finished system call, where `pid` is
+    the ID of the calling process, or `None` if strace didn't print it, `args`
+    is the text of the call's arguments, and `result` is the returned integer,
+    or `None` if the process exited before the call returned.
+
+    Calls interrupted by other processes' calls are reassembled from their
+    unfinished and resumed lines, in the order in which they finish. Only
+    those lines are kept in memory, so traces of any length can be parsed in
+    constant memory."""
+    unfinished = {}
+    for line in lines:
+        m = STRACE_LINE_RE.match(line.rstrip("\r\n"))
+        if not m:
+            continue
+        pid, pid_f, resumed, call, rest = m.groups()
+        pid = pid or pid_f
+        pid = int(pid) if pid else None
+        if call is None:
+            start = unfinished.pop(pid, None)
+            if start is None or start[0] != resumed:
+                continue
+            call = start[0]
+            rest = start[1] + rest
+        if rest.endswith(STRACE_UNFINISHED):
+            unfinished[pid] = (call, rest[:-len(STRACE_UNFINISHED)])
+            continue
+        args, sep, result = rest.rpartition(STRACE_RESULT)
+        args = args.rstrip(" ")
+        if not sep or not args.endswith(")"):
+            continue
+        args = args[:-1]
+        # Followed by any error, e.g. "-1 ENOENT (No such file or directory)"
+        result = result.split(" ", 1)[0]
+        if result == "?":
+            result = None
+        else:
+            try:
+                result = int(result)
+            except ValueError:
+                continue
+        yield (pid, call, args, result)
+
+
+def output_relpath(fn, outdir):
+    """Given the absolute filename `fn` of a file that TeX run with
+    -output-directory `outdir` wrote, return its filename relative to
+    `outdir`, as it would have been without -output-directory. If it isn't in
+    `outdir`, return `None`."""
+    if outdir is None or not fn.startswith(outdir + os.sep):
+        return None
+    return fn[len(outdir) + 1:]
+
+
+def strace_file_access(call, args, result, outdir=None):
+    """Given a system call made by a process, as generated by `strace_calls`,
+    return a tuple (filename, written) if the call successfully accessed a
+    file by a relative pathname, where `written` is True if the file was
+    opened for writing. Otherwise return `None`.
+
+    Files are accessed by opening them, looking up their status, unless they
+    are directories, or executing them. Files in the directory `outdir` are
+    accessed by their `output_relpath`."""
+    if result is None or result < 0:
+        return None
+    if (call not in STRACE_OPEN_CALLS and call not in STRACE_STAT_CALLS and
+            call not in STRACE_EXEC_CALLS):
+        return None
+    m = STRACE_ARGS_RE.match(args)
+    if not m:
+        return None
+    dirfd, fn, flags = m.groups()
+    # Relative to some other directory than the current one
+    if dirfd is not None and dirfd != "AT_FDCWD":
+        return None
+    # Most files TeX reads are in its installation, so rule them out before
+    # any further work.
+    if len(fn) == 0 or (fn[0] == "/" and
+                        (outdir is None or not fn.startswith(outdir))):
+        return None
+    fn = strace_unescape(fn)
+    if fn[0] == "/":
+        fn = output_relpath(fn, outdir)
+        if fn is None:
+            return None
+    if call in STRACE_OPEN_CALLS:
+        flags = set((flags or "").split("|"))
+        written = ("O_RDONLY" not in flags or "O_CREAT" in flags or
+                   "O_TRUNC" in flags)
+        if "O_DIRECTORY" in flags:
+            return None
+    else:
+        written = False
+        if call in STRACE_STAT_CALLS and "S_IFDIR" in args:
+            return None
+    return (os.path.normpath(fn), written)
+
+
+# Extensions of files that other programs generate from files that LaTeX
+# writes, to be read by its next run: bibliographies from .aux files, and
+# indexes and glossaries from their entries
+GENERATED_FROM = {".bbl": ".aux", ".ind": ".idx", ".gls": ".glo",
+                  ".nls": ".nlo"}
+
+
+def generated_deps(reads, writes):
+    """Return the set of the filenames `reads`, of files that a run of LaTeX
+    read, that were generated from the files `writes` that it wrote, such as
+    the .bbl file that BibTeX writes from the .aux file. Such files change
+    with every build rather than being sources of it."""
+    generated = set()
+    for fn in reads:
+        root, ext = os.path.splitext(fn)
+        if ext in GENERATED_FROM and root + GENERATED_FROM[ext] in writes:
+            generated.add(fn)
+    return generated
+
+
 def strace_dep_filename(line):
     """Given a line from strace, if the line contains the name of a file
     considered to be a dependency, return the dependency's filename. Otherwise
     return `None`.
 
-    A file is considered to be a dependency if it is opened in read-only and is
-    referenced by a relative pathname."""
-    m = STRACE_OPEN_RE.match(line)
-    if m:
-        fn = m.group(1)
-        if len(fn) > 0 and not os.path.isabs(fn) and m.group(2) == "O_RDONLY":
-            return os.path.normpath(fn)
+    A file is considered to be a dependency if it is opened in read-only,
+    looked up, or executed, and is referenced by a relative pathname."""
+    for pid, call, args, result in strace_calls([line]):
+        access = strace_file_access(call, args, result)
+        if access and not access[1]:
+            return access[0]
     return None
 
 
-def tex_deps_of(basename, latex):
-    """Return the dependencies of the TeX file `basename`.tex. If the file's
-    dependencies cannot be identified, returns `None`."""
-    if HAVE_STRACE:
+def strace_deps(lines, outdir=None):
+    """Given an iterable of lines of strace output, return the set of
+    filenames of the dependencies of the traced processes. As with
+    `strace_dep_filename`, but files that any process writes are left out,
+    including those written to `outdir` (see `strace_file_access`), and
+    those generated from them (see `generated_deps`)."""
+    reads = set()
+    writes = set()
+    for pid, call, args, result in strace_calls(lines):
+        access = strace_file_access(call, args, result, outdir)
+        if access:
+            (writes if access[1] else reads).add(access[0])
+    return reads - writes - generated_deps(reads, writes)
+
+
+def make_outdir():
+    """Return a new temporary directory for the output of LaTeX, with the
+    subdirectories of the current directory, in which \\include writes .aux
+    files."""
+    outdir = tempfile.mkdtemp(prefix="tex_deps")
+    for root, dirs, files in os.walk(os.curdir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for d in dirs:
+            os.mkdir(os.path.join(outdir, root, d))
+    return outdir
+
+
+def latex_command(basename, latex, outdir, *options):
+    """Return the command line that runs `latex` on `basename`.tex, writing
+    its output to the directory `outdir` rather than over that of the
+    document's build."""
+    return ([latex] + list(options) +
+            ["-interaction", "batchmode", "-output-directory", outdir,
+             basename])
+
+
+def strace_deps_of(basename, latex):
+    """Return the dependencies of the TeX file `basename`.tex, by running
+    `latex` under strace, following the processes it starts, such as
+    kpsewhich. If the file's dependencies cannot be identified, returns
+    `None`."""
+    if not HAVE_STRACE:
+        return None
+    outdir = make_outdir()
+    try:
+        # Written by strace, rather than to the standard error shared with
+        # LaTeX, so that LaTeX's messages can't be mistaken for calls
+        trace = os.path.join(outdir, ".strace")
+        with open(os.devnull, "wb") as devnull:
+            try:
+                status = subprocess.call(
+                        [STRACE, "-f", "-q", "-o", trace, "-e", STRACE_TRACE] +
+                        latex_command(basename, latex, outdir),
+                        stdout=devnull, stderr=devnull)
+            except OSError:
+                return None
+        if status != 0:
+            return None
         try:
-            deps = set()
-            for open_line in trace_open(latex, "-interaction", "batchmode",
-                                        basename, _iter="err"):
-                dep = strace_dep_filename(open_line)
-                if dep:
-                    deps.add(dep)
-            return deps
-        except sh.ErrorReturnCode:
+            with open(trace, encoding="utf-8", errors="replace") as f:
+                return strace_deps(f, outdir)
+        except (IOError, OSError):
             return None
-    return None
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
+
+
+def fls_files(lines, outdir=None):
+    """Given the lines of a .fls file, as written by TeX run with -recorder,
+    return a tuple (inputs, outputs) of the sets of filenames of the files it
+    records TeX reading and writing, that are referenced by relative
+    pathnames. Files in the directory `outdir` are referenced by their
+    `output_relpath`."""
+    inputs = set()
+    outputs = set()
+    for line in lines:
+        record, _, fn = line.rstrip("\r\n").partition(" ")
+        if len(fn) > 0 and os.path.isabs(fn):
+            fn = output_relpath(fn, outdir)
+        if not fn:
+            continue
+        if record == "INPUT":
+            inputs.add(os.path.normpath(fn))
+        elif record == "OUTPUT":
+            outputs.add(os.path.normpath(fn))
+    return inputs, outputs
+
+
+def fls_deps(lines, outdir=None):
+    """Given the lines of a .fls file, return the set of filenames of the
+    dependencies it records.
+
+    As with `strace_dep_filename`, a file is considered to be a dependency if
+    it is referenced by a relative pathname and only read: files that TeX
+    both reads and writes, such as the .aux file, are left out, as are the
+    `generated_deps` of those it writes, such as the .bbl file. Files in the
+    directory `outdir` are referenced by their `output_relpath`."""
+    inputs, outputs = fls_files(lines, outdir)
+    return inputs - outputs - generated_deps(inputs, outputs)
+
+
+def recorder_deps_of(basename, latex):
+    """Return the dependencies of the TeX file `basename`.tex, by running
+    `latex` with -recorder and reading the file list it writes. This costs
+    no more than a plain run of `latex`. If the run fails, returns `None`; if
+    `latex` is not found or writes no file list, raises `OSError`."""
+    outdir = make_outdir()
+    try:
+        with open(os.devnull, "wb") as devnull:
+            status = subprocess.call(
+                    latex_command(basename, latex, outdir, "-recorder"),
+                    stdout=devnull, stderr=devnull)
+        if status != 0:
+            return None
+        fls = os.path.join(outdir, os.path.basename(basename) + ".fls")
+        with open(fls, encoding="utf-8", errors="replace") as fls_file:
+            return fls_deps(fls_file, outdir)
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
+
+
+# Environments whose contents TeX doesn't interpret as commands
+VERBATIM_ENVS = ("verbatim", "Verbatim", "BVerbatim", "LVerbatim",
+                 "lstlisting", "minted", "comment", "filecontents")
+# Commands that take the names of files, and whose arguments the static
+# scanner resolves
+STATIC_COMMANDS = ("input", "include", "includegraphics", "graphicspath",
+                   "bibliography", "bibliographystyle", "addbibresource",
+                   "documentclass", "LoadClass", "usepackage",
+                   "RequirePackage", "import", "subimport", "inputfrom",
+                   "subinputfrom", "includefrom", "subincludefrom", "subfile",
+                   "includepdf", "includestandalone", "includesvg",
+                   "lstinputlisting", "verbatiminput", "VerbatimInput",
+                   "inputminted", "externaldocument")
+# Commands among them that take the name of a file in their second argument,
+# after a directory or language
+STATIC_TWO_ARG_COMMANDS = ("import", "subimport", "inputfrom",
+                           "subinputfrom", "includefrom", "subincludefrom",
+                           "inputminted")
+# A piece of TeX source that the static scanner handles: inline verbatim
+# text; the start of a verbatim environment; a command taking a filename with
+# its arguments; or a braced argument that looks like a filename. Any of them
+# may be in a comment.
+STATIC_TOKEN_RE = re.compile(r"""
+    \\(?:
+        verb\*?(?P<delim>[^a-zA-Z\s*])[^\n]*?(?P=delim)
+      | begin\s*\{(?P<env>(?:""" + "|".join(VERBATIM_ENVS) + r""")\*?)\}
+      | (?P<cmd>""" + "|".join(STATIC_COMMANDS) + r""")(?![a-zA-Z@])\*?
+        (?:\s*\[[^\]]*\])*
+        (?:\s*\{(?P<arg>[^{}]*(?:\{[^{}]*\}[^{}]*)*)\}
+           (?:\s*\{(?P<arg2>[^{}]*)\})?
+          | [ \t]+(?P<bare>[^\s{}%]+))?)
+  | \{(?P<other>[^{}\\\s%]+\.\w+)\}
+""", re.VERBOSE)
+# A comment, which starts at a % that isn't escaped as \%
+COMMENT_RE = re.compile(r"(?<!\\)(?:\\\\)*%")
+# Extensions that \includegraphics tries, in order, for a name without one
+GRAPHICS_EXTS = (".pdf", ".png", ".jpg", ".jpeg", ".mps", ".jbig2", ".jb2",
+                 ".eps", ".PDF", ".PNG", ".JPG", ".JPEG", ".JBIG2", ".JB2",
+                 ".EPS")
+
+
+class StaticScanner(object):
+    """Finds the dependencies of a document by reading its source, without
+    running LaTeX. Files are named relative to the current directory, as TeX
+    names them.
+
+    The scanner follows \\input, \\include, \\subfile, the commands of the
+    import package, \\includegraphics and \\includepdf in the directories
+    given by \\graphicspath, \\bibliography, \\bibliographystyle,
+    \\addbibresource, and local classes and packages, and reads the TeX
+    files among them in turn. Comments and verbatim text are skipped. Any
+    other braced argument that names a local file is a dependency too.
+    Files that aren't in the document's directory tree, such as installed
+    packages, are left out.
+
+    Arguments that contain macros can't be resolved without running LaTeX;
+    they are collected in `unresolved`, as are those that don't name a local
+    file, except for those of \\input, bibliographies, and classes and
+    packages, which are often installed files."""
+
+    def __init__(self):
+        self.deps = set()
+        # (filename, command) of each argument that couldn't be resolved
+        self.unresolved = []
+        self.graphicspath = [""]
+        # The directory that \import made the current one for the files read
+        # from it, or "" for the document's
+        self.base = ""
+
+    def add(self, fn, base=None):
+        """Add the dependency `fn`, if it is a local file, and scan it if it
+        is TeX source, with the \\import directory `base`, if given. Return
+        whether it was a local file."""
+        if os.path.isabs(fn) or not os.path.isfile(fn):
+            return False
+        fn = os.path.normpath(fn)
+        if fn not in self.deps:
+            self.deps.add(fn)
+            if fn.endswith((".tex", ".cls", ".sty", ".clo")):
+                self.scan(fn, base)
+        return True
+
+    def add_first(self, names, base=None):
+        """Add the first of the filenames `names` that is a local file.
+        Return whether there was one."""
+        for fn in names:
+            if self.add(fn, base):
+                return True
+        return False
+
+    def names(self, *names):
+        """Return the filenames that TeX tries for the files `names`: in the
+        \\import directory, then in the current one."""
+        if not self.base:
+            return list(names)
+        return [os.path.join(self.base, fn) for fn in names] + list(names)
+
+    def scan(self, fn, base=None):
+        """Scan the TeX file `fn` for dependencies. If `base` is given, the
+        files it names are looked for in that directory first, as they are
+        in those read by \\import."""
+        with open(fn, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        outer = self.base
+        if base is not None:
+            self.base = base
+        try:
+            self.scan_text(fn, text)
+        finally:
+            self.base = outer
+
+    def scan_text(self, fn, text):
+        pos = 0
+        while True:
+            m = STATIC_TOKEN_RE.search(text, pos)
+            if not m:
+                break
+            pos = m.end()
+            # E.g. \\input, a line break followed by text
+            if text[m.start() - 1:m.start()] == "\\":
+                pos = m.start() + 1
+                continue
+            # Only what matches is checked for comments, since that is much
+            # faster than finding every comment.
+            line = text[text.rfind("\n", 0, m.start()) + 1:m.start()]
+            if "%" in line and COMMENT_RE.search(line):
+                pos = text.find("\n", m.start())
+                if pos < 0:
+                    break
+                continue
+            cmd = m.group("cmd")
+            if m.group("env"):
+                end = text.find("\\end{" + m.group("env") + "}", pos)
+                pos = end if end >= 0 else len(text)
+                continue
+            if cmd is None:
+                if m.group("other"):
+                    self.add(m.group("other"))
+                continue
+            args = [m.group("arg")]
+            if cmd in STATIC_TWO_ARG_COMMANDS:
+                args.append(m.group("arg2"))
+            elif m.group("arg2") is not None:
+                # Another group, which may name a file itself
+                pos = m.start("arg2") - 1
+            if args[0] is None:
+                args[0] = m.group("bare") if cmd == "input" else None
+                if args[0] is None:
+                    continue
+            if any(arg is None or "\\" in arg or "#" in arg for arg in args):
+                self.unresolved.append((fn, m.group(0)))
+                continue
+            if not self.command(cmd, *(arg.strip() for arg in args)):
+                self.unresolved.append((fn, m.group(0)))
+
+    def command(self, cmd, arg, arg2=None):
+        """Add the files named by the command `cmd` with the argument `arg`,
+        and `arg2` if it takes two. Return whether they were resolved."""
+        names = [a.strip() for a in arg.split(",") if a.strip()]
+        if cmd == "input":
+            self.add_first(self.names(arg + ".tex", arg))
+        elif cmd in ("include", "includestandalone"):
+            return self.add_first(self.names(arg + ".tex"))
+        elif cmd == "subfile":
+            return self.add_first(self.names(arg + ".tex", arg))
+        elif cmd in ("import", "inputfrom", "includefrom",
+                     "subimport", "subinputfrom", "subincludefrom"):
+            # Relative to the current \\import directory, for sub*
+            d = os.path.join(self.base, arg) if cmd[:3] == "sub" else arg
+            return self.add_first([os.path.join(d, arg2 + ".tex"),
+                                   os.path.join(d, arg2)], d)
+        elif cmd in ("includegraphics", "includepdf", "includesvg"):
+            exts = {"includegraphics": GRAPHICS_EXTS, "includepdf": (".pdf",),
+                    "includesvg": (".svg",)}[cmd]
+            return self.add_first(fn for d in self.graphicspath
+                                  for ext in ("",) + exts
+                                  for fn in self.names(os.path.join(
+                                          d, arg + ext)))
+        elif cmd == "graphicspath":
+            self.graphicspath = [""] + re.findall(r"\{([^{}]*)\}", arg)
+        elif cmd == "bibliography":
+            for name in names:
+                self.add(name if name.endswith(".bib") else name + ".bib")
+        elif cmd == "bibliographystyle":
+            self.add(arg + ".bst")
+        elif cmd == "externaldocument":
+            return self.add_first(self.names(arg + ".aux"))
+        elif cmd == "addbibresource":
+            self.add(arg)
+        elif cmd in ("lstinputlisting", "verbatiminput", "VerbatimInput"):
+            return self.add_first(self.names(arg))
+        elif cmd == "inputminted":
+            return self.add_first(self.names(arg2))
+        elif cmd in ("documentclass", "LoadClass"):
+            self.add(arg + ".cls")
+        else:
+            for name in names:
+                self.add(name + ".sty")
+        return True
+
+
+def static_deps_of(basename):
+    """Return a tuple (deps, unresolved) of the dependencies of the TeX file
+    `basename`.tex, as found by a `StaticScanner`, and the arguments it
+    couldn't resolve, as (filename, command) tuples. If the file can't be
+    read, returns `None`."""
+    scanner = StaticScanner()
+    try:
+        if not scanner.add(basename + ".tex"):
+            return None
+    except (IOError, OSError):
+        return None
+    return scanner.deps, scanner.unresolved
+
+
+BACKENDS = ("auto", "static", "recorder", "strace")
+def find_tex_deps(basename, latex, backend="auto"):
+    """Return a tuple (deps, used) of the dependencies of the TeX file
+    `basename`.tex, or `None` if they cannot be identified, and the backend
+    that was used to find them: `backend`, or for "auto", the one it chose.
+
+    `backend` is one of `BACKENDS`. The "static" backend reads the source
+    without running LaTeX, and warns about what it can't resolve. The "auto"
+    backend does the same, unless anything is unresolved; then it uses the
+    file list from -recorder, and falls back to strace if `latex` doesn't
+    write one."""
+    if backend in ("auto", "static"):
+        static = static_deps_of(basename)
+        if backend == "static":
+            if static is None:
+                return None, "static"
+            for fn, command in static[1]:
+                print("Warning: Couldn't resolve {} in {}.".format(
+                        " ".join(command.split()), fn), file=sys.stderr)
+            return static[0], "static"
+        if static is not None and not static[1]:
+            return static[0], "static"
+    if backend == "strace":
+        return strace_deps_of(basename, latex), "strace"
+    try:
+        return recorder_deps_of(basename, latex), "recorder"
+    except (IOError, OSError):
+        if backend == "auto":
+            return strace_deps_of(basename, latex), "strace"
+        return None, "recorder"
+
+
+def tex_deps_of(basename, latex, backend="auto"):
+    """Return the dependencies of the TeX file `basename`.tex, found by
+    `backend` as for `find_tex_deps`. If the file's dependencies cannot be
+    identified, returns `None`."""
+    return find_tex_deps(basename, latex, backend)[0]
+
+
+def file_hash(fn):
+    """Return the SHA-1 hash of the contents of the file `fn`, as a hex
+    string."""
+    h = hashlib.sha1()
+    with open(fn, "rb") as f:
+        while True:
+            data = f.read(1 << 16)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+def write_atomic(fn, text):
+    """Replace the file `fn` with one containing `text`, so that readers see
+    either the old or the new contents."""
+    tmp = "{}.tmp{}".format(fn, os.getpid())
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.rename(tmp, fn)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+DEP_CACHE = ".tex_deps.json"
+class DepCache(object):
+    """A file recording the dependencies of documents, with the modification
+    time, size, and content hash of each dependency when they were
+    identified. As long as none of these dependencies change, the document's
+    dependencies are known without running LaTeX again.
+
+    A dependency whose modification time changed, e.g. because it was checked
+    out again, is still unchanged if its size and contents are. Dependencies
+    are recorded for the backend of `find_tex_deps` that was asked for them,
+    and with the one that found them, so that those found by reading the
+    source and by running LaTeX aren't mistaken for each other."""
+
+    VERSION = 1
+
+    def __init__(self, path=DEP_CACHE):
+        """Read the cache file `path`. Dependencies are relative to the
+        directory it is in."""
+        self.path = path
+        self.dir = os.path.dirname(path)
+        self.modified = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if (not isinstance(data, dict) or
+                    data.get("version") != self.VERSION or
+                    not isinstance(data.get("docs"), dict)):
+                raise ValueError("unknown format")
+            self.docs = data["docs"]
+        except (IOError, OSError, ValueError):
+            # Missing, or written by another version: start over
+            self.docs = {}
+
+    def get(self, basename, latex, backend="auto"):
+        """Return the recorded dependencies of `basename`.tex as built by
+        `latex` and asked of `backend`, or `None` if none are recorded, they
+        weren't found by `backend` or one that it uses, or any has changed
+        since."""
+        doc = self.docs.get(basename)
+        if (not doc or doc.get("latex") != latex or
+                doc.get("backend") != backend or
+                doc.get("found_by") not in
+                (BACKENDS[1:] if backend == "auto" else (backend,))):
+            return None
+        for fn, state in doc["deps"].items():
+            path = os.path.join(self.dir, fn)
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            mtime, size, digest = state
+            if st.st_size != size:
+                return None
+            if st.st_mtime != mtime:
+                if file_hash(path) != digest:
+                    return None
+                state[0] = st.st_mtime
+                self.modified = True
+        return set(doc["deps"])
+
+    def put(self, basename, latex, deps, backend="auto", used=None):
+        """Record `deps` as the dependencies of `basename`.tex as built by
+        `latex`, asked of `backend` and found by `used`, by default
+        `backend`, in their current state. Dependencies that don't exist are
+        left out."""
+        states = {}
+        for fn in deps:
+            path = os.path.join(self.dir, fn)
+            try:
+                st = os.stat(path)
+                if os.path.isfile(path):
+                    states[fn] = [st.st_mtime, st.st_size, file_hash(path)]
+            except (IOError, OSError):
+                pass
+        self.docs[basename] = {"latex": latex, "backend": backend,
+                               "found_by": used or backend, "deps": states}
+        self.modified = True
+
+    def save(self):
+        """Write the cache file, if anything changed since it was read."""
+        if self.modified:
+            write_atomic(self.path, str(json.dumps(
+                    {"version": self.VERSION, "docs": self.docs},
+                    indent=1, sort_keys=True)) + "\n")
+            self.modified = False
+
+
+def cached_tex_deps_of(basename, latex, backend="auto", cache=None):
+    """As `tex_deps_of`, but if the `DepCache` `cache` has the dependencies
+    of `basename`.tex, and none of them has changed, return them without
+    running LaTeX. Otherwise record the dependencies found in `cache`."""
+    deps = cache.get(basename, latex, backend) if cache is not None else None
+    if deps is None:
+        deps, used = find_tex_deps(basename, latex, backend)
+        if deps is not None and cache is not None:
+            cache.put(basename, latex, deps, backend, used)
+    if cache is not None:
+        cache.save()
+    return deps
+
+
+DOCUMENTCLASS_RE = re.compile(r"^\s*\\documentclass\b")
+def is_root_document(fn):
+    """Return whether the TeX file `fn` is a document of its own, rather than
+    part of one: whether a line of it starts with \\documentclass."""
+    try:
+        with open(fn, encoding="utf-8", errors="replace") as f:
+            return any(DOCUMENTCLASS_RE.match(line) for line in f)
+    except (IOError, OSError):
+        return False
+
+
+def find_root_documents(top):
+    """Return the filenames of the root documents in the directory tree
+    `top`, not counting hidden directories, in sorted order."""
+    docs = []
+    for root, dirs, files in os.walk(top):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for fn in sorted(files):
+            path = os.path.join(root, fn)
+            if fn.endswith(".tex") and is_root_document(path):
+                docs.append(os.path.normpath(path))
+    return docs
+
+
+def _tree_worker(job):
+    # Runs in a worker process, which has its own current directory.
+    doc, path, latex, backend = job
+    os.chdir(os.path.dirname(path))
+    return (doc,) + find_tex_deps(os.path.basename(path)[:-4], latex,
+                                  backend)
+
+
+def tree_deps_of(docs, latex, backend="auto", jobs=None, use_cache=True):
+    """Return a dictionary from each of the root documents `docs`, .tex
+    filenames, to its dependencies, relative to its directory, or `None` if
+    they cannot be identified. Dependencies that a `DepCache` in a
+    document's directory records are reused; the others are found
+    concurrently in a pool of `jobs` worker processes, by default one per
+    CPU, each with its own output directory."""
+    caches = {}
+    result = {}
+    pending = []
+    for doc in docs:
+        d = os.path.dirname(doc)
+        if use_cache and d not in caches:
+            caches[d] = DepCache(os.path.join(d, DEP_CACHE))
+        deps = (caches[d].get(os.path.basename(doc)[:-4], latex, backend)
+                if use_cache else None)
+        if deps is None:
+            pending.append((doc, os.path.abspath(doc), latex, backend))
+        else:
+            result[doc] = deps
+    if pending:
+        pool = multiprocessing.Pool(min(jobs or multiprocessing.cpu_count(),
+                                        len(pending)))
+        try:
+            for doc, deps, used in pool.imap_unordered(_tree_worker,
+                                                       pending):
+                result[doc] = deps
+                if use_cache and deps is not None:
+                    caches[os.path.dirname(doc)].put(
+                            os.path.basename(doc)[:-4], latex, deps, backend,
+                            used)
+        finally:
+            pool.terminate()
+            pool.join()
+    for cache in caches.values():
+        cache.save()
+    return result
+
+
+def make_escape(fn):
+    """Return the filename `fn` as written in a Make rule."""
+    return fn.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+
+def make_deps(targets, deps):
+    """Return Make rules stating that the files `targets` depend on the files
+    `deps`. Each dependency also gets an empty rule, so that Make doesn't
+    stop if it's deleted, but rebuilds the targets."""
+    deps = sorted(deps)
+    lines = ["{}: {}".format(" ".join(make_escape(t) for t in targets),
+                             " \\\n ".join(make_escape(d) for d in deps))]
+    lines.extend("{}:".format(make_escape(d)) for d in deps)
+    return "\n".join(lines) + "\n"
 
 
 if __name__ == "__main__":
@@ -79,16 +818,71 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser(description="TeX build script.")
     ap.add_argument("basename", type=str, nargs='?', default=None,
                     help="TeX file basename (can be autodetected)")
+    ap.add_argument("-r", "--tree", type=str, metavar="DIR",
+                    help="find the dependencies of every document in this "
+                         "directory tree, and print them as JSON")
+    ap.add_argument("-j", "--jobs", type=int, default=None,
+                    help="with --tree, number of documents to process at "
+                         "once; defaults to the number of CPUs")
+    ap.add_argument("--dep-files", action="store_true",
+                    help="with --tree, write Make rules to BASENAME.d next "
+                         "to each document, instead of printing JSON")
     ap.add_argument("--latex", type=str, default="pdflatex",
                     help="TeX command to run; defaults to pdflatex")
+    ap.add_argument("--backend", type=str, choices=BACKENDS, default="auto",
+                    help="how to find dependencies: by reading the source, "
+                         "from the file list of -recorder, using strace, or "
+                         "automatically (the default)")
+    ap.add_argument("--cache", type=str, default=DEP_CACHE,
+                    help="file recording dependencies, which are reused "
+                         "while they are unchanged; defaults to " + DEP_CACHE)
+    ap.add_argument("--no-cache", action="store_true",
+                    help="always run LaTeX, and don't record dependencies")
+    ap.add_argument("-M", "--make-deps", type=str, metavar="FILE",
+                    help="write the dependencies as Make rules to this file, "
+                         "instead of printing them")
+    ap.add_argument("--target", type=str, action="append",
+                    help="target of the Make rules, which may be given more "
+                         "than once; defaults to BASENAME.pdf and the Make "
+                         "rules' file")
     args = ap.parse_args()
 
+    # Get the dependencies of every document in a tree
+    if args.tree:
+        if args.basename:
+            print("Error: Both a TeX file and a tree specified.")
+            sys.exit(1)
+        docs = find_root_documents(args.tree)
+        tree_deps = tree_deps_of(docs, args.latex, args.backend, args.jobs,
+                                 not args.no_cache)
+        failed = sorted(doc for doc, deps in tree_deps.items()
+                        if deps is None)
+        if args.dep_files:
+            for doc, deps in sorted(tree_deps.items()):
+                if deps is not None:
+                    d = doc[:-4] + ".d"
+                    write_atomic(d, make_deps(
+                            [os.path.basename(doc[:-4]) + ".pdf",
+                             os.path.basename(d)], deps))
+        else:
+            print(json.dumps(
+                    dict((doc, sorted(deps) if deps is not None else None)
+                         for doc, deps in tree_deps.items()),
+                    indent=1, sort_keys=True))
+        for doc in failed:
+            print("Warning: Couldn't automatically identify dependencies "
+                  "of {}.".format(doc), file=sys.stderr)
+        sys.exit(1 if failed else 0)
+
     # Ensure we have a .tex file
     if args.basename:
         basename = args.basename
     else:
-        # Try to find exactly one .tex file in the cwd
+        # Try to find exactly one .tex file in the cwd, or failing that,
+        # exactly one document
         cwd_tex = glob.glob("*.tex")
+        if len(cwd_tex) > 1:
+            cwd_tex = [fn for fn in cwd_tex if is_root_document(fn)] or cwd_tex
         if len(cwd_tex) == 0:
             print("Error: No TeX file specified and no TeX files found.")
             sys.exit(1)
@@ -99,10 +893,17 @@ if __name__ == "__main__":
             basename = cwd_tex[0][:-4]
 
     # Get the .tex file's dependencies
-    deps = tex_deps_of(basename, args.latex)
+    cache = None if args.no_cache else DepCache(args.cache)
+    deps = cached_tex_deps_of(basename, args.latex, args.backend, cache)
 
     # Print the .tex file's dependencies
-    if deps:
+    if args.make_deps:
+        if deps is None:
+            print("Error: Couldn't automatically identify dependencies.")
+            sys.exit(1)
+        targets = args.target or [basename + ".pdf", args.make_deps]
+        write_atomic(args.make_deps, make_deps(targets, deps))
+    elif deps:
         for dep in sorted(deps):
             print(dep)
     else: